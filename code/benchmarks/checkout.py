@@ -0,0 +1,198 @@
+"""
+End-to-end checkout benchmark against the SagePay stand-in (:mod:`sagepay.testserver`) and a test database.
+
+Each checkout goes through the stages of the SagePay flow, timed and query counted one by one:
+
+* register: :meth:`sagepay.facade.Facade.authorize`, transaction saved and registered with the stand-in
+* notify: :meth:`sagepay.facade.Facade.check_transaction_notification` with a signed notification
+* place_order: :class:`sagepay.views.SageThankYouView`, :meth:`order_basket_amount_from_tx_id` then Oscar's order
+  placement in :meth:`finalise`
+* billing_address: :meth:`sagepay.facade.Facade.save_billing_address_from_order` on the placed order
+
+--concurrency threads run the checkouts, the report gives the latency percentiles and mean queries of each stage and
+the orders placed per second. --save-card saves the card tokens, --queue leaves them and the rest of the work
+following the notification to the process_notifications queue, compare the notify stage with and without it.
+--json writes the results with the environment they were measured in, keep the files to compare releases.
+
+    DJANGO_SETTINGS_MODULE=myproject.settings python benchmarks/checkout.py --checkouts 500 --concurrency 10 \\
+        --latency 0.1 --json checkout-0.1.json
+"""
+import os
+import sys
+import time
+import threading
+import traceback
+from decimal import Decimal
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import setup_django, checkout_fixtures, new_basket, percentiles, environment, write_json, report
+
+STAGES = ('register', 'notify', 'place_order', 'billing_address')
+FIRST_ORDER_NUMBER = 100000
+
+
+def thank_you(user, tx_id):
+    from django.conf import settings
+    from django.contrib.messages.storage import default_storage
+    from django.test.client import RequestFactory
+    from django.utils.importlib import import_module
+    from sagepay.views import SageThankYouView
+
+    request = RequestFactory().get('/sagepay/thankyou/%s/' % tx_id)
+    request.user = user
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+    request._messages = default_storage(request)
+    return SageThankYouView.as_view()(request, tx_id=tx_id)
+
+
+class Checkout(object):
+    """
+    Run the checkouts and collect the duration and query count of their stages
+
+    :param stages: stages run, in the :data:`STAGES` order
+    """
+    def __init__(self, facade, server, user, address, stages=STAGES, save_card=False):
+        self.facade = facade
+        self.server = server
+        self.user = user
+        self.address = address
+        self.stages = stages
+        self.save_card = save_card
+        self.durations = dict((stage, []) for stage in stages)
+        self.queries = dict((stage, []) for stage in stages)
+        self.failures = []
+        self.orders = 0
+        self._lock = threading.Lock()
+
+    def timed(self, stage, function, *args):
+        from django.db import connection
+
+        queries = len(connection.queries)
+        start = time.time()
+        result = function(*args)
+        duration = time.time() - start
+        with self._lock:
+            self.durations[stage].append(duration)
+            self.queries[stage].append(len(connection.queries) - queries)
+        return result
+
+    def run(self, number):
+        from django.db import connection, reset_queries
+        from django.db.models import get_model
+
+        Order = get_model('order', 'Order')
+        reset_queries()
+        connection.use_debug_cursor = True
+        order_number = FIRST_ORDER_NUMBER + number
+        # the basket is filled by the customer before the checkout, it isn't timed
+        basket = new_basket(self.user)
+        tx_id = self.timed('register', self.facade.authorize, order_number, basket, Decimal('36.00'), self.address,
+                           None, self.save_card)
+        if 'notify' in self.stages:
+            self.timed('notify', self.facade.check_transaction_notification, self.server.notification(tx_id, 'OK'))
+        if 'place_order' in self.stages:
+            self.timed('place_order', thank_you, self.user, tx_id)
+        if 'billing_address' in self.stages:
+            self.timed('billing_address', lambda: self.facade.save_billing_address_from_order(
+                Order.objects.get(number=order_number)))
+        with self._lock:
+            self.orders += 1
+
+    def worker(self, numbers):
+        from django.db import connection
+
+        try:
+            for number in numbers:
+                try:
+                    self.run(number)
+                except Exception:
+                    with self._lock:
+                        self.failures.append(traceback.format_exc())
+        finally:
+            connection.close()
+
+    def results(self):
+        return dict((stage, dict(percentiles(self.durations[stage]),
+                                 queries=float(sum(self.queries[stage])) / len(self.queries[stage])
+                                 if self.queries[stage] else 0))
+                    for stage in self.stages)
+
+
+def run(checkout, start, count, concurrency):
+    """
+    Run `count` checkouts numbered from `start` on `concurrency` threads
+
+    :returns: float -- elapsed seconds
+    """
+    numbers = range(start, start + count)
+    threads = [threading.Thread(target=checkout.worker, args=(numbers[i::concurrency],)) for i in range(concurrency)]
+    begin = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - begin
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--checkouts', type='int', default=200)
+    parser.add_option('--concurrency', type='int', default=10)
+    parser.add_option('--warmup', type='int', default=10, help='checkouts run first and left out of the results')
+    parser.add_option('--latency', type='float', default=0.05, help='seconds the stand-in waits before answering')
+    parser.add_option('--stages', default=','.join(STAGES), help='stages run, register is always run')
+    parser.add_option('--save-card', action='store_true', default=False, help='save the card tokens')
+    parser.add_option('--queue', action='store_true', default=False,
+                      help='queue the work following the notifications (SAGEPAY_NOTIFICATION_QUEUE), left undone')
+    parser.add_option('--json', default=None, help='file the results are written to, - for stdout')
+    options, args = parser.parse_args()
+    stages = [stage for stage in STAGES if stage == 'register' or stage in options.stages.split(',')]
+
+    setup_django(threads=True, SAGEPAY_POOL_MAXSIZE=options.concurrency)
+    from sagepay import facade as facade_module
+    from sagepay.testserver import SagePayServer, Profile
+
+    server = SagePayServer(Profile(latency=options.latency)).start()
+    # settings are read at import, point the facade at the stand-in
+    facade_module.SAGE_SERVER_URL = server.register_url
+    facade_module.NOTIFICATION_QUEUE = options.queue
+    facade = facade_module.Facade()
+    user, address = checkout_fixtures()
+
+    with facade_module.override_facade(facade):
+        run(Checkout(facade, server, user, address, stages, options.save_card), 0, options.warmup, 1)
+        checkout = Checkout(facade, server, user, address, stages, options.save_card)
+        elapsed = run(checkout, options.warmup, options.checkouts, options.concurrency)
+    server.stop()
+
+    results = {
+        'benchmark': 'checkout',
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'environment': environment(),
+        'options': {'checkouts': options.checkouts, 'concurrency': options.concurrency, 'latency': options.latency,
+                    'stages': stages, 'save_card': options.save_card, 'queue': options.queue},
+        'orders_per_second': checkout.orders / elapsed,
+        'orders': checkout.orders,
+        'failures': len(checkout.failures),
+        'elapsed': elapsed,
+        'stages': checkout.results(),
+    }
+    if checkout.failures:
+        sys.stderr.write('%d checkouts failed, first error:\n%s' % (len(checkout.failures), checkout.failures[0]))
+    if options.json:
+        write_json(options.json, results)
+    if options.json != '-':
+        rows = [('orders/s', '%.1f' % results['orders_per_second']), ('failures', results['failures'])]
+        for stage in stages:
+            summary = results['stages'][stage]
+            if summary.get('mean_ms') is not None:
+                rows.append((stage, 'p50 %(p50_ms).1fms  p90 %(p90_ms).1fms  p99 %(p99_ms).1fms  '
+                                    'max %(max_ms).1fms  %(queries).1f queries' % summary))
+        report('Checkout, %d orders, %d concurrent, %.0fms SagePay latency' % (
+            options.checkouts, options.concurrency, options.latency * 1000), rows)
+
+
+if __name__ == '__main__':
+    main()
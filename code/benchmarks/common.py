@@ -0,0 +1,299 @@
+"""
+Helpers shared by the benchmark scripts
+
+Benchmarks touching the database need the Django settings of an Oscar project:
+
+    DJANGO_SETTINGS_MODULE=myproject.settings python benchmarks/<benchmark>.py
+
+a test database is created for the run, the project database is never used. Without DJANGO_SETTINGS_MODULE a minimal
+configuration is used, enough for the benchmarks which don't load the sagepay models.
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import tempfile
+import threading
+import BaseHTTPServer
+import SocketServer
+from decimal import Decimal
+
+from django.conf import settings
+
+REGISTRATION_OK_BODY = ('VPSProtocol=3.00\r\n'
+                        'Status=OK\r\n'
+                        'StatusDetail=2014 : The Transaction was Registered Successfully.\r\n'
+                        'VPSTxId={1A960910-5F36-3421-24DE-65EF52C13380}\r\n'
+                        'SecurityKey=U5NX3V0WG9\r\n'
+                        'NextURL=https://test.sagepay.com/gateway/service/cardselection?'
+                        'vpstxid={1A960910-5F36-3421-24DE-65EF52C13380}')
+
+
+def setup_django(create_database=True, threads=False, **extra):
+    """
+    Configure Django and create a test database, `extra` settings override the configured ones. Set `threads` when
+    several threads use the database.
+    """
+    if os.environ.get('DJANGO_SETTINGS_MODULE'):
+        for name, value in extra.items():
+            setattr(settings, name, value)
+    elif not settings.configured:
+        options = dict(
+            DEBUG=True,
+            SITE_ID=1,
+            SECRET_KEY='benchmark',
+            DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+            INSTALLED_APPS=['django.contrib.contenttypes', 'django.contrib.auth', 'django.contrib.sites'],
+        )
+        options.update(extra)
+        settings.configure(**options)
+    if create_database:
+        create_test_database(threads)
+
+
+def create_test_database(threads=False):
+    from django.db import connection
+    from django.core.management import call_command
+
+    if threads and connection.vendor == 'sqlite' and not connection.settings_dict.get('TEST_NAME'):
+        # each thread has its own connection, an in-memory database would be private to the main thread
+        handle, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        atexit.register(os.remove, path)
+        connection.settings_dict['TEST_NAME'] = path
+    test_name = connection.creation._create_test_db(0, True)
+    connection.close()
+    settings.DATABASES[connection.alias]['NAME'] = test_name
+    connection.settings_dict['NAME'] = test_name
+    call_command('syncdb', interactive=False, verbosity=0)
+
+
+BATCH_SIZE = 10000
+
+
+def seed_transactions(start, stop):
+    """
+    Insert the transactions numbered from `start` to `stop`, each with its registration and notification
+    """
+    from django.contrib.auth.models import User
+    from django.db import transaction
+    from django.db.models import get_model
+    from sagepay.models import (CountryCode, TransactionRegistrationServerResponse, NotificationPostResponse,
+                                SagePayTransaction)
+
+    Basket = get_model('basket', 'Basket')
+    user, created = User.objects.get_or_create(username='benchmark')
+    basket, created = Basket.objects.get_or_create(owner=user)
+    country, created = CountryCode.objects.get_or_create(code='GB', defaults={'name': 'United Kingdom'})
+    for batch in xrange(start, stop, BATCH_SIZE):
+        numbers = xrange(batch, min(batch + BATCH_SIZE, stop))
+        with transaction.commit_on_success():
+            TransactionRegistrationServerResponse.objects.bulk_create([
+                TransactionRegistrationServerResponse(vps_protocol='3.00', vps_tx_id=tx_id(n), security_key='U5NX3V0WG9',
+                                                      status='OK', status_detail='', next_url='')
+                for n in numbers])
+            # the padded ids sort in seeding order
+            registrations = dict(TransactionRegistrationServerResponse.objects.filter(
+                vps_tx_id__range=(tx_id(numbers[0]), tx_id(numbers[-1]))).values_list('vps_tx_id', 'id'))
+            NotificationPostResponse.objects.bulk_create([
+                NotificationPostResponse(vps_protocol='3.00', tx_type='PAYMENT', vendor_tx_code=vendor_tx_code(n),
+                                         vps_tx_id=tx_id(n), status='OK', status_detail='', address_result='',
+                                         postcode_result='', cv2_result='', threed_secure_status='', cavv='',
+                                         card_type='VISA', last_4_digits='0006', decline_code='00',
+                                         expiry_date='1220', bank_auth_ode='')
+                for n in numbers])
+            notifications = dict(NotificationPostResponse.objects.filter(
+                vps_tx_id__range=(tx_id(numbers[0]), tx_id(numbers[-1]))).values_list('vps_tx_id', 'id'))
+            SagePayTransaction.objects.bulk_create([
+                SagePayTransaction(oscar_basket=basket, oscar_order=100000 + n, vendor_tx_code=vendor_tx_code(n),
+                                   amount='10.00', description='Benchmark', delivery_firstnames='John',
+                                   delivery_surname='Smith', delivery_address1='88 The Road', delivery_city='London',
+                                   delivery_postcode='W1A 1AA', delivery_country=country,
+                                   transaction_registration_server_response_id=registrations[tx_id(n)],
+                                   notification_post_response_id=notifications[tx_id(n)])
+                for n in numbers])
+        sys.stderr.write('\rseeded %d/%d' % (numbers[-1] + 1, stop))
+    sys.stderr.write('\n')
+
+
+def tx_id(n):
+    return '{%08X-0000-0000-0000-%012X}' % (n, n)
+
+
+def vendor_tx_code(n):
+    return '%032x' % n
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # buffer the response so headers and body leave in one segment
+    wbufsize = -1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.getheader('Content-Length', 0)))
+        time.sleep(self.server.latency)
+        body = self.server.body
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Minimal threaded HTTP server answering every POST with the same body after `latency` seconds
+    """
+    daemon_threads = True
+
+    def __init__(self, latency=0.05, body=REGISTRATION_OK_BODY):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.latency = latency
+        self.body = body
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/' % self.server_port
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+
+class FakeCountry(object):
+    sagecode = 'GB'
+
+
+class FakeTransaction(object):
+    """
+    Object with the attributes read by :meth:`sagepay.gateway.Gateway.registration_data`
+    """
+    vps_protocol = '3.00'
+    tx_type = 'PAYMENT'
+    vendor = 'benchmark'
+    vendor_tx_code = 'c4ca4238a0b923820dcc509a6f75849b'
+    amount = Decimal('10.00')
+    currency = 'GBP'
+    description = 'Benchmark product'
+    billing_surname = delivery_surname = 'Smith'
+    billing_firstnames = delivery_firstnames = 'John'
+    billing_address1 = delivery_address1 = '88 The Road'
+    billing_city = delivery_city = 'London'
+    billing_postcode = delivery_postcode = 'W1A 1AA'
+    billing_country = delivery_country = FakeCountry()
+    billing_state = delivery_state = ''
+    billing_phone = delivery_phone = ''
+    customer_email = ''
+    basket = None
+    allow_gift_aid = False
+    token = None
+
+
+def report(title, rows):
+    """
+    Print a table of (label, value) rows
+    """
+    sys.stdout.write('%s\n%s\n' % (title, '-' * len(title)))
+    for label, value in rows:
+        sys.stdout.write('%-40s %s\n' % (label, value))
+    sys.stdout.write('\n')
+
+
+def percentiles(values, points=(50, 90, 99)):
+    """
+    Summarise durations in seconds as milliseconds
+
+    :returns: dict -- mean_ms, max_ms and one pNN_ms entry per point
+    """
+    values = sorted(values)
+    if not values:
+        return {}
+    summary = dict(('p%d_ms' % point, values[min(len(values) - 1, len(values) * point // 100)] * 1000)
+                   for point in points)
+    summary['mean_ms'] = sum(values) / len(values) * 1000
+    summary['max_ms'] = values[-1] * 1000
+    return summary
+
+
+def environment():
+    """
+    Versions and database the results were measured with, stored with the JSON results
+    """
+    import platform
+    import django
+    import sagepay
+    from django.db import connection
+
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'sagepay': sagepay.VERSION,
+        'database': connection.vendor,
+        'platform': platform.platform(),
+    }
+
+
+def write_json(path, results):
+    """
+    Write the results as JSON to `path`, - for stdout
+    """
+    content = json.dumps(results, indent=2, sort_keys=True) + '\n'
+    if path == '-':
+        sys.stdout.write(content)
+    else:
+        with open(path, 'w') as f:
+            f.write(content)
+
+
+class Address(object):
+    """
+    Shipping address with the attributes read by :meth:`sagepay.facade.Facade.authorize`
+    """
+    first_name = 'John'
+    last_name = 'Smith'
+    line1 = '88 The Road'
+    line2 = ''
+    line4 = 'London'
+    postcode = 'W1A 1AA'
+
+    def __init__(self, country):
+        self.country = country
+
+
+def checkout_fixtures():
+    """
+    Create what a checkout needs besides the basket
+
+    :returns: tuple -- (user, shipping address)
+    """
+    from django.contrib.auth.models import User
+    from sagepay.models import CountryCode
+
+    user, created = User.objects.get_or_create(username='benchmark')
+    country, created = CountryCode.objects.get_or_create(code='GB', defaults={'name': 'United Kingdom'})
+    return user, Address(country)
+
+
+def new_basket(user, lines=3):
+    """
+    Create a basket of `lines` products at 10.00 each (12.00 with tax)
+    """
+    from django.db.models import get_model
+
+    Basket = get_model('basket', 'Basket')
+    Line = get_model('basket', 'Line')
+    Product = get_model('catalogue', 'Product')
+    ProductClass = get_model('catalogue', 'ProductClass')
+    product_class, created = ProductClass.objects.get_or_create(slug='benchmark', defaults={'name': 'Benchmark'})
+    basket = Basket.objects.create(owner=user)
+    for n in xrange(lines):
+        product = Product.objects.create(title='Benchmark product %d' % n, product_class=product_class)
+        Line.objects.create(basket=basket, line_reference='benchmark-product-%d' % n, product=product, quantity=1,
+                            price_excl_tax=Decimal('10.00'), price_incl_tax=Decimal('12.00'))
+    return basket
@@ -0,0 +1,39 @@
+"""
+Cost of loading the countries with the countrysync command: the first run on empty tables and a second run on the
+loaded ones, which must not change anything.
+
+    DJANGO_SETTINGS_MODULE=myproject.settings python benchmarks/countries.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import setup_django, report
+
+
+def countrysync():
+    from django.core.management import call_command
+    from django.db import connection
+
+    queries = len(connection.queries)
+    start = time.time()
+    call_command('countrysync', **{'import': True})
+    return (time.time() - start) * 1000, len(connection.queries) - queries
+
+
+def main():
+    setup_django(DEBUG=True)
+    from django.db.models import get_model
+
+    first = countrysync()
+    second = countrysync()
+    report('countrysync --sageimport, %d countries' % get_model('address', 'Country').objects.count(), [
+        ('first run', '%.1fms, %d queries' % first),
+        ('second run', '%.1fms, %d queries' % second),
+    ])
+
+
+if __name__ == '__main__':
+    main()
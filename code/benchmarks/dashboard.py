@@ -0,0 +1,70 @@
+"""
+Render time of the dashboard transaction list as the table grows: first page, a page deep in the history reached
+with the keyset cursor, and the same page reached with OFFSET as a Paginator would.
+
+    DJANGO_SETTINGS_MODULE=myproject.settings python benchmarks/dashboard.py --sizes 10000,100000,1000000
+"""
+import os
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import setup_django, seed_transactions, report
+
+
+def render(view, query, number):
+    from django.test.client import RequestFactory
+
+    start = time.time()
+    for _ in xrange(number):
+        ctx = view(RequestFactory().get('/dashboard/sagepay/transactions/?' + query)).context_data
+        for transaction in ctx['transactions']:
+            transaction.notification_post_response.status
+            transaction.transaction_registration_server_response
+            transaction.token
+    return (time.time() - start) / number * 1000, ctx
+
+
+def offset_page(offset, page_size, number):
+    from sagepay.models import SagePayTransaction
+
+    start = time.time()
+    for _ in xrange(number):
+        list(SagePayTransaction.objects.select_related(
+            'transaction_registration_server_response', 'notification_post_response', 'token'
+        ).order_by('-created', '-id')[offset:offset + page_size])
+    return (time.time() - start) / number * 1000
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--sizes', default='10000,100000,1000000', help='table sizes, comma separated')
+    parser.add_option('--depth', type='float', default=0.9, help='position of the deep page in the table (0-1)')
+    parser.add_option('--number', type='int', default=20, help='renders timed per page')
+    options, args = parser.parse_args()
+
+    setup_django()
+    from sagepay.models import SagePayTransaction
+    from sagepay.dashboard.views import TransactionListView
+
+    view = TransactionListView.as_view()
+    page_size = TransactionListView.page_size
+    rows = []
+    seeded = 0
+    for size in [int(size) for size in options.sizes.split(',')]:
+        seed_transactions(seeded, size)
+        seeded = size
+        offset = int(size * options.depth)
+        # the newest first order puts the transaction before the deep page at this position
+        after = SagePayTransaction.objects.order_by('-created', '-id').values_list('pk', flat=True)[offset - 1]
+        first, ctx = render(view, '', options.number)
+        deep, ctx = render(view, 'after=%d' % after, options.number)
+        rows.append(('%d rows' % size, 'first page %.1fms, keyset page %.1fms, offset page %.1fms' % (
+            first, deep, offset_page(offset, page_size, options.number))))
+    report('Dashboard transaction list, %d transactions per page' % page_size, rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Payment registrations completed by a single worker with :class:`sagepay.gateway.Gateway` and
+:class:`sagepay.gateway.AsyncGateway` against a local stub of the SagePay server. The async gateway pays off when
+the SagePay round trip dominates, keep --latency close to what production sees.
+
+    python benchmarks/gateway_concurrency.py --requests 200 --latency 0.05 --workers 10
+"""
+import os
+import sys
+import time
+from optparse import OptionParser
+from multiprocessing.pool import ThreadPool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import setup_django, StubServer, FakeTransaction, report
+
+
+def run_sync(gateway, transaction, count):
+    start = time.time()
+    for _ in xrange(count):
+        gateway.register_payment(transaction, False)
+    return time.time() - start
+
+
+def run_async(gateway, transaction, count):
+    start = time.time()
+    results = [gateway.register_payment(transaction, False) for _ in xrange(count)]
+    for result in results:
+        result.get()
+    return time.time() - start
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--requests', type='int', default=200)
+    parser.add_option('--latency', type='float', default=0.05, help='stub server latency in seconds')
+    parser.add_option('--workers', type='int', default=10, help='AsyncGateway threads')
+    options, args = parser.parse_args()
+
+    setup_django(SAGEPAY_POOL_MAXSIZE=options.workers)
+    from sagepay.gateway import Gateway, AsyncGateway
+
+    server = StubServer(latency=options.latency).start()
+    transaction = FakeTransaction()
+
+    gateway = Gateway('LOW', 'http://localhost/notification/', server.url)
+    sync_time = run_sync(gateway, transaction, options.requests)
+
+    async_gateway = AsyncGateway('LOW', 'http://localhost/notification/', server.url,
+                                 workers=ThreadPool(options.workers))
+    async_time = run_async(async_gateway, transaction, options.requests)
+
+    report('Registrations per worker (%d requests, %.0fms latency)' % (options.requests, options.latency * 1000), [
+        ('Gateway registrations/s', '%.1f' % (options.requests / sync_time)),
+        ('AsyncGateway registrations/s', '%.1f' % (options.requests / async_time)),
+        ('speedup', '%.1fx' % (sync_time / async_time)),
+        ('connection pool', gateway.pool_stats()),
+    ])
+    gateway.session.close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
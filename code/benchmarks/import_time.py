@@ -0,0 +1,54 @@
+"""
+Cold start cost of the sagepay modules. They are imported before any database exists, the settings don't read the
+current site until a URL is needed, then the site lookup the import used to pay (connection and query) is timed
+separately.
+
+    DJANGO_SETTINGS_MODULE=myproject.settings python benchmarks/import_time.py --module sagepay.facade
+"""
+import os
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import setup_django, create_test_database, report
+
+
+def site_lookup(number):
+    from django.db import connection
+    from django.contrib.sites.models import Site
+
+    start = time.time()
+    for _ in xrange(number):
+        connection.close()
+        Site.objects.clear_cache()
+        Site.objects.get_current()
+    return (time.time() - start) / number
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--module', default='sagepay.facade', help='module imported, sagepay.settings works without '
+                                                                 'an Oscar project')
+    parser.add_option('--number', type='int', default=100, help='site lookups timed')
+    options, args = parser.parse_args()
+
+    setup_django(create_database=False)
+    from django.db import connection
+
+    start = time.time()
+    __import__(options.module)
+    import_time = time.time() - start
+    connected = connection.connection is not None
+
+    create_test_database()
+    report('Cold start of %s' % options.module, [
+        ('import time', '%.1fms' % (import_time * 1000)),
+        ('database connection opened by the import', connected and 'yes' or 'no'),
+        ('site lookup deferred to the first URL', '%.2fms' % (site_lookup(options.number) * 1000)),
+    ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Load test of the checkout against the SagePay stand-in (:mod:`sagepay.testserver`): --concurrency threads register
+payments through the facade, then the stand-in notifies each one back signed, with the latency, injected errors and
+status mix given on the command line.
+
+The notifications are handed to the facade in the same process, --views posts them through the Django test client
+instead so the project URLs, middleware and notification view are part of the run.
+
+    DJANGO_SETTINGS_MODULE=myproject.settings python benchmarks/load_test.py --checkouts 1000 --concurrency 20 \\
+        --latency 0.05,0.3 --error-rate 0.01 --statuses OK=90,NOTAUTHED=8,ABORT=2
+"""
+import os
+import sys
+import time
+from collections import defaultdict
+from decimal import Decimal
+from optparse import OptionParser
+from multiprocessing.pool import ThreadPool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import setup_django, checkout_fixtures, new_basket, report
+
+
+def parse_latency(value):
+    if ',' in value:
+        low, high = value.split(',')
+        return float(low), float(high)
+    return float(value)
+
+
+def parse_statuses(value):
+    return dict((status, float(weight)) for status, weight in (item.split('=') for item in value.split(',')))
+
+
+def checkout(facade, server, user, address, number):
+    from django.db import connection
+    from oscar.apps.payment.exceptions import PaymentError
+
+    start = time.time()
+    try:
+        basket = new_basket(user)
+        try:
+            tx_id = facade.authorize(number, basket, Decimal('36.00'), address)
+        except PaymentError, e:
+            return 'registration failed (%s)' % e.__class__.__name__, time.time() - start
+        status = server.profile.status()
+        reply = server.notify(tx_id, status)
+        return '%s notified, replied %s' % (status, reply.get('Status')), time.time() - start
+    finally:
+        connection.close()
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--checkouts', type='int', default=200)
+    parser.add_option('--concurrency', type='int', default=10)
+    parser.add_option('--latency', default='0.05', help='seconds, or a min,max range')
+    parser.add_option('--error-rate', type='float', default=0, help='share of the SagePay requests failing')
+    parser.add_option('--errors', default='500', help='injected errors: HTTP codes, SagePay statuses or drop')
+    parser.add_option('--statuses', default='OK=1', help='notified status mix, e.g. OK=90,NOTAUTHED=10')
+    parser.add_option('--seed', type='int', default=None)
+    parser.add_option('--views', action='store_true', default=False,
+                      help='post the notifications to the notification view with the Django test client')
+    options, args = parser.parse_args()
+
+    setup_django(threads=True, SAGEPAY_POOL_MAXSIZE=options.concurrency)
+    from django.test.client import Client
+    from sagepay import facade as facade_module
+    from sagepay.testserver import SagePayServer, Profile, client_post
+
+    errors = tuple(int(error) if error.isdigit() else error for error in options.errors.split(','))
+    profile = Profile(latency=parse_latency(options.latency), error_rate=options.error_rate, errors=errors,
+                      statuses=parse_statuses(options.statuses), seed=options.seed)
+    server = SagePayServer(profile).start()
+    # settings are read at import, point the facade at the stand-in
+    facade_module.SAGE_SERVER_URL = server.register_url
+    facade = facade_module.Facade()
+    if options.views:
+        server.poster = client_post(Client())
+    else:
+        server.poster = lambda url, data: facade.check_transaction_notification(data)
+    user, address = checkout_fixtures()
+
+    pool = ThreadPool(options.concurrency)
+    start = time.time()
+    results = pool.map(lambda number: checkout(facade, server, user, address, number), xrange(options.checkouts))
+    elapsed = time.time() - start
+    pool.close()
+    server.stop()
+
+    outcomes = defaultdict(int)
+    for outcome, duration in results:
+        outcomes[outcome] += 1
+    durations = sorted(duration for outcome, duration in results)
+    report('%d checkouts, %d concurrent' % (options.checkouts, options.concurrency), [
+        ('checkouts/s', '%.1f' % (options.checkouts / elapsed)),
+        ('median checkout', '%.1fms' % (durations[len(durations) // 2] * 1000)),
+        ('p95 checkout', '%.1fms' % (durations[int(len(durations) * 0.95)] * 1000)),
+        ('stand-in', server.counts),
+    ] + sorted(outcomes.items()))
+
+
+if __name__ == '__main__':
+    main()
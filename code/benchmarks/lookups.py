@@ -0,0 +1,59 @@
+"""
+Latency of the transaction lookups done for every notification and thank you page, with and without the indexes.
+The tables are seeded with --rows transactions, each with its registration and notification, and the lookups are
+timed on them and on unindexed copies made with CREATE TABLE ... AS SELECT.
+
+    DJANGO_SETTINGS_MODULE=myproject.settings python benchmarks/lookups.py --rows 1000000 --lookups 1000
+"""
+import os
+import sys
+import time
+import random
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import setup_django, seed_transactions, tx_id, vendor_tx_code, report
+
+
+def lookup_latency(cursor, table, column, values):
+    sql = 'SELECT id FROM %s WHERE %s = %%s' % (table, column)
+    start = time.time()
+    for value in values:
+        cursor.execute(sql, [value])
+        cursor.fetchall()
+    return (time.time() - start) / len(values) * 1000
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--rows', type='int', default=1000000)
+    parser.add_option('--lookups', type='int', default=1000)
+    options, args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+
+    seed_transactions(0, options.rows)
+    numbers = [random.randrange(options.rows) for _ in xrange(options.lookups)]
+    lookups = (
+        ('sagepay_transactionregistrationserverresponse', 'vps_tx_id', [tx_id(n) for n in numbers]),
+        ('sagepay_notificationpostresponse', 'vps_tx_id', [tx_id(n) for n in numbers]),
+        ('sagepay_sagepaytransaction', 'vendor_tx_code', [vendor_tx_code(n) for n in numbers]),
+        ('sagepay_sagepaytransaction', 'oscar_order', [100000 + n for n in numbers]),
+    )
+    cursor = connection.cursor()
+    for table in set(table for table, column, values in lookups):
+        # CREATE TABLE ... AS SELECT copies the rows, not the indexes
+        cursor.execute('CREATE TABLE unindexed_%s AS SELECT * FROM %s' % (table, table))
+    rows = []
+    for table, column, values in lookups:
+        before = lookup_latency(cursor, 'unindexed_%s' % table, column, values)
+        after = lookup_latency(cursor, table, column, values)
+        rows.append(('%s.%s' % (table.replace('sagepay_', ''), column),
+                     '%.3fms -> %.3fms (%.0fx)' % (before, after, before / after if after else 0)))
+    report('Lookup latency, %d rows, unindexed -> indexed' % options.rows, rows)
+
+
+if __name__ == '__main__':
+    main()
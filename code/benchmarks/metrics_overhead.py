@@ -0,0 +1,63 @@
+"""
+Overhead of the checkout metrics (:mod:`sagepay.metrics`): the same one query stage is run bare and inside
+:meth:`stage` with each backend, with and without query counting. The overhead is given per stage, a checkout
+runs four (gateway.post inside facade.authorize, facade.notification and views.finalise): compare four times the
+overhead with the milliseconds of benchmarks/checkout.py.
+
+    DJANGO_SETTINGS_MODULE=myproject.settings python benchmarks/metrics_overhead.py --iterations 20000
+"""
+import os
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import setup_django, report
+
+
+def timed(function, iterations):
+    start = time.time()
+    for i in xrange(iterations):
+        function()
+    return (time.time() - start) / iterations * 1000000
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--iterations', type='int', default=20000)
+    options, args = parser.parse_args()
+
+    setup_django(DEBUG=False)
+    from sagepay.metrics import Metrics, PrometheusMetrics, StatsdMetrics
+    from sagepay.models import CountryCode
+
+    def query():
+        CountryCode.objects.filter(code='GB').exists()
+
+    def staged(metrics):
+        def function():
+            with metrics.stage('facade.notification'):
+                query()
+            metrics.status('facade.notification', 'OK')
+        return function
+
+    # nothing listens on the StatsD port, the packets are sent and lost like with a server down
+    backends = [
+        ('no-op', Metrics()),
+        ('prometheus', PrometheusMetrics()),
+        ('prometheus, no query count', PrometheusMetrics(count_queries=False)),
+        ('statsd', StatsdMetrics(port=8126)),
+        ('statsd, no query count', StatsdMetrics(port=8126, count_queries=False)),
+    ]
+    timed(query, options.iterations // 10)
+    bare = timed(query, options.iterations)
+    rows = [('bare stage', '%.1fus' % bare)]
+    for name, metrics in backends:
+        elapsed = timed(staged(metrics), options.iterations)
+        rows.append((name, '%.1fus, +%.1fus (%+.1f%%)' % (elapsed, elapsed - bare, (elapsed - bare) / bare * 100)))
+    report('Metrics overhead on a one query stage, %d iterations' % options.iterations, rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Parsing time of the SagePay wire format: :func:`sagepay.core.parse_response` against the parser it replaced.
+
+    python benchmarks/response_parser.py --number 20000
+"""
+import os
+import sys
+import timeit
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import setup_django, report, REGISTRATION_OK_BODY
+
+NOTIFICATION_BODY = '\r\n'.join((
+    'VPSProtocol=3.00', 'TxType=PAYMENT', 'VendorTxCode=c4ca4238a0b923820dcc509a6f75849b',
+    'VPSTxId={1A960910-5F36-3421-24DE-65EF52C13380}', 'Status=OK',
+    'StatusDetail=0000 : The Authorisation was Successful.', 'TxAuthNo=7349', 'AVSCV2=ALL MATCH',
+    'AddressResult=MATCHED', 'PostCodeResult=MATCHED', 'CV2Result=MATCHED', 'GiftAid=0',
+    '3DSecureStatus=NOTCHECKED', 'CardType=VISA', 'Last4Digits=0006', 'DeclineCode=00', 'ExpiryDate=1220',
+    'BankAuthCode=999777', 'VPSSignature=3C5D8E2F3A8C4B0C9B8E1D2A7F6E5D4C',
+))
+
+
+def legacy_parse_response(response):
+    sage_response = {}
+    for i in response.split('\n'):
+        line = i.split('=')
+        if 'NextURL' in line[0]:
+            sage_response[line[0]] = '%s=%s' % (line[1].strip(), line[2].strip())
+        else:
+            sage_response[line[0]] = line[1].strip()
+    return sage_response
+
+
+def measure(function, body, number):
+    return min(timeit.repeat(lambda: function(body), number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--number', type='int', default=20000)
+    options, args = parser.parse_args()
+
+    setup_django()
+    from sagepay.core import parse_response
+
+    rows = []
+    for name, body in (('registration', REGISTRATION_OK_BODY), ('notification', NOTIFICATION_BODY)):
+        legacy = measure(legacy_parse_response, body, options.number)
+        current = measure(parse_response, body, options.number)
+        rows.append(('%s legacy (us)' % name, '%.2f' % legacy))
+        rows.append(('%s parse_response (us)' % name, '%.2f' % current))
+    report('SagePay wire format parsing', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Notification signature verifications per second: :class:`sagepay.signature.SignatureVerifier` against the check it
+replaced, the payload joined from notification.get lookups as post_format used to build it, md5 and ==.
+
+    python benchmarks/signature.py --number 50000
+"""
+import os
+import sys
+import time
+import hashlib
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import setup_django, report
+from response_parser import NOTIFICATION_BODY
+
+
+def legacy_verify(notification, vendor, security_key):
+    get = notification.get
+    post = ''.join((
+        get('VPSTxId', ''), get('VendorTxCode', ''), get('Status', ''), get('TxAuthNo', ''), vendor.lower(),
+        get('AVSCV2', ''), security_key.strip(), get('AddressResult', ''), get('PostCodeResult', ''),
+        get('CV2Result', ''), get('GiftAid', ''), get('3DSecureStatus', ''), get('CAVV', ''),
+        get('AddressStatus', ''), get('PayerStatus', ''), get('CardType', ''), get('Last4Digits', ''),
+        get('DeclineCode', ''), get('ExpiryDate', ''), get('FraudResponse', ''), get('BankAuthCode', ''),
+    ))
+    return hashlib.md5(post).hexdigest().upper() == notification['VPSSignature']
+
+
+def rate(function, number):
+    start = time.time()
+    for _ in xrange(number):
+        function()
+    return number / (time.time() - start)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--number', type='int', default=50000)
+    options, args = parser.parse_args()
+
+    setup_django()
+    from sagepay.core import TransactionNotificationPostResponse
+    from sagepay.signature import SignatureVerifier
+
+    notification = TransactionNotificationPostResponse(NOTIFICATION_BODY)
+    verifier = SignatureVerifier('benchmark', 'U5NX3V0WG9')
+    report('Notification signature verification', [
+        ('legacy verifications/s', '%.0f' % rate(lambda: legacy_verify(notification, 'benchmark', 'U5NX3V0WG9'),
+                                                 options.number)),
+        ('SignatureVerifier verifications/s', '%.0f' % rate(lambda: verifier.verify(notification), options.number)),
+    ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+import datetime
+
+from django.db import transaction, IntegrityError
+from django.db.models import Count, Sum, F, Max
+from django.utils import timezone
+
+from .models import SagePayTransaction, TransactionRollup
+
+HOUR = datetime.timedelta(hours=1)
+# outcome of the notified statuses in the dashboard rates
+APPROVED = ('OK', 'AUTHENTICATED', 'REGISTERED')
+DECLINED = ('NOTAUTHED', 'REJECTED')
+ABORTED = ('ABORT',)
+
+
+def hour_start(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def local_day(period):
+    """
+    :returns: date -- day of the hour in the current time zone, the dashboard days start at local midnight
+    """
+    if timezone.is_aware(period):
+        period = timezone.localtime(period)
+    return period.date()
+
+
+@transaction.commit_on_success
+def rollup(start, end):
+    """
+    Rebuild the rollup rows of the hours from `start` to `end`, one aggregate query per hour
+
+    :param start: first hour rebuilt
+    :type start: datetime
+    :param end: the hours before it are rebuilt
+    :type end: datetime
+    :returns: int -- number of hours rebuilt
+    """
+    period = hour_start(start)
+    hours = 0
+    while period < end:
+        TransactionRollup.objects.filter(period=period).delete()
+        groups = SagePayTransaction.objects.filter(created__gte=period, created__lt=period + HOUR).values(
+            'notification_post_response__status', 'notification_post_response__card_type',
+            'notification_post_response__threed_secure_status',
+        ).annotate(count=Count('id'), value=Sum('amount')).order_by()
+        TransactionRollup.objects.bulk_create([
+            TransactionRollup(period=period, day=local_day(period),
+                              status=group['notification_post_response__status'] or '',
+                              card_type=group['notification_post_response__card_type'] or '',
+                              threed_secure_status=group['notification_post_response__threed_secure_status'] or '',
+                              count=group['count'], amount=group['value'] or 0)
+            for group in groups])
+        period += HOUR
+        hours += 1
+    return hours
+
+
+def rollup_start(lookback):
+    """
+    Return where an incremental rollup starts: `lookback` before the last rolled up hour, to catch the notifications
+    which landed since, or the first transaction if nothing was rolled up yet
+
+    :param lookback: hours rebuilt again
+    :type lookback: :class:`datetime.timedelta`
+    :returns: datetime or None if there are no transactions
+    """
+    last = TransactionRollup.objects.aggregate(last=Max('period'))['last']
+    if last is not None:
+        return last - lookback
+    first = SagePayTransaction.objects.order_by('created').values_list('created', flat=True)[:1]
+    return first[0] if first else None
+
+
+def record_notification(sage_transaction, notification, previous=None):
+    """
+    Move a notified transaction, in the rollup of its hour, from the row of its previous notification (or of no
+    notification) to the row of `notification`
+
+    The previous row is only decremented while it counts something. A transaction created after its hour was last
+    rolled up wasn't counted there yet: the recent hours rebuilt by rollup_transactions correct it.
+
+    :param sage_transaction: notified transaction
+    :type sage_transaction: :class:`sagepay.models.SagePayTransaction` instance
+    :param notification: its notification
+    :type notification: :class:`sagepay.models.NotificationPostResponse` instance
+    :param previous: the notification it was linked to before, None if it had none
+    :type previous: :class:`sagepay.models.NotificationPostResponse` instance
+    """
+    period = hour_start(sage_transaction.created)
+    key = _rollup_key(period, notification)
+    old_key = _rollup_key(period, previous)
+    if key == old_key:
+        return
+    TransactionRollup.objects.filter(count__gt=0, **old_key).update(
+        count=F('count') - 1, amount=F('amount') - sage_transaction.amount)
+    increment = dict(count=F('count') + 1, amount=F('amount') + sage_transaction.amount)
+    if TransactionRollup.objects.filter(**key).update(**increment):
+        return
+    sid = transaction.savepoint()
+    try:
+        TransactionRollup.objects.create(day=local_day(period), count=1, amount=sage_transaction.amount, **key)
+        transaction.savepoint_commit(sid)
+    except IntegrityError:
+        # created by a concurrent notification
+        transaction.savepoint_rollback(sid)
+        TransactionRollup.objects.filter(**key).update(**increment)
+
+
+def _rollup_key(period, notification):
+    if notification is None:
+        return dict(period=period, status='', card_type='', threed_secure_status='')
+    return dict(period=period, status=notification.status, card_type=notification.card_type,
+                threed_secure_status=notification.threed_secure_status)
+
+
+def summary(start, end, granularity='day'):
+    """
+    Aggregate the rollup rows from `start` to `end`
+
+    :param granularity: hour or day
+    :type granularity: str
+    :returns: dict -- periods (volume, value, approval, decline and abort rates, threed_secure and card_types per
+        period), threed_secure and card_types (count and value per 3D Secure status and card type over the range)
+    """
+    rows = TransactionRollup.objects.filter(period__gte=start, period__lt=end)
+    period_field = 'period' if granularity == 'hour' else 'day'
+    periods = {}
+    for group in rows.values(period_field, 'status').annotate(count=Sum('count'), value=Sum('amount')).order_by():
+        period = periods.setdefault(group[period_field], {'period': group[period_field], 'count': 0, 'value': 0,
+                                                          'approved': 0, 'declined': 0, 'aborted': 0,
+                                                          'threed_secure': [], 'card_types': []})
+        period['count'] += group['count']
+        period['value'] += group['value']
+        for outcome, statuses in (('approved', APPROVED), ('declined', DECLINED), ('aborted', ABORTED)):
+            if group['status'] in statuses:
+                period[outcome] += group['count']
+    for period in periods.values():
+        for outcome in ('approved', 'declined', 'aborted'):
+            period['%s_rate' % outcome] = float(period[outcome]) / period['count'] if period['count'] else 0
+    for key, field in (('threed_secure', 'threed_secure_status'), ('card_types', 'card_type')):
+        for group in rows.values(period_field, field).annotate(count=Sum('count'), value=Sum('amount')).order_by(
+                period_field, '-count', field):
+            periods[group.pop(period_field)][key].append(group)
+    return {
+        'periods': [periods[key] for key in sorted(periods)],
+        'threed_secure': list(rows.values('threed_secure_status').annotate(
+            count=Sum('count'), value=Sum('amount')).order_by('-count')),
+        'card_types': list(rows.values('card_type').annotate(
+            count=Sum('count'), value=Sum('amount')).order_by('-count')),
+    }
@@ -0,0 +1,60 @@
+import threading
+from collections import OrderedDict
+
+from .settings import TX_ID_CACHE_SIZE
+
+
+class LRUCache(object):
+    """
+    Thread safe, per process, least recently used cache
+
+    :param maxsize: number of entries kept, the least recently used one is dropped beyond it
+    :type maxsize: int
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        :returns: dict -- size, hits and misses
+        """
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+# SagePay transaction id -> SagePayTransaction pk, entries are dropped when the transaction is saved or deleted
+transaction_ids = LRUCache(TX_ID_CACHE_SIZE)
@@ -1,19 +1,122 @@
+def parse_response(body):
+    """
+    Parse the SagePay key=value wire format into a dictionary
+
+    Lines are split on the first "=" only, so values containing "=" (e.g. NextURL) are kept whole; LF and CRLF line
+    endings are accepted and lines without "=" are ignored.
+
+    :param body: SagePay server response or notification content
+    :type body: str
+    :returns: dict
+    """
+    data = {}
+    for line in body.splitlines():
+        key, sep, value = line.partition('=')
+        if sep:
+            data[key.strip()] = value.strip()
+    return data
+
+
+class Status(object):
+    """
+    Transaction notification statuses (page 64 of sage manual), small integers are cheaper to compare than strings
+    """
+    UNKNOWN = 0
+    OK = 1
+    PENDING = 2
+    NOTAUTHED = 3
+    ABORT = 4
+    REJECTED = 5
+    AUTHENTICATED = 6
+    REGISTERED = 7
+    ERROR = 8
+
+    codes = {
+        'OK': OK,
+        'PENDING': PENDING,
+        'NOTAUTHED': NOTAUTHED,
+        'ABORT': ABORT,
+        'REJECTED': REJECTED,
+        'AUTHENTICATED': AUTHENTICATED,
+        'REGISTERED': REGISTERED,
+        'ERROR': ERROR,
+    }
+
+
+# notification fields sent by SagePay and the attribute storing them
+NOTIFICATION_FIELDS = (
+    ('VPSProtocol', 'vps_protocol'),
+    ('TxType', 'tx_type'),
+    ('VendorTxCode', 'vendor_tx_code'),
+    ('VPSTxId', 'vps_tx_id'),
+    ('Status', 'status'),
+    ('StatusDetail', 'status_detail'),
+    ('TxAuthNo', 'tx_auth_no'),
+    ('AVSCV2', 'avscv2'),
+    ('AddressResult', 'address_result'),
+    ('PostCodeResult', 'postcode_result'),
+    ('CV2Result', 'cv2_result'),
+    ('GiftAid', 'gift_aid'),
+    ('3DSecureStatus', 'threed_secure_status'),
+    ('CAVV', 'cavv'),
+    ('AddressStatus', 'address_status'),
+    ('PayerStatus', 'payer_status'),
+    ('CardType', 'card_type'),
+    ('Last4Digits', 'last_4_digits'),
+    ('DeclineCode', 'decline_code'),
+    ('ExpiryDate', 'expiry_date'),
+    ('FraudResponse', 'fraud_response'),
+    ('BankAuthCode', 'bank_auth_code'),
+    ('Token', 'token'),
+    ('VPSSignature', 'vps_signature'),
+)
+NOTIFICATION_SLOTS = dict(NOTIFICATION_FIELDS)
+
+
 class TransactionNotificationPostResponse(object):
     """
     Encapsulate the notification of results of transactions into an object
     (page 63 of sage manual)
 
-    :param response: content of the SagePay server notification post
-    :type response: dictionary
+    The known fields are stored in slots, the ones missing from the notification are left unset; unknown fields are
+    kept in the `extra` dictionary.
+
+    :param response: content of the SagePay server notification post, either parsed or in the wire format
+    :type response: dictionary or str
     """
+    __slots__ = tuple(slot for field, slot in NOTIFICATION_FIELDS) + ('status_code', 'extra')
+
     def __init__(self, response):
-        self.response = response
+        if isinstance(response, basestring):
+            response = parse_response(response)
+        self.extra = None
+        slots = NOTIFICATION_SLOTS
+        for key, value in response.iteritems():
+            slot = slots.get(key)
+            if slot is not None:
+                setattr(self, slot, value)
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[key] = value
+        self.status_code = Status.codes.get(getattr(self, 'status', None), Status.UNKNOWN)
 
     def __getitem__(self, key):
-        return self.response[key]
+        slot = NOTIFICATION_SLOTS.get(key)
+        if slot is not None:
+            try:
+                return getattr(self, slot)
+            except AttributeError:
+                raise KeyError(key)
+        if self.extra is None:
+            raise KeyError(key)
+        return self.extra[key]
 
     def __contains__(self, key):
-        return key in self.response
+        slot = NOTIFICATION_SLOTS.get(key)
+        if slot is not None:
+            return hasattr(self, slot)
+        return self.extra is not None and key in self.extra
 
     def get(self, key, default):
         """
@@ -26,13 +129,25 @@ class TransactionNotificationPostResponse(object):
         :returns: dictionary value or default
         """
         try:
-            return self.response[key]
+            return self[key]
         except KeyError:
             return default
 
+    def to_dict(self):
+        """
+        Return the notification content as a dictionary
+
+        :returns: dict
+        """
+        data = dict((field, getattr(self, slot)) for field, slot in NOTIFICATION_FIELDS if hasattr(self, slot))
+        if self.extra is not None:
+            data.update(self.extra)
+        return data
+
     def post_format(self, vendor_name, security_key):
         """
-        Reconstruct the POST response content to be MD5 hashed and matched for preventing tampering
+        Reconstruct the POST response content to be MD5 hashed and matched for preventing tampering, see
+        :meth:`sagepay.signature.SignatureVerifier.signing_payload`
 
         :param vendor_name: SagePay vendor name
         :type vendor_name: str
@@ -40,107 +155,62 @@ class TransactionNotificationPostResponse(object):
         :type security_key: :class:`sagepay.models.SagePayTransaction` security key field
         :returns: str
         """
-        values = (
-            self.response.get('VPSTxId', ''),
-            self.response.get('VendorTxCode', ''),
-            self.response.get('Status', ''),
-            self.response.get('TxAuthNo', ''),
-            vendor_name,
-            self.response.get('AVSCV2', ''),
-            security_key.strip(),
-            self.response.get('AddressResult', ''),
-            self.response.get('PostCodeResult', ''),
-            self.response.get('CV2Result', ''),
-            self.response.get('GiftAid', ''),
-            self.response.get('3DSecureStatus', ''),
-            self.response.get('CAVV', ''),
-            #self.response.get('AddressStatus', ''),
-            #self.response.get('PayerStatus', ''),
-            self.response.get('CardType', ''),
-            self.response.get('Last4Digits', ''),
-            self.response.get('DeclineCode', ''),
-            self.response.get('ExpiryDate', ''),
-            #self.response.get('FraudResponse', ''),
-            self.response.get('BankAuthCode', ''),
-        )
-        return ''.join(values)
+        from .signature import SignatureVerifier
+
+        return SignatureVerifier(vendor_name, security_key).signing_payload(self)
 
     @property
     def ok(self):
         """
         True if the transaction status is ok
         """
-        if self.response['Status'] == 'OK':
-            return True
-        else:
-            return False
+        return self.status_code == Status.OK
 
     @property
     def pending(self):
         """
         True if the transaction status is pending
         """
-        if self.response['Status'] == 'PENDING':
-            return True
-        else:
-            return False
+        return self.status_code == Status.PENDING
 
     @property
     def notauthed(self):
         """
         True if the transaction status is notauthed
         """
-        if self.response['Status'] == 'NOTAUTHED':
-            return True
-        else:
-            return False
+        return self.status_code == Status.NOTAUTHED
 
     @property
     def abort(self):
         """
         True if the transaction status is abort
         """
-        if self.response['Status'] == 'ABORT':
-            return True
-        else:
-            return False
+        return self.status_code == Status.ABORT
 
     @property
     def rejected(self):
-        if self.response['Status'] == 'REJECTED':
-            return True
-        else:
-            return False
+        return self.status_code == Status.REJECTED
 
     @property
     def authenticated(self):
         """
         True if the transaction status is authenticated
         """
-        if self.response['Status'] == 'AUTHENTICATED':
-            return True
-        else:
-            return False
+        return self.status_code == Status.AUTHENTICATED
 
     @property
     def registered(self):
         """
         True if the transaction status is registered
         """
-        if self.response['Status'] == 'REGISTERED':
-            return True
-        else:
-            return False
+        return self.status_code == Status.REGISTERED
 
     @property
     def error(self):
         """
         True if the transaction status is error
         """
-        if self.response['Status'] == 'ERROR':
-            return True
-        else:
-            return False
+        return self.status_code == Status.ERROR
 
 
 class Response(object):
@@ -149,19 +219,19 @@ class Response(object):
 
     :param response: :class:`requests.Response` instance
     """
+    # VendorTxCode of the registration answered, set by :meth:`sagepay.gateway.Gateway.register_payment`
+    vendor_tx_code = None
+
     def __init__(self, response):
         self.response = response
-        self.data = self._convert_data(response)
-
-    def _convert_data(self, response):
-        sage_response = {}
-        for i in response.split('\n'):
-            line = i.split('=')
-            if 'NextURL' in line[0]:
-                sage_response[line[0]] = '%s=%s' % (line[1].strip(), line[2].strip())
-            else:
-                sage_response[line[0]] = line[1].strip()
-        return sage_response
+        self._data = None
+
+    @property
+    def data(self):
+        # parsed on first access, a response which is only logged or stored is never parsed
+        if self._data is None:
+            self._data = parse_response(self.response)
+        return self._data
 
     def __getitem__(self, key):
         return self.data[key]
@@ -182,7 +252,7 @@ class Response(object):
 
         :returns: Boolean
         """
-        if 'OK' in self.data['Status']:
+        if 'OK' in self.data.get('Status', ''):
             return True
         else:
             return False
@@ -0,0 +1,109 @@
+import time
+import threading
+
+from django.core.cache import get_cache
+from django.db.models import get_model
+
+from .settings import COUNTRY_CACHE, COUNTRY_CACHE_TIMEOUT
+
+CACHE_KEY = 'sagepay:country-rows'
+
+
+class CountryResolver(object):
+    """
+    Resolve :class:`sagepay.models.CountryCode` and Oscar countries from each other with dictionary lookups
+
+    Both tables are read once and kept in the process for `timeout` seconds, the post_save and post_delete signals of
+    either model invalidate them. The rows are kept rather than instances, each lookup returns a new instance with
+    every field set that the caller can keep or change. When `cache_alias` is set the tables are shared between the processes through that
+    Django cache.
+
+    :param cache_alias: Django cache the tables are shared through, None keeps them in the process only
+    :type cache_alias: str
+    :param timeout: seconds the tables are kept
+    :type timeout: int
+    """
+    def __init__(self, cache_alias=None, timeout=3600):
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+        self._codes = self._countries = None
+        self._expires = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return get_cache(self.cache_alias) if self.cache_alias else None
+
+    def country_code(self, country):
+        """
+        Return the SagePay country code of an Oscar country, a country code or a country name
+
+        :param country: country to resolve
+        :type country: :class:`oscar.apps.address.models.Country` or :class:`sagepay.models.CountryCode` instance or str
+        :returns: :class:`sagepay.models.CountryCode` instance
+        :raises: CountryCode.DoesNotExist
+        """
+        CountryCode = get_model('sagepay', 'CountryCode')
+        name = self._name(country)
+        try:
+            return CountryCode(**self._tables()[0][name.lower()])
+        except KeyError:
+            # added by another process since the tables were read
+            return CountryCode.objects.get(name__iexact=name)
+
+    def oscar_country(self, country):
+        """
+        Return the Oscar country matching a SagePay country code or a country name
+
+        :param country: country to resolve
+        :type country: :class:`sagepay.models.CountryCode` instance or str
+        :returns: :class:`oscar.apps.address.models.Country` instance
+        :raises: Country.DoesNotExist
+        """
+        Country = get_model('address', 'Country')
+        name = self._name(country)
+        try:
+            return Country(**self._tables()[1][name.lower()])
+        except KeyError:
+            return Country.objects.get(printable_name__iexact=name)
+
+    def _name(self, country):
+        if isinstance(country, basestring):
+            return country
+        return getattr(country, 'printable_name', None) or country.name
+
+    def _tables(self):
+        codes, countries = self._codes, self._countries
+        if codes is None or time.time() > self._expires:
+            with self._lock:
+                if self._codes is None or time.time() > self._expires:
+                    self._codes, self._countries = self._load()
+                    self._expires = time.time() + self.timeout
+                codes, countries = self._codes, self._countries
+        return codes, countries
+
+    def _load(self):
+        CountryCode = get_model('sagepay', 'CountryCode')
+        Country = get_model('address', 'Country')
+        cache = self.cache
+        rows = cache.get(CACHE_KEY) if cache is not None else None
+        if rows is None:
+            rows = (list(CountryCode.objects.values()), list(Country.objects.values()))
+            if cache is not None:
+                cache.set(CACHE_KEY, rows, self.timeout)
+        codes = dict((row['name'].lower(), row) for row in rows[0])
+        countries = dict((row['printable_name'].lower(), row) for row in rows[1])
+        return codes, countries
+
+    def invalidate(self, **kwargs):
+        """
+        Forget the tables, they are read again on the next lookup. It can be connected to model signals.
+        """
+        with self._lock:
+            self._codes = self._countries = None
+        cache = self.cache
+        if cache is not None:
+            cache.delete(CACHE_KEY)
+
+
+country_resolver = CountryResolver(COUNTRY_CACHE, COUNTRY_CACHE_TIMEOUT)
@@ -23,7 +23,7 @@ class AccountSummaryView(OscarAccountSummaryView):
         return ctx
 
     def get_credit_cards(self, user):
-        return Token.objects.filter(user=user)
+        return Token.objects.unexpired().filter(user=user)
 
 class DeleteStoredCardView(DeleteView):
     #model = Token
@@ -10,6 +10,8 @@ class SagePayDashboardApplication(Application):
     name = None
     list_view = views.TransactionListView
     detail_view = views.TransactionDetailView
+    export_view = views.TransactionExportView
+    analytics_view = views.TransactionAnalyticsView
 
     def get_urls(self):
         urlpatterns = patterns('',
@@ -17,6 +19,10 @@ class SagePayDashboardApplication(Application):
                 name='sagepay-transaction-list'),
             url(r'^transactions/(?P<pk>\d+)/$', self.detail_view.as_view(),
                 name='sagepay-transaction-detail'),
+            url(r'^transactions/export/$', self.export_view.as_view(),
+                name='sagepay-transaction-export'),
+            url(r'^transactions/analytics/$', self.analytics_view.as_view(),
+                name='sagepay-transaction-analytics'),
         )
         return self.post_process_urls(urlpatterns)
 
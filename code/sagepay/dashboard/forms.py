@@ -0,0 +1,73 @@
+import datetime
+
+from django import forms
+from django.conf import settings
+from django.utils import timezone
+
+STATUS_CHOICES = (
+    ('', 'Any status'),
+    ('OK', 'OK'),
+    ('NOTAUTHED', 'Not authorised'),
+    ('ABORT', 'Aborted'),
+    ('REJECTED', 'Rejected'),
+    ('ERROR', 'Error'),
+    ('AUTHENTICATED', 'Authenticated'),
+    ('REGISTERED', 'Registered'),
+)
+
+
+class TransactionSearchForm(forms.Form):
+    status = forms.ChoiceField(choices=STATUS_CHOICES, required=False)
+    date_from = forms.DateField(required=False)
+    date_to = forms.DateField(required=False)
+    amount_min = forms.DecimalField(max_digits=8, decimal_places=2, required=False)
+    amount_max = forms.DecimalField(max_digits=8, decimal_places=2, required=False)
+    card_type = forms.CharField(max_length=15, required=False)
+
+    def filter(self, queryset):
+        """
+        Apply the filters to the transactions, every filter is on an indexed column
+
+        :param queryset: transactions to filter
+        :type queryset: :class:`django.db.models.query.QuerySet` instance
+        :returns: :class:`django.db.models.query.QuerySet` instance
+        """
+        data = self.cleaned_data
+        if data.get('status'):
+            queryset = queryset.filter(notification_post_response__status=data['status'])
+        if data.get('card_type'):
+            queryset = queryset.filter(notification_post_response__card_type=data['card_type'].upper())
+        if data.get('date_from'):
+            queryset = queryset.filter(created__gte=data['date_from'])
+        if data.get('date_to'):
+            queryset = queryset.filter(created__lt=data['date_to'] + datetime.timedelta(days=1))
+        if data.get('amount_min') is not None:
+            queryset = queryset.filter(amount__gte=data['amount_min'])
+        if data.get('amount_max') is not None:
+            queryset = queryset.filter(amount__lte=data['amount_max'])
+        return queryset
+
+
+class AnalyticsForm(forms.Form):
+    granularity = forms.ChoiceField(choices=(('day', 'Day'), ('hour', 'Hour')), required=False)
+    date_from = forms.DateField(required=False)
+    date_to = forms.DateField(required=False)
+
+    def period(self):
+        """
+        :returns: tuple -- (start, end) datetimes of the days chosen, the last 7 days by default
+        """
+        data = self.cleaned_data if self.is_valid() else {}
+        date_to = data.get('date_to') or timezone.now().date()
+        date_from = data.get('date_from') or date_to - datetime.timedelta(days=6)
+        return _day_start(date_from), _day_start(date_to + datetime.timedelta(days=1))
+
+    def granularity_value(self):
+        return (self.cleaned_data.get('granularity') if self.is_valid() else None) or 'day'
+
+
+def _day_start(day):
+    start = datetime.datetime.combine(day, datetime.time())
+    if settings.USE_TZ:
+        start = timezone.make_aware(start, timezone.get_current_timezone())
+    return start
@@ -1,14 +1,107 @@
-from django.views.generic import ListView, DetailView
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.views.generic import ListView, DetailView, View, TemplateView
 
 from sagepay.models import SagePayTransaction
+from sagepay.export import export_lines, FORMATS
+from sagepay.analytics import summary
+
+from .forms import TransactionSearchForm, AnalyticsForm
+
 
 class TransactionListView(ListView):
-    queryset = SagePayTransaction.objects.order_by('-created')
+    """
+    Transactions newest first, paginated on (created, id): a page costs the same whatever its depth
+
+    Besides `transactions` the context has the search `form` and `next_page`, the query string of the next page or
+    None on the last one.
+    """
     context_object_name = 'transactions'
     template_name = 'sagepay/dashboard/transaction_list.html'
+    page_size = 50
+
+    def get(self, request, *args, **kwargs):
+        self.form = TransactionSearchForm(request.GET or None)
+        return super(TransactionListView, self).get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        queryset = SagePayTransaction.objects.select_related(
+            'transaction_registration_server_response', 'notification_post_response', 'token'
+        ).order_by('-created', '-id')
+        if self.form.is_valid():
+            queryset = self.form.filter(queryset)
+        return self.seek(queryset, self.request.GET.get('after'))
+
+    def seek(self, queryset, after):
+        """
+        Keep the transactions listed after the transaction `after`
+
+        :param after: primary key of the last transaction of the previous page
+        :type after: str
+        """
+        try:
+            created = SagePayTransaction.objects.filter(pk=int(after)).values_list('created', flat=True)[0]
+        except (TypeError, ValueError, IndexError):
+            return queryset
+        return queryset.filter(created__lte=created).exclude(created=created, id__gte=int(after))
+
+    def get_context_data(self, **kwargs):
+        # one more row tells if there's a next page without counting the table
+        transactions = list(kwargs.pop('object_list')[:self.page_size + 1])
+        next_page = None
+        if len(transactions) > self.page_size:
+            transactions = transactions[:self.page_size]
+            query = self.request.GET.copy()
+            query['after'] = transactions[-1].pk
+            next_page = query.urlencode()
+        ctx = super(TransactionListView, self).get_context_data(object_list=transactions, **kwargs)
+        ctx['form'] = self.form
+        ctx['next_page'] = next_page
+        return ctx
 
 
 class TransactionDetailView(DetailView):
     model = SagePayTransaction
     context_object_name = 'txn'
     template_name = 'sagepay/dashboard/transaction_detail.html'
+
+
+class TransactionExportView(View):
+    """
+    Stream the transactions matching the search form as CSV (default) or NDJSON (?format=ndjson), the rows are read
+    in chunks while the response is sent
+
+    The response iterates over the lines as it's sent, a middleware reading its content (GZipMiddleware, ETags) would
+    build the whole export in memory: use the export_transactions command behind one.
+    """
+    chunk_size = 1000
+
+    def get(self, request, *args, **kwargs):
+        form = TransactionSearchForm(request.GET or None)
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in FORMATS or (form.is_bound and not form.is_valid()):
+            return HttpResponseBadRequest('Invalid export parameters')
+        queryset = SagePayTransaction.objects.all()
+        if form.is_bound:
+            queryset = form.filter(queryset)
+        response = HttpResponse(export_lines(queryset, export_format, self.chunk_size),
+                                content_type=FORMATS[export_format])
+        response['Content-Disposition'] = 'attachment; filename=sagepay-transactions.%s' % export_format
+        return response
+
+
+class TransactionAnalyticsView(TemplateView):
+    """
+    Volume, value, outcome rates, 3D Secure outcomes and card types per day or hour, read from the rollup table
+
+    The context has the `form`, `granularity` and the :func:`sagepay.analytics.summary` keys.
+    """
+    template_name = 'sagepay/dashboard/transaction_analytics.html'
+
+    def get_context_data(self, **kwargs):
+        ctx = super(TransactionAnalyticsView, self).get_context_data(**kwargs)
+        form = AnalyticsForm(self.request.GET or None)
+        start, end = form.period()
+        ctx['form'] = form
+        ctx['granularity'] = form.granularity_value()
+        ctx.update(summary(start, end, ctx['granularity']))
+        return ctx
@@ -2,6 +2,9 @@
 class GatewayException(Exception):
     pass
 
+class CircuitOpenException(GatewayException):
+    pass
+
 # facade exceptions
 class NotApproved(Exception):
     pass
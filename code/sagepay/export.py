@@ -0,0 +1,109 @@
+import csv
+import json
+
+from .models import SagePayTransaction
+
+# (column, lookup) of the exported transactions
+EXPORT_FIELDS = (
+    ('created', 'created'),
+    ('vendor_tx_code', 'vendor_tx_code'),
+    ('vps_tx_id', 'vps_tx_id'),
+    ('oscar_order', 'oscar_order'),
+    ('amount', 'amount'),
+    ('currency', 'currency'),
+    ('status', 'notification_post_response__status'),
+    ('status_detail', 'notification_post_response__status_detail'),
+    ('tx_auth_no', 'notification_post_response__tx_auth_no'),
+    ('bank_auth_code', 'notification_post_response__bank_auth_ode'),
+    ('card_type', 'notification_post_response__card_type'),
+    ('last_4_digits', 'notification_post_response__last_4_digits'),
+    ('threed_secure_status', 'notification_post_response__threed_secure_status'),
+)
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def export_rows(queryset=None, chunk_size=1000):
+    """
+    Yield the exported values of the transactions, one tuple per transaction
+
+    Only `chunk_size` rows are held at a time: each chunk is a query seeking past the last primary key of the previous
+    one, so the cost of a chunk doesn't depend on how far the export went.
+
+    :param queryset: transactions to export, filters are kept and ordering is replaced by the primary key
+    :type queryset: :class:`django.db.models.query.QuerySet` instance
+    :param chunk_size: rows fetched per query
+    :type chunk_size: int
+    :returns: generator of tuples ordered as :data:`EXPORT_FIELDS`
+    """
+    if queryset is None:
+        queryset = SagePayTransaction.objects.all()
+    queryset = queryset.order_by('pk').values_list('pk', *[lookup for column, lookup in EXPORT_FIELDS])
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        for row in chunk:
+            yield row[1:]
+        if len(chunk) < chunk_size:
+            return
+        last_pk = chunk[-1][0]
+
+
+class _Line(object):
+    # file like object handing back what the csv writer writes
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    """
+    Format the rows as CSV, header first, one string per line
+
+    :param rows: rows from :func:`export_rows`
+    :returns: generator of str
+    """
+    writer = csv.writer(_Line())
+    yield writer.writerow([column for column, lookup in EXPORT_FIELDS])
+    for row in rows:
+        yield writer.writerow([_csv_value(value) for value in row])
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def ndjson_lines(rows):
+    """
+    Format the rows as newline delimited JSON objects
+
+    :param rows: rows from :func:`export_rows`
+    :returns: generator of str
+    """
+    columns = [column for column, lookup in EXPORT_FIELDS]
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), default=_json_value) + '\n'
+
+
+def _json_value(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    # Decimal amounts
+    return str(value)
+
+
+def export_lines(queryset=None, format='csv', chunk_size=1000):
+    """
+    :param format: csv or ndjson
+    :type format: str
+    :returns: generator of the lines of the export
+    """
+    rows = export_rows(queryset, chunk_size)
+    if format == 'ndjson':
+        return ndjson_lines(rows)
+    return csv_lines(rows)
@@ -1,28 +1,90 @@
-import hashlib
-import pprint
+import threading
+from contextlib import contextmanager
+from collections import deque
 
+from django.db import transaction as db_transaction, IntegrityError
 from django.db.models import get_model
+from django.utils.timezone import now
 
 from oscar.apps.payment.exceptions import PaymentError, InvalidGatewayRequestError
 
-from .gateway import Gateway
+from .gateway import AsyncGateway, get_gateway
 from .models import TransactionRegistrationServerResponse, SagePayTransaction, CountryCode, NotificationPostResponse, Token
-from .exceptions import GatewayException, TransactionDoesNotExistException
-from .utils import utf8_truncate
-from .core import TransactionNotificationPostResponse
+from .exceptions import GatewayException
+from .utils import get_basket_builder
+from .core import TransactionNotificationPostResponse, Status
+from .signature import SignatureVerifier
+from .cache import transaction_ids
+from .countries import country_resolver
+from .analytics import record_notification
+from .metrics import get_metrics
+from .signals import notification_processed
+from .tasks import enqueue
 from .settings import *
 
 BillingAddress = get_model('order', 'BillingAddress')
-OscarCountry = get_model('address', 'Country')
+
+# primary keys deleted per query by Facade.delete_tokens
+DELETE_CHUNK_SIZE = 500
+
+# error page (see views.SageErrorView) the customer is sent to for each unsuccessful status
+ERROR_REDIRECTS = {
+    Status.NOTAUTHED: '1',
+    Status.ABORT: '2',
+    Status.REJECTED: '3',
+}
+
+
+class PendingRegistration(object):
+    """
+    Payment registration started by :meth:`Facade.authorize_async`
+
+    :param facade: the facade which started the registration
+    :type facade: :class:`Facade` instance
+    :param transaction: the transaction being registered
+    :type transaction: :class:`sagepay.models.SagePayTransaction` instance
+    :param result: result of :meth:`sagepay.gateway.AsyncGateway.register_payment`
+    :type result: :class:`multiprocessing.pool.AsyncResult` instance
+    """
+    def __init__(self, facade, transaction, result):
+        self.facade = facade
+        self.transaction = transaction
+        self.result = result
+
+    def ready(self):
+        """
+        True if SagePay has answered (or the request failed)
+        """
+        return self.result.ready()
+
+    def get(self, timeout=None):
+        """
+        Wait for the SagePay answer and save it, it behaves like :meth:`Facade.authorize`
+
+        :param timeout: seconds to wait, :class:`multiprocessing.TimeoutError` is raised when they are over
+        :type timeout: float
+        :returns: str -- transaction id
+        """
+        try:
+            response, status = self.result.get(timeout)
+        except GatewayException:
+            raise PaymentError('Unable to contact SagePay server')
+        return self.facade._registration_response(self.transaction, response)
 
 
 class Facade(object):
     """
     A bridge between oscar's and sagepay's objects and the core gateway object
+
+    :param site: site the payments are taken on, its URLs are given to SagePay, the current site if None
+    :type site: :class:`django.contrib.sites.models.Site` instance
     """
 
-    def __init__(self):
-        self.gateway = Gateway(SAGEPAY_PROFILE, NOTIFICATION_URL, SAGE_SERVER_URL)
+    def __init__(self, site=None):
+        self.urls = site_urls.for_site(site)
+        self.gateway = get_gateway(SAGEPAY_PROFILE, self.urls['notification'], SAGE_SERVER_URL)
+        self.async_gateway = get_gateway(SAGEPAY_PROFILE, self.urls['notification'], SAGE_SERVER_URL, AsyncGateway)
+        self.basket_builder = get_basket_builder()
 
     def authorize(self, order_number, basket, amount, shipping_address, billing_address=None, save_card=False, card_token=None):
         """
@@ -40,10 +102,34 @@ class Facade(object):
         :type shipping_address: `oscar.apps.address.models.UserAddress` instance
         :param token: generate and return a credit card token (to save the credit card details in a safe way)
         :type token: bool
+        :returns: str -- transaction id
+        """
+        with get_metrics().stage('facade.authorize'):
+            transaction = self._create_transaction(order_number, basket, amount, shipping_address, billing_address,
+                                                   card_token)
+            return self._register_payment(transaction, save_card)
+
+    def authorize_async(self, order_number, basket, amount, shipping_address, billing_address=None, save_card=False, card_token=None):
+        """
+        Same as :meth:`authorize` but the registration with SagePay doesn't block the caller
+
+        The transaction is saved straight away, the registration response is saved when the get method of the returned
+        object is called.
+
+        :returns: :class:`PendingRegistration` instance
+        """
+        transaction = self._create_transaction(order_number, basket, amount, shipping_address, billing_address,
+                                               card_token)
+        result = self.async_gateway.register_payment(transaction, save_card)
+        return PendingRegistration(self, transaction, result)
+
+    def _create_transaction(self, order_number, basket, amount, shipping_address, billing_address, card_token):
         """
-        description = ''
-        for l in basket.lines.all():
-            description = description + l.product.title + ', '
+        Build and save the SagePay transaction from the Oscar objects
+
+        :returns: :class:`sagepay.models.SagePayTransaction` instance
+        """
+        description, basket_field = self.basket_builder.build(basket, amount)
 
         # billing address can be "None" if a saved card is used, let's build the billing_address dictionary from the token
         if card_token is not None and billing_address is None:
@@ -67,10 +153,8 @@ class Facade(object):
             delivery_address2 = billing_address['line2']
             delivery_city = billing_address['line4']
             delivery_postcode = billing_address['postcode']
-            if card_token is not None:
-                delivery_country = CountryCode.objects.get(name__iexact=billing_address['country'].name)
-            else:
-                delivery_country = CountryCode.objects.get(name__iexact=billing_address['country'].printable_name)
+            # Oscar country, or the SagePay one of the transaction the saved card was used with
+            delivery_country = country_resolver.country_code(billing_address['country'])
         else:
             delivery_firstnames=shipping_address.first_name
             delivery_surname=shipping_address.last_name
@@ -78,7 +162,7 @@ class Facade(object):
             delivery_address2=shipping_address.line2
             delivery_city=shipping_address.line4
             delivery_postcode=shipping_address.postcode
-            delivery_country = CountryCode.objects.get(name__iexact=shipping_address.country.printable_name)
+            delivery_country = country_resolver.country_code(shipping_address.country)
 
         # the sagepay transaction must be saved in the database before proceeding
         transaction = SagePayTransaction(
@@ -87,7 +171,8 @@ class Facade(object):
                 tx_type='PAYMENT',
                 amount=amount,
                 currency='GBP',
-                description=utf8_truncate(description, 100),
+                description=description,
+                basket=basket_field,
                 delivery_firstnames=delivery_firstnames,
                 delivery_surname=delivery_surname,
                 delivery_address1=delivery_address1,
@@ -110,10 +195,8 @@ class Facade(object):
             transaction.billing_postcode = billing_address['postcode']
             transaction.billing_state = ''
             transaction.billing_phone = ''
-            if card_token is not None:
-                transaction.billing_country = CountryCode.objects.get(name__iexact=billing_address['country'].name)
-            else:
-                transaction.billing_country = CountryCode.objects.get(name__iexact=billing_address['country'].printable_name)
+            # Oscar country, or the SagePay one of the transaction the saved card was used with
+            transaction.billing_country = country_resolver.country_code(billing_address['country'])
         else:
             transaction.billing_firstnames = shipping_address.first_name
             transaction.billing_surname = shipping_address.last_name
@@ -121,13 +204,13 @@ class Facade(object):
             transaction.billing_address2 = shipping_address.line2
             transaction.billing_city = shipping_address.line4
             transaction.billing_postcode = shipping_address.postcode
-            transaction.billing_country = CountryCode.objects.get(name__iexact=shipping_address.country.printable_name)
+            transaction.billing_country = country_resolver.country_code(shipping_address.country)
             transaction.billing_state = ''
             transaction.billing_phone = ''
         if card_token is not None:
             transaction.token = Token.objects.get(token=card_token)
         transaction.save()
-        return self._register_payment(transaction, save_card)
+        return transaction
 
     def _register_payment(self, transaction, saved_card):
         """
@@ -138,12 +221,22 @@ class Facade(object):
         """
         try:
             response, status = self.gateway.register_payment(transaction, saved_card)
-            if response.is_successful:
-                return self._save_server_registration_response(transaction, response)
-            else:
-                raise InvalidGatewayRequestError('Sage server wrong request, this should happen in development only: %s' % response)
         except GatewayException:
             raise PaymentError('Unable to contact SagePay server')
+        return self._registration_response(transaction, response)
+
+    def _registration_response(self, transaction, response):
+        """
+        :param transaction: the ongoing transaction
+        :type transaction: :class:`sagepay.models.SagePayTransaction` instance
+        :param response: registration payment response
+        :type response: :class:`sagepay.core.Response` instance
+        :returns: str -- transaction id
+        """
+        if response.is_successful:
+            return self._save_server_registration_response(transaction, response)
+        else:
+            raise InvalidGatewayRequestError('Sage server wrong request, this should happen in development only: %s' % response)
 
 
     def _save_server_registration_response(self, transaction, response):
@@ -165,21 +258,42 @@ class Facade(object):
         transaction_response.save()
         # update the transaction model with the sage response model's id
         transaction.transaction_registration_server_response = transaction_response
-        transaction.save()
+        transaction.vps_tx_id = transaction_response.vps_tx_id
+        # a registration retried by the gateway was sent with a new VendorTxCode
+        transaction.vendor_tx_code = response.vendor_tx_code or transaction.vendor_tx_code
+        transaction.modified = now()
+        SagePayTransaction.objects.filter(pk=transaction.pk).update(
+            transaction_registration_server_response=transaction_response, vps_tx_id=transaction.vps_tx_id,
+            vendor_tx_code=transaction.vendor_tx_code, modified=transaction.modified)
         return response['VPSTxId']
 
-    def _sage_transaction_from_tx_id(self, tx_id):
+    def _sage_transaction_from_tx_id(self, tx_id, *related):
         """
         Return the SagePay transaction from its id
 
+        The primary keys of the recent transactions are cached, a transaction saved before its vps_tx_id was stored is
+        found through its registration and gets it.
+
         :param tx_id: Id of SagePay transaction
         :type tx_id: str
+        :param related: relations fetched with the transaction
+        :type related: str
         :returns: :class:`sagepay.models.SagePayTransaction` instance
         """
-        transaction_registration_server_response = TransactionRegistrationServerResponse.objects.get(vps_tx_id=tx_id)
-        sage_transaction = SagePayTransaction.objects.get(
-            transaction_registration_server_response = transaction_registration_server_response
-        )
+        transactions = SagePayTransaction.objects.select_related(*related) if related else SagePayTransaction.objects
+        pk = transaction_ids.get(tx_id)
+        if pk is not None:
+            try:
+                return transactions.get(pk=pk, vps_tx_id=tx_id)
+            except SagePayTransaction.DoesNotExist:
+                transaction_ids.discard(tx_id)
+        try:
+            sage_transaction = transactions.get(vps_tx_id=tx_id)
+        except SagePayTransaction.DoesNotExist:
+            sage_transaction = transactions.get(transaction_registration_server_response__vps_tx_id=tx_id)
+            SagePayTransaction.objects.filter(pk=sage_transaction.pk).update(vps_tx_id=tx_id)
+            sage_transaction.vps_tx_id = tx_id
+        transaction_ids.set(tx_id, sage_transaction.pk)
         return sage_transaction
 
     def order_basket_amount_from_tx_id(self, tx_id):
@@ -203,63 +317,93 @@ class Facade(object):
         """
         Check if the SagePay server transaction notification is valid (Md5 hash) and build the response for the right status
 
+        The transaction, its registration and last notification are fetched with one query, whatever sage says the
+        notification is saved and linked to the transaction in a single database transaction. SagePay posts the
+        notification again when the reply is slow: a signed notification is processed once per VPSTxId and Status, its
+        retries get the reply stored the first time without being validated or saved again.
+
         :param response: SagePay transaction notification response
         :type response: dict
         :returns: str --  In the right Sage format
         """
-        tresponse = TransactionNotificationPostResponse(response)
-        # whatever sage says we save the response in the database and link it to the original transaction
-        post_response_model = self._save_transaction_notification_post_response(tresponse)
-        try:
-            validate = self._validate_transaction_notification(tresponse)
-        except TransactionDoesNotExistException:
-            return "Status=ERROR\r\nRedirectURL=http://109.204.98.107/checkout/thankyou/\r\n&StatusDetail=Transaction doesn't exist\r\n"
+        metrics = get_metrics()
+        with metrics.stage('facade.notification'):
+            tresponse = TransactionNotificationPostResponse(response)
+            try:
+                sage_transaction = self._sage_transaction_from_tx_id(
+                    tresponse.get('VPSTxId', ''), 'transaction_registration_server_response', 'oscar_basket',
+                    'notification_post_response')
+            except SagePayTransaction.DoesNotExist:
+                sage_transaction = None
+            notification = self._processed_notification(tresponse, sage_transaction)
+            if notification is None:
+                reply_text, hash_match = self._notification_reply(tresponse, sage_transaction)
+                notification = self._save_transaction_notification_post_response(tresponse, sage_transaction,
+                                                                                  hash_match, reply_text)
+            else:
+                metrics.increment('%s.facade.notification.replayed' % metrics.prefix)
+        metrics.status('facade.notification', tresponse.get('Status', None))
+        return notification.reply_text
+
+    def _processed_notification(self, tresponse, sage_transaction):
+        """
+        Return the signed notification already processed for the transaction and status of `tresponse`, the last one
+        linked to the transaction, or None
+
+        :param tresponse: SagePay transaction notification response
+        :type tresponse: :class:`sagepay.core.TransactionNotificationPostResponse` instance
+        :param sage_transaction: the notified transaction, fetched with its notification, or None
+        :type sage_transaction: :class:`sagepay.models.SagePayTransaction` instance
+        :returns: :class:`sagepay.models.NotificationPostResponse` instance or None
+        """
+        if sage_transaction is None or sage_transaction.notification_post_response is None:
+            return None
+        notification = sage_transaction.notification_post_response
+        if notification.notification_key == NotificationPostResponse.key(sage_transaction.vps_tx_id,
+                                                                         tresponse.get('Status', '')):
+            return notification
+        return None
+
+    def _notification_reply(self, tresponse, sage_transaction):
+        """
+        Build the reply to the notification
+
+        :param tresponse: SagePay transaction notification response
+        :type tresponse: :class:`sagepay.core.TransactionNotificationPostResponse` instance
+        :param sage_transaction: the notified transaction or None if it doesn't exist
+        :type sage_transaction: :class:`sagepay.models.SagePayTransaction` instance
+        :returns: tuple -- (reply text, hash match)
+        """
+        if sage_transaction is None:
+            return "Status=ERROR\r\nRedirectURL=http://109.204.98.107/checkout/thankyou/\r\n&StatusDetail=Transaction doesn't exist\r\n", False
         # sage post response has been tampered with!!
-        if not validate:
-            reply_text = "Status=INVALID\r\nRedirectURL=http://109.204.98.107/checkout/thankyou/\r\n&StatusDetail=Hash not matching\r\n"
-            post_response_model.hash_match = False
-            post_response_model.replied = True
-            post_response_model.reply_text = reply_text
-            post_response_model.save()
-            return reply_text
-        if tresponse.ok:
-            redirect_url = THANK_YOU_URL + tresponse['VPSTxId']
-            reply_text = "Status=OK\r\nRedirectURL=%s\r\n" % (redirect_url)
-            post_response_model.hash_match = True
-            post_response_model.replied = True
-            post_response_model.reply_text = reply_text
-            post_response_model.save()
-            return reply_text
-        elif tresponse.notauthed:
-            redirect_url = ERROR_URL + '1'
-            reply_text = "Status=OK\r\nRedirectURL=%s\r\n" % (redirect_url)
-            post_response_model.replied = True
-            post_response_model.reply_text = reply_text
-            return reply_text
-        elif tresponse.abort:
-            redirect_url = ERROR_URL + '2'
-            reply_text = "Status=OK\r\nRedirectURL=%s\r\n" % (redirect_url)
-            post_response_model.replied = True
-            post_response_model.reply_text = reply_text
-            return reply_text
-        elif tresponse.rejected:
-            redirect_url = ERROR_URL + '3'
-            reply_text = "Status=OK\r\nRedirectURL=%s\r\n" % (redirect_url)
-            post_response_model.replied = True
-            post_response_model.reply_text = reply_text
-            return reply_text
-        elif tresponse.authenticated:
-            return ''
-        elif tresponse.error:
-            return ''
-
-    def _save_transaction_notification_post_response(self, response):
+        if not self._validate_transaction_notification(tresponse, sage_transaction.transaction_registration_server_response):
+            return "Status=INVALID\r\nRedirectURL=http://109.204.98.107/checkout/thankyou/\r\n&StatusDetail=Hash not matching\r\n", False
+        status = tresponse.status_code
+        if status == Status.OK:
+            redirect_url = self.urls['thank_you'] + tresponse['VPSTxId']
+            return "Status=OK\r\nRedirectURL=%s\r\n" % (redirect_url), True
+        elif status in ERROR_REDIRECTS:
+            redirect_url = self.urls['error'] + ERROR_REDIRECTS[status]
+            return "Status=OK\r\nRedirectURL=%s\r\n" % (redirect_url), True
+        elif status in (Status.AUTHENTICATED, Status.ERROR):
+            return '', True
+        return None, True
+
+    @db_transaction.commit_on_success
+    def _save_transaction_notification_post_response(self, response, sage_transaction, hash_match, reply_text):
         """
         Save the SagePay transaction notification response and link it to the initial transaction
 
         :param response: SagePay transaction notification response
-        :type response: class:`sagepay.models.TransactionNotificationResponse` instance
-        :returns: class:`sagepay.models.NotificationPostResponse` instance
+        :type response: :class:`sagepay.core.TransactionNotificationPostResponse` instance
+        :param sage_transaction: the notified transaction or None if it doesn't exist
+        :type sage_transaction: :class:`sagepay.models.SagePayTransaction` instance
+        :param hash_match: the notification signature is valid
+        :type hash_match: bool
+        :param reply_text: reply sent to SagePay
+        :type reply_text: str
+        :returns: class:`sagepay.models.NotificationPostResponse` instance, the one saved first for a retry
         """
         post_response_model = NotificationPostResponse(
             vps_protocol=response.get('VPSProtocol',''),
@@ -273,48 +417,137 @@ class Facade(object):
             address_result=response.get('AddressResult',''),
             postcode_result=response.get('PostCodeResult',''),
             cv2_result=response.get('CV2Result',''),
-            gift_aid=response.get('GiftAid',''),
+            gift_aid=response.get('GiftAid','') == '1',
             threed_secure_status=response.get('3DSecureStatus',''),
             cavv=response.get('CAVV',''),
+            address_status=response.get('AddressStatus', ''),
+            payer_status=response.get('PayerStatus', ''),
+            fraud_response=response.get('FraudResponse', ''),
             card_type=response.get('CardType',''),
             last_4_digits=response.get('Last4Digits',''),
             decline_code=response.get('DeclineCode',''),
             expiry_date=response.get('ExpiryDate',''),
-            bank_auth_ode=response.get('BankAuthCode', '')
+            bank_auth_ode=response.get('BankAuthCode', ''),
+            vps_signature=response.get('VPSSignature', ''),
+            hash_match=hash_match,
+            replied=bool(reply_text),
+            reply_text=reply_text,
         )
-        post_response_model.save()
+        if hash_match:
+            post_response_model.notification_key = NotificationPostResponse.key(post_response_model.vps_tx_id,
+                                                                                post_response_model.status)
+            sid = db_transaction.savepoint()
+            try:
+                post_response_model.save()
+                db_transaction.savepoint_commit(sid)
+            except IntegrityError:
+                # a retry processed concurrently, or an older status notified again
+                db_transaction.savepoint_rollback(sid)
+                return NotificationPostResponse.objects.get(notification_key=post_response_model.notification_key)
+        else:
+            post_response_model.save()
+        if sage_transaction is None:
+            return post_response_model
+        # the rollup moves the transaction from the row of the notification it had, fetched with it
+        previous = sage_transaction.notification_post_response if sage_transaction.notification_post_response_id \
+            else None
         # link the sage transaction to the post notification
-        sage_transaction = self._sage_transaction_from_tx_id(response['VPSTxId'])
-        sage_transaction.notification_post_response = post_response_model
-        sage_transaction.save()
-        # the user wants to save the credit card details
-        if 'Token' in response:
-            token = self._save_credit_card_token(response, sage_transaction)
-            sage_transaction.token = token
-            sage_transaction.save()
+        changes = {'notification_post_response': post_response_model, 'modified': now()}
+        # the user wants to save the credit card details, never trust a token from a notification not signed by sage
+        token = ''
+        if hash_match and 'Token' in response and sage_transaction.oscar_basket.owner_id is not None:
+            token = response['Token']
+        if token and not NOTIFICATION_QUEUE:
+            # the transaction was just read with its token_id
+            token_object = self._save_notified_token(token, post_response_model, sage_transaction)
+            if token_object is not None:
+                changes['token'] = token_object
+        SagePayTransaction.objects.filter(pk=sage_transaction.pk).update(**changes)
+        for name, value in changes.items():
+            setattr(sage_transaction, name, value)
+        if not hash_match:
+            return post_response_model
+        if not NOTIFICATION_QUEUE:
+            self._notification_processed(sage_transaction, post_response_model, previous)
+        elif token or ROLLUP_ON_NOTIFICATION or notification_processed.receivers:
+            # done by the process_notifications command, saved with the notification
+            enqueue(sage_transaction, post_response_model, token, previous)
         return post_response_model
 
-    def _save_credit_card_token(self, response, sage_transaction):
+    @db_transaction.commit_on_success
+    def process_notification(self, sage_transaction, notification, token='', previous=None):
+        """
+        Do the work following a signed notification which was queued in its own database transaction: save the card
+        token, count the notification in the rollup and send :data:`sagepay.signals.notification_processed`
+
+        :param sage_transaction: notified transaction
+        :type sage_transaction: :class:`sagepay.models.SagePayTransaction` instance
+        :param notification: its notification
+        :type notification: :class:`sagepay.models.NotificationPostResponse` instance
+        :param token: card token to save for the customer, if any
+        :type token: str
+        :param previous: the notification the transaction was linked to before, None if it had none
+        :type previous: :class:`sagepay.models.NotificationPostResponse` instance
+        """
+        self._process_notification(sage_transaction, notification, token, previous)
+
+    def _process_notification(self, sage_transaction, notification, token='', previous=None):
+        # in the database transaction of the caller: commit_on_success doesn't nest before Django 1.6, the queue
+        # worker's would be committed early
+        if token:
+            # read again, the transaction was loaded when the task was claimed
+            sage_transaction.token_id = SagePayTransaction.objects.filter(pk=sage_transaction.pk).values_list(
+                'token_id', flat=True)[0]
+            token_object = self._save_notified_token(token, notification, sage_transaction)
+            if token_object is not None:
+                SagePayTransaction.objects.filter(pk=sage_transaction.pk).update(token=token_object)
+                sage_transaction.token = token_object
+        self._notification_processed(sage_transaction, notification, previous)
+
+    def _notification_processed(self, sage_transaction, notification, previous):
+        if ROLLUP_ON_NOTIFICATION:
+            record_notification(sage_transaction, notification, previous)
+        notification_processed.send(sender=self.__class__, sage_transaction=sage_transaction,
+                                    notification=notification)
+
+    def _save_notified_token(self, token, notification, sage_transaction):
         """
-        Save the
+        Save the card token of a signed notification, inline or queued, unless the transaction has a token already: it
+        was paid with a saved card or its token was saved before
+
+        :param token: token sent in the notification
+        :type token: str
+        :param notification: the notification, with the card details
+        :type notification: :class:`sagepay.models.NotificationPostResponse` instance
+        :param sage_transaction: the notified transaction, its token_id read in the current database transaction
+        :type sage_transaction: :class:`sagepay.models.SagePayTransaction` instance
+        :returns: :class:`sagepay.models.Token` instance to link to the transaction, None if it keeps its token
+        """
+        if sage_transaction.token_id is not None:
+            return None
+        return self._save_credit_card_token(token, notification, sage_transaction)
 
-        :param response: SagePay transaction notification response
-        :type response: class:`sagepay.models.TransactionNotificationResponse` instance
-        :returns:
+    def _save_credit_card_token(self, token, notification, sage_transaction):
+        """
+        Save the credit card token sent by SagePay
+
+        :param token: token sent in the notification
+        :type token: str
+        :param notification: the notification, with the card details
+        :type notification: :class:`sagepay.models.NotificationPostResponse` instance
+        :returns: :class:`sagepay.models.Token` instance
         """
-        user = sage_transaction.oscar_basket.owner
-        token = response['Token']
-        last_4_digits = response['Last4Digits']
-        card_type = response['CardType']
-        expiry_date = response['ExpiryDate']
-        token_object = Token(token=token, user=user, last_4_digits=last_4_digits, card_type=card_type, expiry_date=expiry_date)
+        user_id = sage_transaction.oscar_basket.owner_id
+        token_object = Token(token=token, user_id=user_id, last_4_digits=notification.last_4_digits,
+                             card_type=notification.card_type, expiry_date=notification.expiry_date)
         token_object.save()
+        return token_object
 
     def check_credit_card_exist(self):
         pass
 
     def get_credit_cards(self, user):
-        return Token.objects.filter(user=user)
+        return Token.objects.unexpired().filter(user=user)
 
     def delete_token(self, token):
         """
@@ -326,30 +559,59 @@ class Facade(object):
         """
         return  self.gateway.delete_token(token)
 
-    def _validate_transaction_notification(self, tresponse):
+    def delete_tokens(self, tokens, workers=ASYNC_WORKERS):
+        """
+        Remove many tokens from SagePay with concurrent requests, then delete the removed ones from the database in
+        chunks. Tokens SagePay didn't remove are kept so the operation can be run again.
+
+        The requests run on the thread pool of :class:`sagepay.gateway.AsyncGateway`, shared by the process.
+
+        :param tokens: tokens to be deleted
+        :type tokens: queryset of :class:`sagepay.models.Token`
+        :param workers: maximum number of concurrent requests to SagePay, the pool runs SAGEPAY_ASYNC_WORKERS at most
+        :type workers: int
+        :returns: dict -- token id: (removed, detail) where detail is the SagePay status detail or the error
+        """
+        results = {}
+        pool = self.async_gateway.workers
+        pending = deque()
+
+        def collect(pk, result):
+            try:
+                response = result.get()
+            except GatewayException, e:
+                results[pk] = (False, str(e))
+            else:
+                results[pk] = (response.is_successful, response.data.get('StatusDetail', ''))
+
+        for token in tokens.only('id', 'token'):
+            if len(pending) >= workers:
+                collect(*pending.popleft())
+            pending.append((token.pk, pool.apply_async(self.gateway.remove_token,
+                                                       (self.gateway.delete_token_data(token),))))
+        while pending:
+            collect(*pending.popleft())
+        removed = [pk for pk, (status, detail) in results.items() if status]
+        # below the 999 parameters SQLite takes in a query
+        for i in range(0, len(removed), DELETE_CHUNK_SIZE):
+            chunk = removed[i:i + DELETE_CHUNK_SIZE]
+            # keep the transactions paid with the removed cards
+            SagePayTransaction.objects.filter(token__in=chunk).update(token=None)
+            Token.objects.filter(pk__in=chunk).delete()
+        return results
+
+    def _validate_transaction_notification(self, tresponse, registration):
         """
         Validate the response of sage server using the MD5 hash (page 66 of sage manual)
 
         :param notification: SagePay transaction notification response
         :type notification: class:`sagepay.models.TransactionNotificationResponse` instance
+        :param registration: registration of the notified transaction
+        :type registration: :class:`sagepay.models.TransactionRegistrationServerResponse` instance
         :returns: Boolean
         """
-        tx_id = tresponse['VPSTxId']
-        try:
-            transaction_registration_server_response = TransactionRegistrationServerResponse.objects.get(vps_tx_id=tx_id)
-        except TransactionRegistrationServerResponse.DoesNotExist:
-            raise TransactionDoesNotExistException('The transaction id doesn''t match our database')
-        vendor_name = transaction_registration_server_response.vendor.lower()
-        security_key = transaction_registration_server_response.security_key
-        # rebuild the post
-        post = tresponse.post_format(vendor_name, security_key)
-        hash = hashlib.md5(post)
-        # md5 hash returned from sage server is uppercase
-        hash = hash.hexdigest().upper()
-        if hash == tresponse['VPSSignature']:
-            return True
-        else:
-            return False
+        verifier = SignatureVerifier(registration.vendor, registration.security_key)
+        return verifier.verify(tresponse)
 
     def save_billing_address_from_order(self, order):
         """
@@ -360,7 +622,7 @@ class Facade(object):
         :returns:
         """
         transaction = SagePayTransaction.objects.get(oscar_order=order.number)
-        country = OscarCountry.objects.get(printable_name__iexact=transaction.billing_country.name)
+        country = country_resolver.oscar_country(transaction.billing_country)
         billing_address = BillingAddress(
              first_name=transaction.billing_firstnames,
              last_name=transaction.billing_surname,
@@ -374,3 +636,47 @@ class Facade(object):
         order.billing_address = billing_address
         order.save()
 
+
+_facades = {}
+_facades_lock = threading.Lock()
+_override = None
+
+
+def get_facade(site=None):
+    """
+    Return the facade shared by the process for the configuration of the site, it's created on first use
+
+    Facades keep no state between calls, the views share them along with their gateways, connection pool and circuit
+    breakers.
+
+    :param site: site the payment is taken on, the current site if None
+    :type site: :class:`django.contrib.sites.models.Site` instance
+    :returns: :class:`Facade` instance
+    """
+    if _override is not None:
+        return _override
+    urls = site_urls.for_site(site)
+    key = (VENDOR, SAGEPAY_PROFILE, SAGE_SERVER_URL, urls['notification'], urls['thank_you'], urls['error'])
+    try:
+        return _facades[key]
+    except KeyError:
+        with _facades_lock:
+            if key not in _facades:
+                _facades[key] = Facade(site)
+            return _facades[key]
+
+
+@contextmanager
+def override_facade(facade):
+    """
+    Make :func:`get_facade` return `facade`, e.g. a mock in the tests
+
+        with override_facade(mock.Mock(spec=Facade)):
+            response = self.client.post(...)
+    """
+    global _override
+    previous, _override = _override, facade
+    try:
+        yield facade
+    finally:
+        _override = previous
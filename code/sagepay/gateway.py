@@ -1,12 +1,284 @@
-import pprint
+import os
+import time
+import random
+import threading
+import urlparse
 
+from collections import deque
 from decimal import Decimal
+from multiprocessing.pool import ThreadPool
 
 import requests
+from requests.adapters import HTTPAdapter
 
-from .exceptions import GatewayException
+from .exceptions import GatewayException, CircuitOpenException
 from .core import Response
-from .settings import VENDOR, PROTOCOL, DELETE_TOKEN_URL
+from .metrics import get_metrics
+from .settings import VENDOR, PROTOCOL, DELETE_TOKEN_URL, POOL_CONNECTIONS, POOL_MAXSIZE, POOL_BLOCK, \
+    CONNECT_TIMEOUT, READ_TIMEOUT, ASYNC_WORKERS, RETRIES, RETRY_BACKOFF, RETRY_MAX_BACKOFF, CIRCUIT_ERROR_RATE, \
+    CIRCUIT_MIN_REQUESTS, CIRCUIT_WINDOW, CIRCUIT_RESET_TIMEOUT
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """
+    HTTP adapter keeping the connections to the SagePay server alive and counting how often a request has to wait
+    for a free connection
+    """
+    def __init__(self, *args, **kwargs):
+        self.waits = 0
+        self._stats_lock = threading.Lock()
+        super(PooledHTTPAdapter, self).__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        pool = self.get_connection(request.url, kwargs.get('proxies'))
+        # the urllib3 queue is filled with placeholders up to maxsize, if it's empty every connection is busy
+        if pool.pool is not None and pool.pool.empty():
+            with self._stats_lock:
+                self.waits += 1
+        return super(PooledHTTPAdapter, self).send(request, **kwargs)
+
+    def stats(self):
+        """
+        Return the usage statistics of the connection pools
+
+        :returns: dict -- hits (requests served by a kept alive connection), new_connections, waits, requests
+        """
+        requests_count = 0
+        new_connections = 0
+        pools = self.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            requests_count += pool.num_requests
+            new_connections += pool.num_connections
+        return {
+            'requests': requests_count,
+            'new_connections': new_connections,
+            'hits': max(requests_count - new_connections, 0),
+            'waits': self.waits,
+        }
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Return the HTTP session shared by the gateways of the current process, it's created on first use and
+    recreated after a fork so that workers don't share sockets with their parent
+
+    :returns: :class:`requests.Session` instance
+    """
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = PooledHTTPAdapter(pool_connections=POOL_CONNECTIONS,
+                                        pool_maxsize=POOL_MAXSIZE,
+                                        pool_block=POOL_BLOCK)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+            _session_pid = os.getpid()
+        return _session
+
+
+_workers = None
+_workers_pid = None
+_workers_lock = threading.Lock()
+
+
+def get_workers():
+    """
+    Return the pool of threads used by :class:`AsyncGateway` in the current process, one thread per pooled
+    connection
+
+    :returns: :class:`multiprocessing.pool.ThreadPool` instance
+    """
+    global _workers, _workers_pid
+    with _workers_lock:
+        if _workers is None or _workers_pid != os.getpid():
+            _workers = ThreadPool(ASYNC_WORKERS)
+            _workers_pid = os.getpid()
+        return _workers
+
+
+class CircuitBreaker(object):
+    """
+    Stop contacting a server which keeps failing
+
+    The breaker opens when the error rate of the last `window` requests reaches `error_rate`, while open every
+    request fails straight away. After `reset_timeout` seconds it goes half open and lets a single request through:
+    the breaker closes if it succeeds and opens again if it fails. Only connection errors, timeouts and server errors
+    are failures, the requests still running when the breaker opened are ignored.
+
+    :param error_rate: error rate (0-1) opening the breaker
+    :type error_rate: float
+    :param min_requests: minimum number of requests in the window before the error rate is considered
+    :type min_requests: int
+    :param window: number of recent requests the error rate is computed on
+    :type window: int
+    :param reset_timeout: seconds before an open breaker lets a trial request through
+    :type reset_timeout: float
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, error_rate=CIRCUIT_ERROR_RATE, min_requests=CIRCUIT_MIN_REQUESTS, window=CIRCUIT_WINDOW,
+                 reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.error_rate = error_rate
+        self.min_requests = min_requests
+        self.reset_timeout = reset_timeout
+        self.outcomes = deque(maxlen=window)
+        self.state = self.CLOSED
+        self.opened_at = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Tell if a request can be sent to the server
+
+        :returns: False if it can't, else the state it's sent in: CLOSED, or HALF_OPEN for the trial request
+        """
+        with self._lock:
+            if self.state == self.OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.CLOSED:
+                return self.CLOSED
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return self.HALF_OPEN
+            self.rejected += 1
+            return False
+
+    def record_success(self, trial=False):
+        """
+        :param trial: True for the trial request let through by the half open breaker
+        :type trial: bool
+        """
+        with self._lock:
+            if trial:
+                self._close()
+            # a request sent before the breaker opened says nothing about the server now
+            elif self.state == self.CLOSED:
+                self.outcomes.append(True)
+
+    def record_failure(self, trial=False):
+        """
+        :param trial: True for the trial request let through by the half open breaker
+        :type trial: bool
+        """
+        with self._lock:
+            if trial:
+                self._open()
+                return
+            if self.state != self.CLOSED:
+                return
+            self.outcomes.append(False)
+            failures = self.outcomes.count(False)
+            if len(self.outcomes) >= self.min_requests and failures >= self.error_rate * len(self.outcomes):
+                self._open()
+
+    def release(self, trial=False):
+        """
+        Forget a request which failed on this side, a trial request is let through again
+
+        :param trial: True for the trial request let through by the half open breaker
+        :type trial: bool
+        """
+        with self._lock:
+            if trial:
+                self._trial_running = False
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.time()
+        self.times_opened += 1
+        self._trial_running = False
+
+    def _close(self):
+        self.state = self.CLOSED
+        self.opened_at = None
+        self.outcomes.clear()
+        self._trial_running = False
+
+    def stats(self):
+        """
+        Return the state of the breaker for monitoring
+
+        :returns: dict
+        """
+        with self._lock:
+            return {
+                'state': self.state,
+                'requests': len(self.outcomes),
+                'failures': self.outcomes.count(False),
+                'opened_at': self.opened_at,
+                'times_opened': self.times_opened,
+                'rejected': self.rejected,
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(url):
+    """
+    Return the circuit breaker of the server hosting `url`, shared by the gateways of the current process
+
+    :param url: SagePay server URL
+    :type url: str
+    :returns: :class:`CircuitBreaker` instance
+    """
+    host = urlparse.urlsplit(url).netloc
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker()
+        return _breakers[host]
+
+
+def circuit_breakers_stats():
+    """
+    Return the state of every circuit breaker of the current process
+
+    :returns: dict -- host: :meth:`CircuitBreaker.stats`
+    """
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return dict((host, breaker.stats()) for host, breaker in breakers.items())
+
+
+class RegistrationAttempts(object):
+    """
+    POST content of the attempts of a payment registration, given to :meth:`Gateway.post`
+
+    Each retry is sent with a new VendorTxCode: the failed attempt may have reached SagePay, which refuses a
+    VendorTxCode used before. Nothing is saved here, the attempts may run on a thread of :class:`AsyncGateway`.
+
+    :param data: POST content of the first attempt, built by :meth:`Gateway.registration_data`
+    :type data: dict
+    """
+    def __init__(self, data):
+        self.data = data
+        # VendorTxCode of the last attempt sent
+        self.vendor_tx_code = data['VendorTxCode']
+
+    def __call__(self, attempt):
+        if attempt:
+            from .models import new_vendor_tx_code
+
+            self.vendor_tx_code = new_vendor_tx_code()
+            return dict(self.data, VendorTxCode=self.vendor_tx_code)
+        return self.data
+
 
 class Gateway(object):
     """
@@ -18,18 +290,75 @@ class Gateway(object):
     :type notification_url: str
     :param sage_server_url: SagePay server fully qualified URL
     :type sage_server_url: str
+    :param session: HTTP session to use, defaults to the connection pool shared by the process
+    :type session: :class:`requests.Session` instance
     """
-    def __init__(self, profile, notification_url, sage_server_url):
+    def __init__(self, profile, notification_url, sage_server_url, session=None):
         self.profile = profile
         self.notification_url = notification_url
         self.sage_server_url = sage_server_url
+        self._session = session
+        self.timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+    @property
+    def session(self):
+        # resolved on each use so that a gateway shared by the process follows the session across forks
+        return self._session or get_session()
+
+    def post(self, url, data, retries=0):
+        """
+        POST `data` to the SagePay server
+
+        Failed requests are retried up to `retries` times with a jittered exponential backoff, no request is sent
+        while the circuit breaker of the server is open.
 
-    def post(self, url, data):
-        try:
-            t = requests.post(url, data=data)
-            return Response(t.text)
-        except (requests.ConnectionError, requests.Timeout):
-            raise GatewayException('Something went wrong while contacting the SagePay server')
+        :param url: SagePay server URL
+        :type url: str
+        :param data: POST content, or a callable taking the attempt number (0 first) and returning it for the
+            requests which must change when they're sent again
+        :type data: dict
+        :param retries: number of retries after a connection error, timeout or server error
+        :type retries: int
+        :returns: :class:`sagepay.core.Response` instance
+        """
+        metrics = get_metrics()
+        with metrics.stage('gateway.post'):
+            response = self._post(url, data, retries)
+        if metrics.enabled:
+            metrics.status('gateway.post', response.data.get('Status'))
+        return response
+
+    def _post(self, url, data, retries):
+        breaker = get_circuit_breaker(url)
+        attempt = 0
+        while True:
+            content = data(attempt) if callable(data) else data
+            state = breaker.allow()
+            if not state:
+                raise CircuitOpenException('The SagePay server is failing, requests are suspended')
+            trial = state == breaker.HALF_OPEN
+            try:
+                t = self.session.post(url, data=content, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                failed = True
+            except Exception:
+                # a bug on this side says nothing about the server, a trial request must not be left running though
+                breaker.release(trial)
+                raise
+            else:
+                failed = t.status_code >= 500
+            if not failed:
+                breaker.record_success(trial)
+                return Response(t.text)
+            breaker.record_failure(trial)
+            if attempt >= retries:
+                raise GatewayException('Something went wrong while contacting the SagePay server')
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def _backoff(self, attempt):
+        # full jitter: spread the retries of concurrent checkouts
+        return random.uniform(0, min(RETRY_MAX_BACKOFF, RETRY_BACKOFF * 2 ** attempt))
 
     def register_payment(self, transaction, save_card):
         """
@@ -41,7 +370,20 @@ class Gateway(object):
         :type token: bool
         :param store_token: save or not the token
         :type store_token: bool
-        :returns: Tuple -- (:class:`sagepay.core.Response` instance, boolean) Boolean is False if the gateway failed to contact the server
+        :returns: Tuple -- (:class:`sagepay.core.Response` instance, boolean) Boolean is False if the gateway failed to contact the server.
+            The vendor_tx_code of the response is the VendorTxCode SagePay answered, a new one if the registration was retried
+        """
+        return self._register(RegistrationAttempts(self.registration_data(transaction, save_card)))
+
+    def registration_data(self, transaction, save_card):
+        """
+        Build the payment registration POST content
+
+        :param transaction: The transaction saved into the database
+        :type transaction: :class:`sagepay.models.SagePayTransaction` instance
+        :param save_card: generate or not a token
+        :type save_card: bool
+        :returns: dict
         """
         data = dict(
             Profile=self.profile,
@@ -78,14 +420,16 @@ class Gateway(object):
             data['CreateToken'] = int(save_card)
         if transaction.token is not None:
             data['Token'] = transaction.token.token_transaction_format
+        return data
 
-        response = self.post(self.sage_server_url, data)
+    def _register(self, attempts):
+        response = self.post(self.sage_server_url, attempts, retries=RETRIES)
+        response.vendor_tx_code = attempts.vendor_tx_code
         if response.is_successful:
             return (response, True)
         else:
             return (response, False)
 
-
     def delete_token(self, token):
         """
 
@@ -93,18 +437,104 @@ class Gateway(object):
         :type token: :class:`sagepay.models.Token` instance
         :returns: boolean
         """
-        data = dict(
+        return self._delete_token(self.delete_token_data(token))
+
+    def delete_token_data(self, token):
+        """
+        Build the REMOVETOKEN POST content
+
+        :param token: Token to be deleted
+        :type token: :class:`sagepay.models.Token` instance
+        :returns: dict
+        """
+        return dict(
             VPSProtocol=PROTOCOL,
             TxType='REMOVETOKEN',
             Vendor=VENDOR,
             Token=token.token
         )
-        pprint.pprint(data)
-        response = self.post(DELETE_TOKEN_URL, data=data)
+
+    def _delete_token(self, data):
+        response = self.remove_token(data)
         if response.is_successful:
             return True
         else:
             return False
 
+    def remove_token(self, data):
+        """
+        Send a REMOVETOKEN request
+
+        :param data: POST content built by :meth:`delete_token_data`
+        :type data: dict
+        :returns: :class:`sagepay.core.Response` instance
+        """
+        return self.post(DELETE_TOKEN_URL, data=data)
+
+    def pool_stats(self):
+        """
+        Return the statistics of the connection pool used by the gateway
+
+        :returns: dict
+        """
+        return self.session.get_adapter(self.sage_server_url).stats()
+
+    def circuit_stats(self):
+        """
+        Return the state of the circuit breaker of the SagePay server
+
+        :returns: dict
+        """
+        return get_circuit_breaker(self.sage_server_url).stats()
+
 
+class AsyncGateway(Gateway):
+    """
+    Gateway that doesn't block the caller while waiting for the SagePay server
+
+    The POST content is built in the calling thread (it may hit the database), the request itself runs in a process
+    wide pool of threads sharing the gateway connection pool, which never touches the database: the new VendorTxCode of
+    a registration retried comes back with the response and is saved by the facade.
+    :meth:`register_payment` and :meth:`delete_token` return a :class:`multiprocessing.pool.AsyncResult`, its get method
+    returns what :class:`Gateway` would have returned or raises the same :class:`sagepay.exceptions.GatewayException`.
+
+    :param workers: thread pool running the requests, defaults to the pool shared by the process
+    :type workers: :class:`multiprocessing.pool.ThreadPool` instance
+    """
+    def __init__(self, profile, notification_url, sage_server_url, session=None, workers=None):
+        super(AsyncGateway, self).__init__(profile, notification_url, sage_server_url, session)
+        self._workers = workers
 
+    @property
+    def workers(self):
+        # the shared pool is started on first use, not when the gateway is built
+        return self._workers or get_workers()
+
+    def register_payment(self, transaction, save_card):
+        attempts = RegistrationAttempts(self.registration_data(transaction, save_card))
+        return self.workers.apply_async(self._register, (attempts,))
+
+    def delete_token(self, token):
+        data = self.delete_token_data(token)
+        return self.workers.apply_async(self._delete_token, (data,))
+
+
+_gateways = {}
+_gateways_lock = threading.Lock()
+
+
+def get_gateway(profile, notification_url, sage_server_url, gateway_class=Gateway):
+    """
+    Return the gateway shared by the process for this configuration, it's created on first use
+
+    :param gateway_class: :class:`Gateway` or :class:`AsyncGateway`
+    :returns: `gateway_class` instance
+    """
+    key = (gateway_class, profile, notification_url, sage_server_url)
+    try:
+        return _gateways[key]
+    except KeyError:
+        with _gateways_lock:
+            if key not in _gateways:
+                _gateways[key] = gateway_class(profile, notification_url, sage_server_url)
+            return _gateways[key]
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+ISO 3166-1 countries: (alpha-2, alpha-3, numeric, short name), bundled so the countries load without network access
+"""
+
+COUNTRIES = (
+    ('AD', 'AND', 20, u'Andorra'),
+    ('AE', 'ARE', 784, u'United Arab Emirates'),
+    ('AF', 'AFG', 4, u'Afghanistan'),
+    ('AG', 'ATG', 28, u'Antigua and Barbuda'),
+    ('AI', 'AIA', 660, u'Anguilla'),
+    ('AL', 'ALB', 8, u'Albania'),
+    ('AM', 'ARM', 51, u'Armenia'),
+    ('AO', 'AGO', 24, u'Angola'),
+    ('AQ', 'ATA', 10, u'Antarctica'),
+    ('AR', 'ARG', 32, u'Argentina'),
+    ('AS', 'ASM', 16, u'American Samoa'),
+    ('AT', 'AUT', 40, u'Austria'),
+    ('AU', 'AUS', 36, u'Australia'),
+    ('AW', 'ABW', 533, u'Aruba'),
+    ('AX', 'ALA', 248, u'Åland Islands'),
+    ('AZ', 'AZE', 31, u'Azerbaijan'),
+    ('BA', 'BIH', 70, u'Bosnia and Herzegovina'),
+    ('BB', 'BRB', 52, u'Barbados'),
+    ('BD', 'BGD', 50, u'Bangladesh'),
+    ('BE', 'BEL', 56, u'Belgium'),
+    ('BF', 'BFA', 854, u'Burkina Faso'),
+    ('BG', 'BGR', 100, u'Bulgaria'),
+    ('BH', 'BHR', 48, u'Bahrain'),
+    ('BI', 'BDI', 108, u'Burundi'),
+    ('BJ', 'BEN', 204, u'Benin'),
+    ('BL', 'BLM', 652, u'Saint Barthélemy'),
+    ('BM', 'BMU', 60, u'Bermuda'),
+    ('BN', 'BRN', 96, u'Brunei Darussalam'),
+    ('BO', 'BOL', 68, u'Bolivia, Plurinational State of'),
+    ('BQ', 'BES', 535, u'Bonaire, Sint Eustatius and Saba'),
+    ('BR', 'BRA', 76, u'Brazil'),
+    ('BS', 'BHS', 44, u'Bahamas'),
+    ('BT', 'BTN', 64, u'Bhutan'),
+    ('BV', 'BVT', 74, u'Bouvet Island'),
+    ('BW', 'BWA', 72, u'Botswana'),
+    ('BY', 'BLR', 112, u'Belarus'),
+    ('BZ', 'BLZ', 84, u'Belize'),
+    ('CA', 'CAN', 124, u'Canada'),
+    ('CC', 'CCK', 166, u'Cocos (Keeling) Islands'),
+    ('CD', 'COD', 180, u'Congo, The Democratic Republic of the'),
+    ('CF', 'CAF', 140, u'Central African Republic'),
+    ('CG', 'COG', 178, u'Congo'),
+    ('CH', 'CHE', 756, u'Switzerland'),
+    ('CI', 'CIV', 384, u"Côte d'Ivoire"),
+    ('CK', 'COK', 184, u'Cook Islands'),
+    ('CL', 'CHL', 152, u'Chile'),
+    ('CM', 'CMR', 120, u'Cameroon'),
+    ('CN', 'CHN', 156, u'China'),
+    ('CO', 'COL', 170, u'Colombia'),
+    ('CR', 'CRI', 188, u'Costa Rica'),
+    ('CU', 'CUB', 192, u'Cuba'),
+    ('CV', 'CPV', 132, u'Cabo Verde'),
+    ('CW', 'CUW', 531, u'Curaçao'),
+    ('CX', 'CXR', 162, u'Christmas Island'),
+    ('CY', 'CYP', 196, u'Cyprus'),
+    ('CZ', 'CZE', 203, u'Czechia'),
+    ('DE', 'DEU', 276, u'Germany'),
+    ('DJ', 'DJI', 262, u'Djibouti'),
+    ('DK', 'DNK', 208, u'Denmark'),
+    ('DM', 'DMA', 212, u'Dominica'),
+    ('DO', 'DOM', 214, u'Dominican Republic'),
+    ('DZ', 'DZA', 12, u'Algeria'),
+    ('EC', 'ECU', 218, u'Ecuador'),
+    ('EE', 'EST', 233, u'Estonia'),
+    ('EG', 'EGY', 818, u'Egypt'),
+    ('EH', 'ESH', 732, u'Western Sahara'),
+    ('ER', 'ERI', 232, u'Eritrea'),
+    ('ES', 'ESP', 724, u'Spain'),
+    ('ET', 'ETH', 231, u'Ethiopia'),
+    ('FI', 'FIN', 246, u'Finland'),
+    ('FJ', 'FJI', 242, u'Fiji'),
+    ('FK', 'FLK', 238, u'Falkland Islands (Malvinas)'),
+    ('FM', 'FSM', 583, u'Micronesia, Federated States of'),
+    ('FO', 'FRO', 234, u'Faroe Islands'),
+    ('FR', 'FRA', 250, u'France'),
+    ('GA', 'GAB', 266, u'Gabon'),
+    ('GB', 'GBR', 826, u'United Kingdom'),
+    ('GD', 'GRD', 308, u'Grenada'),
+    ('GE', 'GEO', 268, u'Georgia'),
+    ('GF', 'GUF', 254, u'French Guiana'),
+    ('GG', 'GGY', 831, u'Guernsey'),
+    ('GH', 'GHA', 288, u'Ghana'),
+    ('GI', 'GIB', 292, u'Gibraltar'),
+    ('GL', 'GRL', 304, u'Greenland'),
+    ('GM', 'GMB', 270, u'Gambia'),
+    ('GN', 'GIN', 324, u'Guinea'),
+    ('GP', 'GLP', 312, u'Guadeloupe'),
+    ('GQ', 'GNQ', 226, u'Equatorial Guinea'),
+    ('GR', 'GRC', 300, u'Greece'),
+    ('GS', 'SGS', 239, u'South Georgia and the South Sandwich Islands'),
+    ('GT', 'GTM', 320, u'Guatemala'),
+    ('GU', 'GUM', 316, u'Guam'),
+    ('GW', 'GNB', 624, u'Guinea-Bissau'),
+    ('GY', 'GUY', 328, u'Guyana'),
+    ('HK', 'HKG', 344, u'Hong Kong'),
+    ('HM', 'HMD', 334, u'Heard Island and McDonald Islands'),
+    ('HN', 'HND', 340, u'Honduras'),
+    ('HR', 'HRV', 191, u'Croatia'),
+    ('HT', 'HTI', 332, u'Haiti'),
+    ('HU', 'HUN', 348, u'Hungary'),
+    ('ID', 'IDN', 360, u'Indonesia'),
+    ('IE', 'IRL', 372, u'Ireland'),
+    ('IL', 'ISR', 376, u'Israel'),
+    ('IM', 'IMN', 833, u'Isle of Man'),
+    ('IN', 'IND', 356, u'India'),
+    ('IO', 'IOT', 86, u'British Indian Ocean Territory'),
+    ('IQ', 'IRQ', 368, u'Iraq'),
+    ('IR', 'IRN', 364, u'Iran, Islamic Republic of'),
+    ('IS', 'ISL', 352, u'Iceland'),
+    ('IT', 'ITA', 380, u'Italy'),
+    ('JE', 'JEY', 832, u'Jersey'),
+    ('JM', 'JAM', 388, u'Jamaica'),
+    ('JO', 'JOR', 400, u'Jordan'),
+    ('JP', 'JPN', 392, u'Japan'),
+    ('KE', 'KEN', 404, u'Kenya'),
+    ('KG', 'KGZ', 417, u'Kyrgyzstan'),
+    ('KH', 'KHM', 116, u'Cambodia'),
+    ('KI', 'KIR', 296, u'Kiribati'),
+    ('KM', 'COM', 174, u'Comoros'),
+    ('KN', 'KNA', 659, u'Saint Kitts and Nevis'),
+    ('KP', 'PRK', 408, u"Korea, Democratic People's Republic of"),
+    ('KR', 'KOR', 410, u'Korea, Republic of'),
+    ('KW', 'KWT', 414, u'Kuwait'),
+    ('KY', 'CYM', 136, u'Cayman Islands'),
+    ('KZ', 'KAZ', 398, u'Kazakhstan'),
+    ('LA', 'LAO', 418, u"Lao People's Democratic Republic"),
+    ('LB', 'LBN', 422, u'Lebanon'),
+    ('LC', 'LCA', 662, u'Saint Lucia'),
+    ('LI', 'LIE', 438, u'Liechtenstein'),
+    ('LK', 'LKA', 144, u'Sri Lanka'),
+    ('LR', 'LBR', 430, u'Liberia'),
+    ('LS', 'LSO', 426, u'Lesotho'),
+    ('LT', 'LTU', 440, u'Lithuania'),
+    ('LU', 'LUX', 442, u'Luxembourg'),
+    ('LV', 'LVA', 428, u'Latvia'),
+    ('LY', 'LBY', 434, u'Libya'),
+    ('MA', 'MAR', 504, u'Morocco'),
+    ('MC', 'MCO', 492, u'Monaco'),
+    ('MD', 'MDA', 498, u'Moldova, Republic of'),
+    ('ME', 'MNE', 499, u'Montenegro'),
+    ('MF', 'MAF', 663, u'Saint Martin (French part)'),
+    ('MG', 'MDG', 450, u'Madagascar'),
+    ('MH', 'MHL', 584, u'Marshall Islands'),
+    ('MK', 'MKD', 807, u'North Macedonia'),
+    ('ML', 'MLI', 466, u'Mali'),
+    ('MM', 'MMR', 104, u'Myanmar'),
+    ('MN', 'MNG', 496, u'Mongolia'),
+    ('MO', 'MAC', 446, u'Macao'),
+    ('MP', 'MNP', 580, u'Northern Mariana Islands'),
+    ('MQ', 'MTQ', 474, u'Martinique'),
+    ('MR', 'MRT', 478, u'Mauritania'),
+    ('MS', 'MSR', 500, u'Montserrat'),
+    ('MT', 'MLT', 470, u'Malta'),
+    ('MU', 'MUS', 480, u'Mauritius'),
+    ('MV', 'MDV', 462, u'Maldives'),
+    ('MW', 'MWI', 454, u'Malawi'),
+    ('MX', 'MEX', 484, u'Mexico'),
+    ('MY', 'MYS', 458, u'Malaysia'),
+    ('MZ', 'MOZ', 508, u'Mozambique'),
+    ('NA', 'NAM', 516, u'Namibia'),
+    ('NC', 'NCL', 540, u'New Caledonia'),
+    ('NE', 'NER', 562, u'Niger'),
+    ('NF', 'NFK', 574, u'Norfolk Island'),
+    ('NG', 'NGA', 566, u'Nigeria'),
+    ('NI', 'NIC', 558, u'Nicaragua'),
+    ('NL', 'NLD', 528, u'Netherlands'),
+    ('NO', 'NOR', 578, u'Norway'),
+    ('NP', 'NPL', 524, u'Nepal'),
+    ('NR', 'NRU', 520, u'Nauru'),
+    ('NU', 'NIU', 570, u'Niue'),
+    ('NZ', 'NZL', 554, u'New Zealand'),
+    ('OM', 'OMN', 512, u'Oman'),
+    ('PA', 'PAN', 591, u'Panama'),
+    ('PE', 'PER', 604, u'Peru'),
+    ('PF', 'PYF', 258, u'French Polynesia'),
+    ('PG', 'PNG', 598, u'Papua New Guinea'),
+    ('PH', 'PHL', 608, u'Philippines'),
+    ('PK', 'PAK', 586, u'Pakistan'),
+    ('PL', 'POL', 616, u'Poland'),
+    ('PM', 'SPM', 666, u'Saint Pierre and Miquelon'),
+    ('PN', 'PCN', 612, u'Pitcairn'),
+    ('PR', 'PRI', 630, u'Puerto Rico'),
+    ('PS', 'PSE', 275, u'Palestine, State of'),
+    ('PT', 'PRT', 620, u'Portugal'),
+    ('PW', 'PLW', 585, u'Palau'),
+    ('PY', 'PRY', 600, u'Paraguay'),
+    ('QA', 'QAT', 634, u'Qatar'),
+    ('RE', 'REU', 638, u'Réunion'),
+    ('RO', 'ROU', 642, u'Romania'),
+    ('RS', 'SRB', 688, u'Serbia'),
+    ('RU', 'RUS', 643, u'Russian Federation'),
+    ('RW', 'RWA', 646, u'Rwanda'),
+    ('SA', 'SAU', 682, u'Saudi Arabia'),
+    ('SB', 'SLB', 90, u'Solomon Islands'),
+    ('SC', 'SYC', 690, u'Seychelles'),
+    ('SD', 'SDN', 729, u'Sudan'),
+    ('SE', 'SWE', 752, u'Sweden'),
+    ('SG', 'SGP', 702, u'Singapore'),
+    ('SH', 'SHN', 654, u'Saint Helena, Ascension and Tristan da Cunha'),
+    ('SI', 'SVN', 705, u'Slovenia'),
+    ('SJ', 'SJM', 744, u'Svalbard and Jan Mayen'),
+    ('SK', 'SVK', 703, u'Slovakia'),
+    ('SL', 'SLE', 694, u'Sierra Leone'),
+    ('SM', 'SMR', 674, u'San Marino'),
+    ('SN', 'SEN', 686, u'Senegal'),
+    ('SO', 'SOM', 706, u'Somalia'),
+    ('SR', 'SUR', 740, u'Suriname'),
+    ('SS', 'SSD', 728, u'South Sudan'),
+    ('ST', 'STP', 678, u'Sao Tome and Principe'),
+    ('SV', 'SLV', 222, u'El Salvador'),
+    ('SX', 'SXM', 534, u'Sint Maarten (Dutch part)'),
+    ('SY', 'SYR', 760, u'Syrian Arab Republic'),
+    ('SZ', 'SWZ', 748, u'Eswatini'),
+    ('TC', 'TCA', 796, u'Turks and Caicos Islands'),
+    ('TD', 'TCD', 148, u'Chad'),
+    ('TF', 'ATF', 260, u'French Southern Territories'),
+    ('TG', 'TGO', 768, u'Togo'),
+    ('TH', 'THA', 764, u'Thailand'),
+    ('TJ', 'TJK', 762, u'Tajikistan'),
+    ('TK', 'TKL', 772, u'Tokelau'),
+    ('TL', 'TLS', 626, u'Timor-Leste'),
+    ('TM', 'TKM', 795, u'Turkmenistan'),
+    ('TN', 'TUN', 788, u'Tunisia'),
+    ('TO', 'TON', 776, u'Tonga'),
+    ('TR', 'TUR', 792, u'Türkiye'),
+    ('TT', 'TTO', 780, u'Trinidad and Tobago'),
+    ('TV', 'TUV', 798, u'Tuvalu'),
+    ('TW', 'TWN', 158, u'Taiwan, Province of China'),
+    ('TZ', 'TZA', 834, u'Tanzania, United Republic of'),
+    ('UA', 'UKR', 804, u'Ukraine'),
+    ('UG', 'UGA', 800, u'Uganda'),
+    ('UM', 'UMI', 581, u'United States Minor Outlying Islands'),
+    ('US', 'USA', 840, u'United States'),
+    ('UY', 'URY', 858, u'Uruguay'),
+    ('UZ', 'UZB', 860, u'Uzbekistan'),
+    ('VA', 'VAT', 336, u'Holy See (Vatican City State)'),
+    ('VC', 'VCT', 670, u'Saint Vincent and the Grenadines'),
+    ('VE', 'VEN', 862, u'Venezuela, Bolivarian Republic of'),
+    ('VG', 'VGB', 92, u'Virgin Islands, British'),
+    ('VI', 'VIR', 850, u'Virgin Islands, U.S.'),
+    ('VN', 'VNM', 704, u'Viet Nam'),
+    ('VU', 'VUT', 548, u'Vanuatu'),
+    ('WF', 'WLF', 876, u'Wallis and Futuna'),
+    ('WS', 'WSM', 882, u'Samoa'),
+    ('YE', 'YEM', 887, u'Yemen'),
+    ('YT', 'MYT', 175, u'Mayotte'),
+    ('ZA', 'ZAF', 710, u'South Africa'),
+    ('ZM', 'ZMB', 894, u'Zambia'),
+    ('ZW', 'ZWE', 716, u'Zimbabwe'),
+)
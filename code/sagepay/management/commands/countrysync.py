@@ -10,9 +10,9 @@ class Command(BaseCommand):
                     action='store_true',
                     dest='import',
                     default=False,
-                    help='Fetch and import the countries in the SagePay CountryCode model'),
+                    help='Import the bundled ISO 3166-1 countries in the SagePay CountryCode model'),
     )
-    help = 'Syncronize the countries models (sagepay->oscar) and set the shipping countries. SagePay must be already imported, if not use --sageimport=True'
+    help = 'Syncronize the countries models (sagepay->oscar) and set the shipping countries. SagePay must be already imported, if not use --sageimport. It can run again safely'
 
     def handle(self, *args, **options):
         c = CountryHelper()
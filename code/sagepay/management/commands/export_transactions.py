@@ -0,0 +1,61 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sagepay.models import SagePayTransaction
+from sagepay.export import export_lines, FORMATS
+from sagepay.dashboard.forms import TransactionSearchForm
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--format',
+                    dest='format',
+                    default='csv',
+                    help='csv or ndjson'),
+        make_option('--output',
+                    dest='output',
+                    default=None,
+                    help='File the export is written to, standard output by default'),
+        make_option('--status',
+                    dest='status',
+                    default='',
+                    help='Export only the transactions notified with this status (OK, NOTAUTHED, ABORT...)'),
+        make_option('--date-from',
+                    dest='date_from',
+                    default='',
+                    help='Export the transactions created from this day (YYYY-MM-DD)'),
+        make_option('--date-to',
+                    dest='date_to',
+                    default='',
+                    help='Export the transactions created up to this day included (YYYY-MM-DD)'),
+        make_option('--chunk-size',
+                    type='int',
+                    dest='chunk_size',
+                    default=1000,
+                    help='Number of transactions read per query'),
+    )
+    help = 'Export the transactions and their notification as CSV or NDJSON, in constant memory'
+
+    def handle(self, *args, **options):
+        if options['format'] not in FORMATS:
+            raise CommandError('--format must be one of %s' % ', '.join(sorted(FORMATS)))
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        form = TransactionSearchForm(dict((name, options[name]) for name in ('status', 'date_from', 'date_to')))
+        if not form.is_valid():
+            raise CommandError(form.errors.as_text())
+        queryset = form.filter(SagePayTransaction.objects.all())
+
+        # every line ends with a newline, the command output doesn't add another one
+        output = open(options['output'], 'wb') if options['output'] else self.stdout
+        # the CSV header is not a transaction
+        count = -1 if options['format'] == 'csv' else 0
+        try:
+            for line in export_lines(queryset, options['format'], options['chunk_size']):
+                output.write(line)
+                count += 1
+        finally:
+            if options['output']:
+                output.close()
+        self.stderr.write('%d transactions exported' % count)
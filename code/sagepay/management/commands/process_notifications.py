@@ -0,0 +1,56 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import reset_queries
+
+from sagepay.facade import get_facade
+from sagepay.tasks import process_batch
+from sagepay.settings import NOTIFICATION_QUEUE_LEASE
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+                    type='int',
+                    dest='batch_size',
+                    default=100,
+                    help='Number of tasks claimed at a time'),
+        make_option('--interval',
+                    type='float',
+                    dest='interval',
+                    default=1.0,
+                    help='Seconds waited when the queue is empty'),
+        make_option('--lease',
+                    type='int',
+                    dest='lease',
+                    default=NOTIFICATION_QUEUE_LEASE,
+                    help='Seconds a batch is held before another worker can claim it again'),
+        make_option('--once',
+                    action='store_true',
+                    dest='once',
+                    default=False,
+                    help='Stop once the queue is empty instead of waiting for new tasks'),
+    )
+    help = 'Do the work queued by the notifications when SAGEPAY_NOTIFICATION_QUEUE is set (card tokens, rollup, ' \
+           'notification_processed receivers), run one or more workers all the time'
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['lease'] < 1:
+            raise CommandError('--batch-size and --lease must be positive')
+        facade = get_facade()
+        total_done = total_failed = 0
+        while True:
+            # with DEBUG on the queries of a long running worker would pile up
+            reset_queries()
+            done, failed = process_batch(facade, options['batch_size'], options['lease'])
+            total_done += done
+            total_failed += failed
+            if done or failed:
+                self.stdout.write('%d tasks done, %d failed' % (done, failed))
+            # a full batch means more tasks are waiting
+            if done + failed < options['batch_size']:
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        self.stdout.write('Done: %d tasks done, %d failed' % (total_done, total_failed))
@@ -0,0 +1,69 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sagepay.models import Token, expiry_month
+from sagepay.facade import get_facade
+from sagepay.settings import ASYNC_WORKERS
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--dry-run',
+                    action='store_true',
+                    dest='dry_run',
+                    default=False,
+                    help='Count the expired tokens without removing them'),
+        make_option('--workers',
+                    type='int',
+                    dest='workers',
+                    default=ASYNC_WORKERS,
+                    help='Maximum number of concurrent REMOVETOKEN requests, at most SAGEPAY_ASYNC_WORKERS'),
+        make_option('--chunk-size',
+                    type='int',
+                    dest='chunk_size',
+                    default=500,
+                    help='Number of tokens removed and deleted at a time'),
+    )
+    help = 'Remove the tokens of the expired credit cards from SagePay and delete them from the database'
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--workers and --chunk-size must be positive')
+        self.backfill_expiry_month()
+        expired = Token.objects.expired()
+        if options['dry_run']:
+            self.stdout.write('%d expired tokens would be removed' % expired.count())
+            return
+
+        facade = get_facade()
+        removed = failed = 0
+        last_pk = 0
+        start = time.time()
+        while True:
+            chunk = expired.filter(pk__gt=last_pk).order_by('pk')[:options['chunk_size']]
+            results = facade.delete_tokens(chunk, workers=options['workers'])
+            if not results:
+                break
+            last_pk = max(results)
+            for pk, (status, detail) in results.items():
+                if status:
+                    removed += 1
+                else:
+                    failed += 1
+                    self.stderr.write('Token %d not removed: %s' % (pk, detail))
+            elapsed = time.time() - start
+            self.stdout.write('%d removed, %d failed (%.1f tokens/s)' % (
+                removed, failed, (removed + failed) / elapsed if elapsed else 0))
+        self.stdout.write('Done: %d removed, %d failed in %.1fs' % (removed, failed, time.time() - start))
+
+    def backfill_expiry_month(self):
+        """
+        Set the expiry month of the tokens saved before it existed, one query per distinct expiry date
+        """
+        missing = Token.objects.filter(expiry_month__isnull=True)
+        for expiry_date in missing.values_list('expiry_date', flat=True).distinct():
+            month = expiry_month(expiry_date)
+            if month is not None:
+                missing.filter(expiry_date=expiry_date).update(expiry_month=month)
@@ -0,0 +1,38 @@
+import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from sagepay.analytics import rollup, rollup_start
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--since',
+                    dest='since',
+                    default=None,
+                    help='Rebuild the rollup from this day (YYYY-MM-DD) instead of the last rolled up hours'),
+        make_option('--lookback',
+                    type='int',
+                    dest='lookback',
+                    default=24,
+                    help='Hours before the last rolled up one rebuilt again, for the late notifications'),
+    )
+    help = 'Update the hourly transaction rollup read by the analytics dashboard, run it periodically (e.g. hourly)'
+
+    def handle(self, *args, **options):
+        if options['since']:
+            try:
+                start = datetime.datetime.strptime(options['since'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError('--since must be a YYYY-MM-DD date')
+            if timezone.is_aware(timezone.now()):
+                start = timezone.make_aware(start, timezone.get_current_timezone())
+        else:
+            start = rollup_start(datetime.timedelta(hours=options['lookback']))
+        if start is None:
+            self.stdout.write('No transactions to roll up')
+            return
+        hours = rollup(start, timezone.now())
+        self.stdout.write('%d hours rolled up' % hours)
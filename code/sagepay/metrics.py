@@ -0,0 +1,262 @@
+"""
+Timers, counters and query counts of the checkout stages
+
+The gateway, facade and thank you view report to the backend SAGEPAY_METRICS points to: :class:`Metrics` discards
+everything, :class:`StatsdMetrics` sends StatsD packets and :class:`PrometheusMetrics` keeps the values in the
+process for a scrape. Each stage reports `<prefix>.<stage>.time` (milliseconds), `<prefix>.<stage>.queries` and
+`<prefix>.<stage>.errors`, the SagePay statuses are counted as `<prefix>.<stage>.status.<Status>`.
+"""
+import time
+import socket
+import threading
+
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.backends.util import CursorWrapper
+from django.utils.importlib import import_module
+
+from .settings import METRICS, METRICS_OPTIONS
+
+
+class Metrics(object):
+    """
+    Backend discarding the metrics, subclasses override :meth:`timing` and :meth:`increment`
+
+    :param prefix: prepended to the metric names
+    :type prefix: str
+    :param count_queries: count the database queries of each stage
+    :type count_queries: bool
+    """
+    enabled = False
+
+    def __init__(self, prefix='sagepay', count_queries=True):
+        self.prefix = prefix
+        self.count_queries = count_queries
+
+    def timing(self, name, milliseconds):
+        """
+        Record a duration or any value whose distribution matters (e.g. queries)
+        """
+
+    def increment(self, name, value=1):
+        """
+        Add `value` to a counter
+        """
+
+    def stage(self, name):
+        """
+        Time a stage, count its queries and its errors
+
+            with metrics.stage('facade.authorize'):
+                ...
+
+        :returns: context manager
+        """
+        if not self.enabled:
+            return _NO_STAGE
+        return _Stage(self, name)
+
+    def status(self, stage, status):
+        """
+        Count a SagePay status returned or notified in a stage
+        """
+        if self.enabled:
+            self.increment('%s.%s.status.%s' % (self.prefix, stage, status or 'UNKNOWN'))
+
+
+class _NoStage(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+class _Stage(object):
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.counter = query_counter() if self.metrics.count_queries else None
+        if self.counter is not None:
+            self.counter.__enter__()
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        elapsed = time.time() - self.start
+        metrics = self.metrics
+        name = '%s.%s' % (metrics.prefix, self.name)
+        metrics.timing(name + '.time', elapsed * 1000)
+        if self.counter is not None:
+            self.counter.__exit__(exc_type, exc_value, tb)
+            metrics.timing(name + '.queries', self.counter.count)
+        if exc_type is not None:
+            metrics.increment(name + '.errors')
+        return False
+
+
+class _CountingCursor(CursorWrapper):
+
+    def execute(self, sql, params=()):
+        self.set_dirty()
+        _count_query()
+        return self.cursor.execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        self.set_dirty()
+        _count_query()
+        return self.cursor.executemany(sql, param_list)
+
+
+_active = threading.local()
+
+
+def _count_query():
+    for counter in getattr(_active, 'counters', ()):
+        counter.count += 1
+
+
+class query_counter(object):
+    """
+    Count the queries run on the default database by the current thread in a with block, nested blocks count their
+    own queries. With DEBUG off the debug cursor is swapped for one which counts without keeping the SQL.
+    """
+    def __init__(self):
+        self.count = 0
+
+    def __enter__(self):
+        db = connections[DEFAULT_DB_ALIAS]
+        counters = getattr(_active, 'counters', None)
+        if counters is None:
+            counters = _active.counters = []
+        if not counters:
+            _active.recording = db.use_debug_cursor or (db.use_debug_cursor is None and settings.DEBUG)
+            if not _active.recording:
+                # the connection belongs to this thread
+                _active.saved = db.use_debug_cursor
+                db.use_debug_cursor = True
+                db.make_debug_cursor = lambda cursor: _CountingCursor(cursor, db)
+        if _active.recording:
+            self.start = len(db.queries)
+        counters.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        db = connections[DEFAULT_DB_ALIAS]
+        counters = _active.counters
+        counters.remove(self)
+        if _active.recording:
+            self.count = len(db.queries) - self.start
+        elif not counters:
+            db.use_debug_cursor = _active.saved
+            del db.make_debug_cursor
+        return False
+
+
+class StatsdMetrics(Metrics):
+    """
+    Send the metrics to a StatsD server over UDP, a lost packet or a server down never reaches the caller
+
+    :param host: StatsD server
+    :type host: str
+    :param port: StatsD port
+    :type port: int
+    """
+    enabled = True
+
+    def __init__(self, host='localhost', port=8125, **kwargs):
+        super(StatsdMetrics, self).__init__(**kwargs)
+        self.address = (host, port)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(0)
+
+    def _send(self, packet):
+        try:
+            self.socket.sendto(packet, self.address)
+        except (socket.error, socket.gaierror):
+            pass
+
+    def timing(self, name, milliseconds):
+        self._send('%s:%.3f|ms' % (name, milliseconds))
+
+    def increment(self, name, value=1):
+        self._send('%s:%d|c' % (name, value))
+
+
+class PrometheusMetrics(Metrics):
+    """
+    Keep the metrics in the process and render them in the Prometheus text format, timings become summaries (sum and
+    count) and counters counters. Serve :meth:`exposition` from a view for the scraper, e.g. with :func:`metrics_view`.
+    """
+    enabled = True
+
+    def __init__(self, **kwargs):
+        super(PrometheusMetrics, self).__init__(**kwargs)
+        self.summaries = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def timing(self, name, milliseconds):
+        with self._lock:
+            total, count = self.summaries.get(name, (0.0, 0))
+            self.summaries[name] = (total + milliseconds, count + 1)
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def exposition(self):
+        """
+        :returns: str -- the metrics in the Prometheus text format
+        """
+        with self._lock:
+            summaries = sorted(self.summaries.items())
+            counters = sorted(self.counters.items())
+        lines = []
+        for name, (total, count) in summaries:
+            name = _prometheus_name(name)
+            lines.extend(['# TYPE %s summary' % name, '%s_sum %s' % (name, repr(total)), '%s_count %d' % (name, count)])
+        for name, value in counters:
+            name = _prometheus_name(name) + '_total'
+            lines.extend(['# TYPE %s counter' % name, '%s %d' % (name, value)])
+        return '\n'.join(lines) + '\n'
+
+
+def _prometheus_name(name):
+    return ''.join(c if c.isalnum() else '_' for c in name)
+
+
+def metrics_view(request):
+    """
+    Django view serving the :class:`PrometheusMetrics` of the process, hook it to a URL only the scraper reaches
+    """
+    from django.http import HttpResponse, Http404
+
+    metrics = get_metrics()
+    if not hasattr(metrics, 'exposition'):
+        raise Http404('SAGEPAY_METRICS has no Prometheus exposition')
+    return HttpResponse(metrics.exposition(), content_type='text/plain; version=0.0.4')
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """
+    :returns: the instance of the class SAGEPAY_METRICS points to, shared by the process
+    """
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                module_name, class_name = METRICS.rsplit('.', 1)
+                _metrics = getattr(import_module(module_name), class_name)(**METRICS_OPTIONS)
+    return _metrics
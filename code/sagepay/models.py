@@ -1,14 +1,20 @@
-import hashlib
+import os
+import time
+import datetime
 
 from django.db import models
 from django.db.models import get_model
+from django.db.models.signals import post_save, post_delete
 
 from model_utils import Choices
 from model_utils.models import TimeStampedModel
 
 from .settings import VENDOR, PROTOCOL, DEFAULT_CURRENCY
+from .cache import transaction_ids
+from .countries import country_resolver
 
 Basket = get_model('basket', 'Basket')
+OscarCountry = get_model('address', 'Country')
 
 
 class CountryCode(models.Model):
@@ -28,12 +34,51 @@ class CountryCode(models.Model):
         return self.code
 
 
+def expiry_month(expiry_date):
+    """
+    Convert a SagePay MMYY expiry date into the first day of the expiry month
+
+    :param expiry_date: expiry date in the MMYY format
+    :type expiry_date: str
+    :returns: :class:`datetime.date` instance or None if the expiry date is not valid
+    """
+    try:
+        return datetime.date(2000 + int(expiry_date[2:4]), int(expiry_date[0:2]), 1)
+    except (ValueError, TypeError):
+        return None
+
+
+class TokenManager(models.Manager):
+
+    def expired(self, today=None):
+        """
+        Tokens of the cards expired before the current month
+        """
+        today = today or datetime.date.today()
+        return self.filter(expiry_month__lt=today.replace(day=1))
+
+    def unexpired(self, today=None):
+        """
+        Tokens of the cards which can still be used, tokens with an unknown expiry month are included
+        """
+        today = today or datetime.date.today()
+        return self.exclude(expiry_month__lt=today.replace(day=1))
+
+
 class Token(TimeStampedModel):
     token = models.CharField(max_length=38)
     user = models.ForeignKey('auth.User', related_name='token')
     last_4_digits = models.CharField(max_length=4)
     card_type = models.CharField(max_length=15)
     expiry_date = models.CharField(max_length=4)
+    # expiry_date as a date (first day of the month) so expired cards can be found with an indexed query
+    expiry_month = models.DateField(null=True, blank=True, db_index=True)
+
+    objects = TokenManager()
+
+    def save(self, *args, **kwargs):
+        self.expiry_month = expiry_month(self.expiry_date)
+        super(Token, self).save(*args, **kwargs)
 
     @property
     def obfuscated_card(self):
@@ -55,13 +100,23 @@ class Token(TimeStampedModel):
         return u"{0:s} ({1:s})".format(self.token, self.summary)
 
 
+def new_vendor_tx_code():
+    """
+    Return a unique VendorTxCode without asking the database: the creation time in milliseconds followed by 80 random
+    bits, 32 hex digits sorting in creation order
+
+    :returns: str
+    """
+    return '%012x%s' % (int(time.time() * 1000), os.urandom(10).encode('hex'))
+
+
 class TransactionRegistrationServerResponse(TimeStampedModel):
     """
     This class contains the field of Step 3
     """
     vps_protocol = models.CharField(max_length=4)
     vendor = models.CharField(max_length=15, default=VENDOR)
-    vps_tx_id = models.CharField(max_length=38)
+    vps_tx_id = models.CharField(max_length=38, unique=True)
     security_key = models.CharField(max_length=10)
     status = models.CharField(max_length=20)
     status_detail = models.CharField(max_length=255)
@@ -77,9 +132,9 @@ class NotificationPostResponse(TimeStampedModel):
     """
     vps_protocol = models.CharField(max_length=4)
     tx_type = models.CharField(max_length=15)
-    vendor_tx_code = models.CharField(max_length=40)
-    vps_tx_id = models.CharField(max_length=38)
-    status = models.CharField(max_length=20)
+    vendor_tx_code = models.CharField(max_length=40, db_index=True)
+    vps_tx_id = models.CharField(max_length=38, db_index=True)
+    status = models.CharField(max_length=20, db_index=True)
     status_detail = models.CharField(max_length=255)
     tx_auth_no = models.CharField(max_length=10, null=True)
     avscv2 = models.CharField(max_length=50, null=True)
@@ -89,19 +144,33 @@ class NotificationPostResponse(TimeStampedModel):
     gift_aid = models.BooleanField()
     threed_secure_status = models.CharField(max_length=50)
     cavv = models.CharField(max_length=32)
-    card_type = models.CharField(max_length=15)
+    # PayPal and ReD fraud screening, signed
+    address_status = models.CharField(max_length=20, blank=True, default='')
+    payer_status = models.CharField(max_length=20, blank=True, default='')
+    fraud_response = models.CharField(max_length=10, blank=True, default='')
+    card_type = models.CharField(max_length=15, db_index=True)
     last_4_digits = models.CharField(max_length=4)
     decline_code = models.CharField(max_length=2)
     expiry_date = models.CharField(max_length=4)
     bank_auth_ode = models.CharField(max_length=6)
+    vps_signature = models.CharField(max_length=32, blank=True, default='')
     # internal use fields
     hash_match = models.BooleanField(default=False)
     replied = models.BooleanField(default=False)
     reply_text = models.TextField(null=True, blank=True)
+    # VPSTxId:Status of the signed notifications, SagePay's retries of a processed one can't be saved again
+    notification_key = models.CharField(max_length=60, null=True, blank=True, unique=True, editable=False)
 
     def __unicode__(self):
         return self.vps_tx_id
 
+    @staticmethod
+    def key(vps_tx_id, status):
+        """
+        :returns: str -- the notification_key of a signed notification
+        """
+        return '%s:%s' % (vps_tx_id, status)
+
 
 class SagePayTransaction(TimeStampedModel):
     """
@@ -113,14 +182,14 @@ class SagePayTransaction(TimeStampedModel):
 
     # oscar fields
     oscar_basket = models.ForeignKey(Basket, related_name='oscar_basket')
-    oscar_order = models.PositiveIntegerField()
+    oscar_order = models.PositiveIntegerField(db_index=True)
 
     # sage fields
     vps_protocol = models.CharField(max_length=4, default=PROTOCOL)
     vendor = models.CharField(max_length=15, default=VENDOR)
-    vendor_tx_code = models.CharField(max_length=40, null=True, blank=True, help_text='This will be automatically generated')
+    vendor_tx_code = models.CharField(max_length=40, null=True, blank=True, unique=True, help_text='This will be automatically generated')
     tx_type = models.CharField(choices=TX_TYPE, default=TX_TYPE.PAYMENT, max_length=15)
-    amount = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    amount = models.DecimalField(max_digits=8, decimal_places=2, default=0, db_index=True)
     #
     currency = models.CharField(max_length=3, default=DEFAULT_CURRENCY)
     description = models.TextField(max_length=100)
@@ -151,23 +220,77 @@ class SagePayTransaction(TimeStampedModel):
 
     # fields returned by sage server, they are all null=True because they get populated during the process
     transaction_registration_server_response = models.ForeignKey(TransactionRegistrationServerResponse, null=True, blank=True)
+    # copy of transaction_registration_server_response.vps_tx_id, the transaction is found without the join
+    vps_tx_id = models.CharField(max_length=38, null=True, blank=True, unique=True)
     notification_post_response = models.ForeignKey(NotificationPostResponse, null=True, blank=True)
 
     #
     token = models.ForeignKey(Token, null=True, blank=True)
 
-    def save(self, force_insert=False, force_update=False, using=None):
+    def save(self, *args, **kwargs):
         """
         VendorTxCode MUST be unique for each transaction issued to SagePay.
-        We can use the id but who never knows.
-        Let's automatically create a md5 hash with id+created
+        It's generated once, before the first save, and never changes afterwards
         """
-        hash = hashlib.md5(str(self.id)+self.created.isoformat())
-        self.vendor_tx_code = hash.hexdigest()
-        super(SagePayTransaction, self).save(force_update, force_update, using)
+        if not self.vendor_tx_code:
+            self.vendor_tx_code = new_vendor_tx_code()
+        super(SagePayTransaction, self).save(*args, **kwargs)
 
     class Meta:
         verbose_name = 'SagePay Transaction'
+        # the (created, id) index of the dashboard list is created by sql/sagepaytransaction.sql
 
     def __unicode__(self):
-        return self.vendor_tx_code
\ No newline at end of file
+        return self.vendor_tx_code
+
+
+class TransactionRollup(models.Model):
+    """
+    Number and value of the transactions created in an hour, by notified status, card type and 3D Secure outcome
+
+    Rows are rebuilt by :func:`sagepay.analytics.rollup` and optionally incremented when the notifications land, the
+    analytics dashboard reads them instead of the transactions.
+    """
+    period = models.DateTimeField(help_text='Start of the hour')
+    day = models.DateField(db_index=True)
+    status = models.CharField(max_length=20, blank=True)
+    card_type = models.CharField(max_length=15, blank=True)
+    threed_secure_status = models.CharField(max_length=50, blank=True)
+    count = models.PositiveIntegerField(default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('period', 'status', 'card_type', 'threed_secure_status')
+
+
+class NotificationTask(models.Model):
+    """
+    Work left after replying to a signed notification, queued when SAGEPAY_NOTIFICATION_QUEUE is set and done by the
+    process_notifications command (see :mod:`sagepay.tasks`)
+    """
+    sage_transaction = models.ForeignKey(SagePayTransaction)
+    notification = models.ForeignKey(NotificationPostResponse)
+    # the rollup moves the transaction from the row of this one
+    previous_notification = models.ForeignKey(NotificationPostResponse, null=True, blank=True, related_name='+')
+    # the card token isn't kept with the notification
+    token = models.CharField(max_length=38, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    run_after = models.DateTimeField(db_index=True, help_text='Due, or held by a worker, until then')
+    claim = models.CharField(max_length=32, blank=True, db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    def __unicode__(self):
+        return u'%s %s' % (self.notification.vps_tx_id, self.notification.status)
+
+
+def forget_transaction_id(sender, instance, **kwargs):
+    if instance.vps_tx_id:
+        transaction_ids.discard(instance.vps_tx_id)
+
+post_save.connect(forget_transaction_id, sender=SagePayTransaction)
+post_delete.connect(forget_transaction_id, sender=SagePayTransaction)
+
+for model in (CountryCode, OscarCountry):
+    post_save.connect(country_resolver.invalidate, sender=model)
+    post_delete.connect(country_resolver.invalidate, sender=model)
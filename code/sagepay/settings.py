@@ -1,22 +1,67 @@
 from django.conf import settings
 from django.contrib.sites.models import Site
-
-site = Site.objects.get_current()
-domain = site.domain
+from django.utils.functional import lazy
 
 # set constant settings
 if settings.DEBUG :
     SAGE_SERVER_URL = getattr(settings, 'SAGEPAY_SERVER', 'https://test.sagepay.com/gateway/service/vspserver-register.vsp')
     DELETE_TOKEN_URL = getattr(settings, 'SAGEPAY_DELETETOKEN', 'https://test.sagepay.com/gateway/service/removetoken.vsp')
-    NOTIFICATION_URL = getattr(settings, 'SAGEPAY_NOTIFICATION_URL', 'http://%s/sagepay/notification/' % domain)
-    THANK_YOU_URL = getattr(settings, 'SAGEPAY_THANK_YOU_URL', 'http://%s/sagepay/thankyou/' % domain)
-    ERROR_URL = getattr(settings, 'SAGEPAY_ERROR_URL', 'http://%s/sagepay/error/' % domain)
 else:
     SAGE_SERVER_URL = getattr(settings, 'SAGEPAY_SERVER', 'https://live.sagepay.com/gateway/service/vspserver-register.vsp')
     DELETE_TOKEN_URL = getattr(settings, 'SAGEPAY_DELETETOKEN', 'https://live.sagepay.com/gateway/service/removetoken.vsp')
-    NOTIFICATION_URL = getattr(settings, 'SAGEPAY_NOTIFICATION_URL', 'http://%s/sagepay/notification/' % domain)
-    THANK_YOU_URL = getattr(settings, 'SAGEPAY_THANK_YOU_URL', 'http://%s/sagepay/thankyou/' % domain)
-    ERROR_URL = getattr(settings, 'SAGEPAY_ERROR_URL', 'http://%s/sagepay/error/' % domain)
+
+# per site overrides of the URLs below, keyed by the site domain
+SITE_URLS = getattr(settings, 'SAGEPAY_SITE_URLS', {})
+
+
+class SiteURLs(object):
+    """
+    URLs given to SagePay for the notifications and the customer redirections, built from the site domain the first
+    time a site needs them, the current site is only read then and not when the settings are imported
+    """
+    defaults = {
+        'notification': ('SAGEPAY_NOTIFICATION_URL', 'http://%s/sagepay/notification/'),
+        'thank_you': ('SAGEPAY_THANK_YOU_URL', 'http://%s/sagepay/thankyou/'),
+        'error': ('SAGEPAY_ERROR_URL', 'http://%s/sagepay/error/'),
+    }
+
+    def __init__(self):
+        self._urls = {}
+
+    def for_site(self, site=None):
+        """
+        :param site: site the URLs are for, the current one if None
+        :type site: :class:`django.contrib.sites.models.Site` or :class:`django.contrib.sites.models.RequestSite`
+        :returns: dict -- notification, thank_you and error URLs
+        """
+        if site is None:
+            site = Site.objects.get_current()
+        try:
+            return self._urls[site.domain]
+        except KeyError:
+            urls = self._urls[site.domain] = self.build(site.domain)
+            return urls
+
+    def get(self, name, site=None):
+        return self.for_site(site)[name]
+
+    def build(self, domain):
+        overrides = SITE_URLS.get(domain, {})
+        urls = {}
+        for name, (setting, default) in self.defaults.items():
+            urls[name] = overrides.get(name) or getattr(settings, setting, default % domain)
+        return urls
+
+    def clear(self):
+        self._urls = {}
+
+
+site_urls = SiteURLs()
+
+# URLs of the current site, evaluated when used
+NOTIFICATION_URL = lazy(lambda: site_urls.get('notification'), str)()
+THANK_YOU_URL = lazy(lambda: site_urls.get('thank_you'), str)()
+ERROR_URL = lazy(lambda: site_urls.get('error'), str)()
 
 
 SAGEPAY_PROFILE = getattr(settings, 'SAGEPAY_PROFILE', 'LOW')
@@ -24,3 +69,44 @@ VENDOR = getattr(settings, 'SAGEPAY_VENDOR', '')
 PROTOCOL = getattr(settings, 'SAGEPAY_VPSPROTOCOL', '3.00')
 DEFAULT_CURRENCY = getattr(settings, 'SAGEPAY_DEFAULT_CURRENCY', 'GBP')
 SAVE_CARD = getattr(settings, 'SAGEPAY_SAVE_CARD', False)
+
+# HTTP connection pool used by the gateway to talk to the SagePay server
+POOL_CONNECTIONS = getattr(settings, 'SAGEPAY_POOL_CONNECTIONS', 2)
+POOL_MAXSIZE = getattr(settings, 'SAGEPAY_POOL_MAXSIZE', 10)
+POOL_BLOCK = getattr(settings, 'SAGEPAY_POOL_BLOCK', False)
+CONNECT_TIMEOUT = getattr(settings, 'SAGEPAY_CONNECT_TIMEOUT', 5)
+READ_TIMEOUT = getattr(settings, 'SAGEPAY_READ_TIMEOUT', 30)
+ASYNC_WORKERS = getattr(settings, 'SAGEPAY_ASYNC_WORKERS', POOL_MAXSIZE)
+
+# retries of the payment registration and circuit breaker protecting the workers when SagePay is down
+RETRIES = getattr(settings, 'SAGEPAY_RETRIES', 2)
+RETRY_BACKOFF = getattr(settings, 'SAGEPAY_RETRY_BACKOFF', 0.2)
+RETRY_MAX_BACKOFF = getattr(settings, 'SAGEPAY_RETRY_MAX_BACKOFF', 2)
+CIRCUIT_ERROR_RATE = getattr(settings, 'SAGEPAY_CIRCUIT_ERROR_RATE', 0.5)
+CIRCUIT_MIN_REQUESTS = getattr(settings, 'SAGEPAY_CIRCUIT_MIN_REQUESTS', 10)
+CIRCUIT_WINDOW = getattr(settings, 'SAGEPAY_CIRCUIT_WINDOW', 20)
+CIRCUIT_RESET_TIMEOUT = getattr(settings, 'SAGEPAY_CIRCUIT_RESET_TIMEOUT', 30)
+
+# recent SagePay transaction ids -> transaction primary keys kept by each process
+TX_ID_CACHE_SIZE = getattr(settings, 'SAGEPAY_TX_ID_CACHE_SIZE', 1000)
+
+# countries read once per process, optionally shared through a Django cache
+COUNTRY_CACHE = getattr(settings, 'SAGEPAY_COUNTRY_CACHE', None)
+COUNTRY_CACHE_TIMEOUT = getattr(settings, 'SAGEPAY_COUNTRY_CACHE_TIMEOUT', 3600)
+
+# description and Basket field of the transactions
+BASKET_BUILDER = getattr(settings, 'SAGEPAY_BASKET_BUILDER', 'sagepay.utils.BasketBuilder')
+SEND_BASKET = getattr(settings, 'SAGEPAY_SEND_BASKET', False)
+
+# count the notified transactions in the analytics rollup straight away, rollup_transactions does it otherwise
+ROLLUP_ON_NOTIFICATION = getattr(settings, 'SAGEPAY_ROLLUP_ON_NOTIFICATION', False)
+
+# metrics backend of the checkout stages and its keyword arguments, sagepay.metrics.Metrics discards them
+METRICS = getattr(settings, 'SAGEPAY_METRICS', 'sagepay.metrics.Metrics')
+METRICS_OPTIONS = getattr(settings, 'SAGEPAY_METRICS_OPTIONS', {})
+
+# leave the card token, rollup and notification_processed work of the notifications to the process_notifications
+# command, seconds a worker holds the tasks it claimed and attempts before a failing task is left aside
+NOTIFICATION_QUEUE = getattr(settings, 'SAGEPAY_NOTIFICATION_QUEUE', False)
+NOTIFICATION_QUEUE_LEASE = getattr(settings, 'SAGEPAY_NOTIFICATION_QUEUE_LEASE', 60)
+NOTIFICATION_QUEUE_MAX_ATTEMPTS = getattr(settings, 'SAGEPAY_NOTIFICATION_QUEUE_MAX_ATTEMPTS', 10)
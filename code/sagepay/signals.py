@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# sent once the work following a signed notification is done (card token saved, rollup counted), inline or by the
+# process_notifications command, hook the order bookkeeping to it
+notification_processed = Signal(providing_args=['sage_transaction', 'notification'])
@@ -0,0 +1,148 @@
+import hashlib
+
+from .core import TransactionNotificationPostResponse
+from .models import TransactionRegistrationServerResponse
+
+try:
+    from hmac import compare_digest
+except ImportError:
+    # python < 2.7.7
+    def compare_digest(a, b):
+        if len(a) != len(b):
+            return False
+        result = 0
+        for x, y in zip(a, b):
+            result |= ord(x) ^ ord(y)
+        return result == 0
+
+
+# notification fields signed by SagePay, in order (page 66 of sage manual), None marks where the vendor name and the
+# security key go
+SIGNED_FIELDS = (
+    'vps_tx_id', 'vendor_tx_code', 'status', 'tx_auth_no', None, 'avscv2', None, 'address_result',
+    'postcode_result', 'cv2_result', 'gift_aid', 'threed_secure_status', 'cavv', 'address_status', 'payer_status',
+    'card_type', 'last_4_digits', 'decline_code', 'expiry_date', 'fraud_response', 'bank_auth_code',
+)
+VENDOR_POSITION = 4
+SECURITY_KEY_POSITION = 6
+
+
+class SignatureVerifier(object):
+    """
+    Check the VPSSignature of the notifications of a transaction
+
+    :param vendor: SagePay vendor name the transaction was registered with
+    :type vendor: str
+    :param security_key: security key returned by SagePay at registration
+    :type security_key: str
+    """
+    def __init__(self, vendor, security_key):
+        self.vendor = vendor.lower().encode('utf-8')
+        self.security_key = security_key.strip().encode('utf-8')
+
+    def signing_payload(self, notification):
+        """
+        Return the content SagePay signed
+
+        :param notification: SagePay transaction notification
+        :type notification: :class:`sagepay.core.TransactionNotificationPostResponse` instance
+        :returns: str
+        """
+        values = [(getattr(notification, slot, None) or '') if slot else '' for slot in SIGNED_FIELDS]
+        values[VENDOR_POSITION] = self.vendor
+        values[SECURITY_KEY_POSITION] = self.security_key
+        payload = ''.join(values)
+        if isinstance(payload, unicode):
+            payload = payload.encode('utf-8')
+        return payload
+
+    def signature(self, notification):
+        """
+        Return the expected VPSSignature, an uppercase MD5 hex digest
+
+        :returns: str
+        """
+        return hashlib.md5(self.signing_payload(notification)).hexdigest().upper()
+
+    def verify(self, notification):
+        """
+        True if the notification VPSSignature matches, the comparison takes the same time whatever the signature
+
+        :param notification: SagePay transaction notification
+        :type notification: :class:`sagepay.core.TransactionNotificationPostResponse` instance
+        :returns: boolean
+        """
+        received = getattr(notification, 'vps_signature', None) or ''
+        try:
+            received = str(received)
+        except UnicodeEncodeError:
+            return False
+        return compare_digest(self.signature(notification), received)
+
+
+def notification_from_model(post_response):
+    """
+    Rebuild the notification from the saved :class:`sagepay.models.NotificationPostResponse`
+
+    :returns: :class:`sagepay.core.TransactionNotificationPostResponse` instance
+    """
+    return TransactionNotificationPostResponse({
+        'VPSProtocol': post_response.vps_protocol,
+        'TxType': post_response.tx_type,
+        'VendorTxCode': post_response.vendor_tx_code,
+        'VPSTxId': post_response.vps_tx_id,
+        'Status': post_response.status,
+        'StatusDetail': post_response.status_detail,
+        'TxAuthNo': post_response.tx_auth_no or '',
+        'AVSCV2': post_response.avscv2 or '',
+        'AddressResult': post_response.address_result,
+        'PostCodeResult': post_response.postcode_result,
+        'CV2Result': post_response.cv2_result,
+        'GiftAid': str(int(post_response.gift_aid)),
+        '3DSecureStatus': post_response.threed_secure_status,
+        'CAVV': post_response.cavv,
+        'AddressStatus': post_response.address_status,
+        'PayerStatus': post_response.payer_status,
+        'CardType': post_response.card_type,
+        'Last4Digits': post_response.last_4_digits,
+        'DeclineCode': post_response.decline_code,
+        'ExpiryDate': post_response.expiry_date,
+        'FraudResponse': post_response.fraud_response,
+        'BankAuthCode': post_response.bank_auth_ode,
+        'VPSSignature': post_response.vps_signature,
+    })
+
+
+def audit_notifications(post_responses, chunk_size=1000):
+    """
+    Verify the signature of saved notifications, the registrations are fetched with one query per chunk
+
+    :param post_responses: notifications to check
+    :type post_responses: iterable of :class:`sagepay.models.NotificationPostResponse`
+    :param chunk_size: number of notifications checked at a time
+    :type chunk_size: int
+    :returns: generator of (notification, result) -- result is None if the transaction is unknown
+    """
+    chunk = []
+    for post_response in post_responses:
+        chunk.append(post_response)
+        if len(chunk) == chunk_size:
+            for result in _audit_chunk(chunk):
+                yield result
+            chunk = []
+    for result in _audit_chunk(chunk):
+        yield result
+
+
+def _audit_chunk(post_responses):
+    if not post_responses:
+        return
+    registrations = TransactionRegistrationServerResponse.objects.filter(
+        vps_tx_id__in=set(p.vps_tx_id for p in post_responses)).values_list('vps_tx_id', 'vendor', 'security_key')
+    verifiers = dict((tx_id, SignatureVerifier(vendor, key)) for tx_id, vendor, key in registrations)
+    for post_response in post_responses:
+        verifier = verifiers.get(post_response.vps_tx_id)
+        if verifier is None:
+            yield post_response, None
+        else:
+            yield post_response, verifier.verify(notification_from_model(post_response))
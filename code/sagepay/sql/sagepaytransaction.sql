@@ -0,0 +1,2 @@
+-- dashboard list, newest first: run by syncdb once the table is created
+CREATE INDEX sagepay_sagepaytransaction_created_id ON sagepay_sagepaytransaction (created, id);
@@ -0,0 +1,115 @@
+"""
+Queue of the work done after replying to a signed notification
+
+With SAGEPAY_NOTIFICATION_QUEUE set the notification view only checks the signature, saves the notification, links it
+to the transaction and replies. Saving the card token, counting the rollup and the
+:data:`sagepay.signals.notification_processed` receivers are queued in the :class:`sagepay.models.NotificationTask`
+table, in the same database transaction as the notification, and done by the process_notifications command.
+
+Workers claim the due tasks in batches for a lease, a task whose worker died is claimed again once its lease ran out.
+Each task is locked, done and deleted in one database transaction by the worker holding the latest claim only, a
+failing one is tried again later with a growing delay.
+"""
+import uuid
+import logging
+import datetime
+import traceback
+
+from django.db import transaction
+from django.db.models import F
+from django.utils.timezone import now
+
+from .models import NotificationTask
+from .metrics import get_metrics
+from .settings import NOTIFICATION_QUEUE_LEASE, NOTIFICATION_QUEUE_MAX_ATTEMPTS
+
+logger = logging.getLogger('sagepay')
+
+# seconds before a failed task is tried again, doubled after each attempt
+RETRY_DELAY = 30
+RETRY_MAX_DELAY = 3600
+
+
+def enqueue(sage_transaction, notification, token='', previous=None):
+    """
+    Queue the work following a signed notification
+
+    :param sage_transaction: notified transaction
+    :type sage_transaction: :class:`sagepay.models.SagePayTransaction` instance
+    :param notification: its saved notification
+    :type notification: :class:`sagepay.models.NotificationPostResponse` instance
+    :param token: card token to save for the customer, if any
+    :type token: str
+    :param previous: the notification the transaction was linked to before, None if it had none
+    :type previous: :class:`sagepay.models.NotificationPostResponse` instance
+    :returns: :class:`sagepay.models.NotificationTask` instance
+    """
+    return NotificationTask.objects.create(sage_transaction=sage_transaction, notification=notification,
+                                           previous_notification=previous, token=token or '', run_after=now())
+
+
+def claim(batch_size, lease=NOTIFICATION_QUEUE_LEASE, max_attempts=NOTIFICATION_QUEUE_MAX_ATTEMPTS):
+    """
+    Claim the oldest due tasks for `lease` seconds, fetched with their transaction and notification
+
+    Three queries whatever the batch size, concurrent workers never claim the same task.
+
+    :param batch_size: maximum number of tasks claimed
+    :type batch_size: int
+    :returns: list of :class:`sagepay.models.NotificationTask` instances
+    """
+    current = now()
+    due = NotificationTask.objects.filter(run_after__lte=current, attempts__lt=max_attempts)
+    ids = list(due.order_by('run_after', 'pk').values_list('pk', flat=True)[:batch_size])
+    if not ids:
+        return []
+    claimed_by = uuid.uuid4().hex
+    # a task claimed meanwhile by another worker isn't due anymore
+    due.filter(pk__in=ids).update(claim=claimed_by, run_after=current + datetime.timedelta(seconds=lease))
+    return list(NotificationTask.objects.filter(claim=claimed_by).order_by('pk').select_related(
+        'sage_transaction__oscar_basket', 'notification', 'previous_notification'))
+
+
+@transaction.commit_on_success
+def _process(facade, task):
+    # locks the task until it's deleted: a worker claiming it again once the lease ran out waits and finds nothing,
+    # one which claimed it already is the only one left doing it. Nothing in between may commit, the facade's helper
+    # runs in this database transaction
+    if not NotificationTask.objects.filter(pk=task.pk, claim=task.claim).update(attempts=F('attempts')):
+        return False
+    facade._process_notification(task.sage_transaction, task.notification, task.token, task.previous_notification)
+    NotificationTask.objects.filter(pk=task.pk).delete()
+    return True
+
+
+def _retry_later(task):
+    attempts = task.attempts + 1
+    delay = min(RETRY_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+    NotificationTask.objects.filter(pk=task.pk, claim=task.claim).update(
+        claim='', attempts=attempts, last_error=traceback.format_exc(),
+        run_after=now() + datetime.timedelta(seconds=delay))
+
+
+def process_batch(facade, batch_size=100, lease=NOTIFICATION_QUEUE_LEASE):
+    """
+    Claim a batch of tasks and do them one by one
+
+    :param facade: facade doing the work
+    :type facade: :class:`sagepay.facade.Facade` instance
+    :param batch_size: maximum number of tasks done
+    :type batch_size: int
+    :returns: tuple -- (tasks done, tasks failed), the tasks claimed again by another worker meanwhile aren't counted
+    """
+    done = failed = 0
+    metrics = get_metrics()
+    for task in claim(batch_size, lease):
+        try:
+            with metrics.stage('tasks.notification'):
+                processed = _process(facade, task)
+        except Exception:
+            logger.exception('Notification task %d (%s) failed', task.pk, task.notification.vps_tx_id)
+            _retry_later(task)
+            failed += 1
+        else:
+            done += processed
+    return done, failed
@@ -1 +1,17 @@
-from gateway_tests import GatewayTest, GatewayResponseTest
+from gateway_tests import GatewayTest, GatewayResponseTest, GatewaySessionTest, AsyncGatewayTest, \
+    GatewayRetryTest, CircuitBreakerTest
+from facade_tests import FacadeDeleteTokensTest, FacadeNotificationTest, FacadeTransactionFromTxIdTest, \
+    FacadeRegistryTest
+from models_tests import TokenExpiryTest, VendorTxCodeTest
+from commands_tests import PurgeExpiredTokensTest
+from core_tests import ParseResponseTest, TransactionNotificationPostResponseTest
+from signature_tests import SignatureVerifierTest
+from countries_tests import CountryResolverTest
+from utils_tests import BasketBuilderTest, CountryHelperTest
+from settings_tests import SiteURLsTest
+from dashboard_tests import TransactionListViewTest
+from export_tests import ExportTest
+from analytics_tests import AnalyticsTest
+from testserver_tests import SagePayServerTest
+from metrics_tests import MetricsTest, CheckoutMetricsTest
+from tasks_tests import NotificationQueueTest
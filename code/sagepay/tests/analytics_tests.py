@@ -0,0 +1,121 @@
+import os
+import datetime
+from decimal import Decimal
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from django.utils import timezone
+from django.utils.tzinfo import FixedOffset
+
+from sagepay import analytics
+from sagepay.models import SagePayTransaction, TransactionRollup, NotificationPostResponse
+from sagepay.dashboard.views import TransactionAnalyticsView
+import templates
+
+from dashboard_tests import DashboardTestCase
+
+TEMPLATE_DIRS = (os.path.join(os.path.dirname(__file__), 'templates'),
+                 os.path.join(os.path.dirname(templates.__file__), 'sagepay', 'templates'))
+
+
+class AnalyticsTest(DashboardTestCase):
+
+    def setUp(self):
+        super(AnalyticsTest, self).setUp()
+        # oldest first: amounts 10 to 50, OK/NOTAUTHED alternating, VISA then MC
+        self.transactions.reverse()
+        self.start = timezone.now().replace(hour=1, minute=0, second=0, microsecond=0) - datetime.timedelta(days=1)
+        # the dashboard days start at local midnight, which can be after 1am UTC
+        self.date_from = self.start.date() - datetime.timedelta(days=1)
+        for i, transaction in enumerate(self.transactions):
+            created = self.start + datetime.timedelta(minutes=30 * i)
+            SagePayTransaction.objects.filter(pk=transaction.pk).update(created=created)
+            transaction.created = created
+
+    def test_rollup(self):
+        with self.assertNumQueries(3 * 3):
+            self.assertEqual(3, analytics.rollup(self.start, self.start + datetime.timedelta(hours=3)))
+        rows = TransactionRollup.objects.order_by('period', 'status')
+        self.assertEqual([(0, 'NOTAUTHED', 1, Decimal('20')), (0, 'OK', 1, Decimal('10')),
+                          (1, 'NOTAUTHED', 1, Decimal('40')), (1, 'OK', 1, Decimal('30')),
+                          (2, 'OK', 1, Decimal('50'))],
+                         [((row.period - self.start).seconds // 3600, row.status, row.count, row.amount)
+                          for row in rows])
+        # rebuilding doesn't count twice
+        analytics.rollup(self.start, self.start + datetime.timedelta(hours=3))
+        self.assertEqual(5, TransactionRollup.objects.count())
+
+    def test_record_notification(self):
+        analytics.rollup(self.start, self.start + datetime.timedelta(hours=3))
+        # the only transaction of the third hour, notified again with another card type, changes row
+        transaction = self.transactions[4]
+        notification = NotificationPostResponse(status='OK', card_type='AMEX', threed_secure_status='')
+        analytics.record_notification(transaction, notification, transaction.notification_post_response)
+        rows = TransactionRollup.objects.filter(period=self.start + datetime.timedelta(hours=2))
+        self.assertEqual([('AMEX', 1, Decimal('50')), ('MC', 0, Decimal('0'))],
+                         sorted((row.card_type, row.count, row.amount) for row in rows))
+
+    def test_record_first_notification(self):
+        transaction = self.transactions[1]
+        SagePayTransaction.objects.filter(pk=transaction.pk).update(notification_post_response=None)
+        analytics.rollup(self.start, self.start + datetime.timedelta(hours=1))
+        analytics.record_notification(transaction, transaction.notification_post_response)
+        rows = TransactionRollup.objects.filter(period=self.start)
+        self.assertEqual([('', 0), ('NOTAUTHED', 1), ('OK', 1)], sorted((row.status, row.count) for row in rows))
+
+    def test_local_day(self):
+        period = datetime.datetime(2014, 5, 1, 23, 0, tzinfo=timezone.utc)
+        with timezone.override(FixedOffset(120)):
+            self.assertEqual(datetime.date(2014, 5, 2), analytics.local_day(period))
+        self.assertEqual(datetime.date(2014, 5, 1), analytics.local_day(period.replace(tzinfo=None)))
+
+    def test_summary(self):
+        analytics.rollup(self.start, self.start + datetime.timedelta(hours=3))
+        result = analytics.summary(self.start, self.start + datetime.timedelta(hours=3), 'hour')
+        self.assertEqual([2, 2, 1], [period['count'] for period in result['periods']])
+        self.assertEqual([0.5, 0.5, 1], [period['approved_rate'] for period in result['periods']])
+        self.assertEqual([('VISA', 3, Decimal('60')), ('MC', 2, Decimal('90'))],
+                         [(row['card_type'], row['count'], row['value']) for row in result['card_types']])
+        result = analytics.summary(self.start, self.start + datetime.timedelta(hours=3))
+        self.assertEqual(1, len(result['periods']))
+        self.assertEqual(Decimal('150'), result['periods'][0]['value'])
+        self.assertEqual(0.4, result['periods'][0]['declined_rate'])
+
+    def test_mix_per_period(self):
+        analytics.rollup(self.start, self.start + datetime.timedelta(hours=3))
+        result = analytics.summary(self.start, self.start + datetime.timedelta(hours=3), 'hour')
+        self.assertEqual([[('VISA', 2, Decimal('30'))], [('MC', 1, Decimal('40')), ('VISA', 1, Decimal('30'))],
+                          [('MC', 1, Decimal('50'))]],
+                         [[(row['card_type'], row['count'], row['value']) for row in period['card_types']]
+                          for period in result['periods']])
+        self.assertEqual([[('', 2)], [('', 2)], [('', 1)]],
+                         [[(row['threed_secure_status'], row['count']) for row in period['threed_secure']]
+                          for period in result['periods']])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('rollup_transactions', stdout=out)
+        self.assertEqual(5, sum(TransactionRollup.objects.values_list('count', flat=True)))
+        self.assertIn('hours rolled up', out.getvalue())
+
+    def test_view(self):
+        analytics.rollup(self.start, self.start + datetime.timedelta(hours=3))
+        view = TransactionAnalyticsView.as_view()
+        ctx = view(RequestFactory().get('/dashboard/sagepay/transactions/analytics/')).context_data
+        self.assertEqual('day', ctx['granularity'])
+        self.assertEqual(5, sum(period['count'] for period in ctx['periods']))
+        ctx = view(RequestFactory().get('/dashboard/sagepay/transactions/analytics/?granularity=hour&date_from=%s'
+                                        % self.date_from)).context_data
+        self.assertEqual(3, len(ctx['periods']))
+
+    @override_settings(TEMPLATE_DIRS=TEMPLATE_DIRS)
+    def test_template(self):
+        analytics.rollup(self.start, self.start + datetime.timedelta(hours=3))
+        response = TransactionAnalyticsView.as_view()(RequestFactory().get(
+            '/dashboard/sagepay/transactions/analytics/?granularity=hour&date_from=%s' % self.date_from))
+        content = response.render().content
+        self.assertEqual(3, content.count('<tr class="period">'))
+        self.assertIn('VISA: 2', content)
+        self.assertIn('MC: 1', content)
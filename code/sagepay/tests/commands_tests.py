@@ -0,0 +1,33 @@
+from StringIO import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+import mock
+
+from sagepay.core import Response
+from sagepay.models import Token
+
+
+class PurgeExpiredTokensTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('customer', 'customer@example.com', 'password')
+        for i, expiry_date in enumerate(('0110', '0210', '0310', '1299')):
+            Token.objects.create(token='{%d}' % i, user=user, last_4_digits='0006', card_type='VISA',
+                                 expiry_date=expiry_date)
+        # tokens saved before the expiry month existed
+        Token.objects.filter(token='{0}').update(expiry_month=None)
+
+    def test_dry_run(self):
+        out = StringIO()
+        call_command('purge_expired_tokens', dry_run=True, stdout=out)
+        self.assertIn('3 expired tokens', out.getvalue())
+        self.assertEqual(4, Token.objects.count())
+
+    @mock.patch('sagepay.gateway.Gateway.remove_token')
+    def test_purge(self, remove_token):
+        remove_token.return_value = Response('Status=OK')
+        call_command('purge_expired_tokens', chunk_size=2, workers=2, stdout=StringIO())
+        self.assertEqual(3, remove_token.call_count)
+        self.assertEqual(['1299'], list(Token.objects.values_list('expiry_date', flat=True)))
@@ -0,0 +1,100 @@
+import random
+import string
+
+from django.test import TestCase
+
+from sagepay.core import parse_response, Response, TransactionNotificationPostResponse, Status
+
+
+def legacy_parse_response(response):
+    # parser used by Response before parse_response, kept as the reference for valid input
+    sage_response = {}
+    for i in response.split('\n'):
+        line = i.split('=')
+        if 'NextURL' in line[0]:
+            sage_response[line[0]] = '%s=%s' % (line[1].strip(), line[2].strip())
+        else:
+            sage_response[line[0]] = line[1].strip()
+    return sage_response
+
+
+class ParseResponseTest(TestCase):
+    VALUE_CHARS = string.letters + string.digits + string.punctuation.replace('=', '') + ' '
+
+    def test_values_containing_equal_signs(self):
+        data = parse_response('Status=OK\r\nNextURL=https://test.sagepay.com/?a=1&b=2\r\nStatusDetail=x = y\r\n')
+        self.assertEqual({
+            'Status': 'OK',
+            'NextURL': 'https://test.sagepay.com/?a=1&b=2',
+            'StatusDetail': 'x = y',
+        }, data)
+
+    def test_lines_without_separator_are_ignored(self):
+        self.assertEqual({'Status': 'OK'}, parse_response('\r\nStatus=OK\r\n<html>\r\n'))
+
+    def test_same_result_as_legacy_parser(self):
+        rnd = random.Random(3011)
+        for _ in range(500):
+            lines = []
+            for i in range(rnd.randint(1, 20)):
+                key = ''.join(rnd.choice(string.letters) for _ in range(rnd.randint(1, 15))) + str(i)
+                value = ''.join(rnd.choice(self.VALUE_CHARS) for _ in range(rnd.randint(0, 40)))
+                lines.append('%s=%s' % (key, value))
+            lines.append('NextURL=https://test.sagepay.com/cardselection?vpstxid={%d}' % rnd.randint(0, 10000))
+            rnd.shuffle(lines)
+            body = rnd.choice(('\n', '\r\n')).join(lines)
+            self.assertEqual(legacy_parse_response(body), parse_response(body))
+
+    def test_response_is_parsed_lazily(self):
+        response = Response('Status=OK')
+        self.assertEqual(None, response._data)
+        self.assertTrue(response.is_successful)
+        self.assertFalse(Response('<html>Service unavailable</html>').is_successful)
+
+    def test_notification_from_wire_format(self):
+        notification = TransactionNotificationPostResponse('VPSProtocol=3.00\r\nStatus=OK\r\nVPSTxId={1}')
+        self.assertTrue(notification.ok)
+        self.assertEqual('{1}', notification['VPSTxId'])
+
+
+class TransactionNotificationPostResponseTest(TestCase):
+    NOTIFICATION = {
+        'VPSProtocol': '3.00',
+        'TxType': 'PAYMENT',
+        'VendorTxCode': 'c4ca4238a0b923820dcc509a6f75849b',
+        'VPSTxId': '{1A960910-5F36-3421-24DE-65EF52C13380}',
+        'Status': 'NOTAUTHED',
+        'StatusDetail': '2000 : The Authorisation was Declined by the bank.',
+        'CardType': 'VISA',
+        'Last4Digits': '0006',
+        'Surcharge': '0.50',
+    }
+
+    def setUp(self):
+        self.notification = TransactionNotificationPostResponse(self.NOTIFICATION)
+
+    def test_no_instance_dictionary(self):
+        self.assertFalse(hasattr(self.notification, '__dict__'))
+
+    def test_field_access(self):
+        self.assertEqual('VISA', self.notification['CardType'])
+        self.assertTrue('CardType' in self.notification)
+        self.assertFalse('Token' in self.notification)
+        self.assertRaises(KeyError, lambda: self.notification['Token'])
+        self.assertEqual('', self.notification.get('TxAuthNo', ''))
+
+    def test_unknown_fields_are_kept(self):
+        self.assertEqual({'Surcharge': '0.50'}, self.notification.extra)
+        self.assertEqual('0.50', self.notification['Surcharge'])
+        self.assertEqual(self.NOTIFICATION, self.notification.to_dict())
+
+    def test_status(self):
+        self.assertEqual(Status.NOTAUTHED, self.notification.status_code)
+        self.assertTrue(self.notification.notauthed)
+        self.assertFalse(self.notification.ok)
+        unknown = TransactionNotificationPostResponse({'Status': 'SOMETHING'})
+        self.assertEqual(Status.UNKNOWN, unknown.status_code)
+
+    def test_post_format(self):
+        self.assertEqual('{1A960910-5F36-3421-24DE-65EF52C13380}c4ca4238a0b923820dcc509a6f75849bNOTAUTHEDvendor'
+                         'U5NX3V0WG9VISA0006', self.notification.post_format('vendor', 'U5NX3V0WG9 '))
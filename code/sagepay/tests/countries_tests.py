@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.db.models import get_model
+from django.test import TestCase
+
+from sagepay.models import CountryCode
+from sagepay.countries import CountryResolver, country_resolver
+
+Country = get_model('address', 'Country')
+
+
+class CountryResolverTest(TestCase):
+
+    def setUp(self):
+        self.gb = CountryCode.objects.create(name='United Kingdom', code='GB')
+        self.oscar_gb = Country.objects.create(iso_3166_1_a2='GB', name='UNITED KINGDOM',
+                                               printable_name='United Kingdom')
+        country_resolver.invalidate()
+
+    def test_lookups_after_warm_up(self):
+        country_resolver.country_code('united kingdom')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.gb.pk, country_resolver.country_code(self.oscar_gb).pk)
+            self.assertEqual('GB', country_resolver.country_code(self.gb).sagecode)
+            self.assertEqual('GB', country_resolver.oscar_country(self.gb).pk)
+
+    def test_full_and_unshared_instances(self):
+        country = country_resolver.oscar_country('United Kingdom')
+        # read by Oscar's address search text and summary
+        self.assertEqual(('GB', 'UNITED KINGDOM'), (country.iso_3166_1_a2, country.name))
+        self.assertIsNot(country, country_resolver.oscar_country('United Kingdom'))
+        code = country_resolver.country_code('United Kingdom')
+        self.assertEqual((self.gb.pk, 'United Kingdom', 'GB'), (code.pk, code.name, code.code))
+        self.assertIsNot(code, country_resolver.country_code('United Kingdom'))
+
+    def test_unknown_country(self):
+        self.assertRaises(CountryCode.DoesNotExist, country_resolver.country_code, 'Atlantis')
+        self.assertRaises(Country.DoesNotExist, country_resolver.oscar_country, 'Atlantis')
+
+    def test_saving_invalidates(self):
+        country_resolver.country_code('United Kingdom')
+        self.gb.name = 'Great Britain'
+        self.gb.save()
+        with self.assertNumQueries(2):
+            self.assertEqual(self.gb.pk, country_resolver.country_code('Great Britain').pk)
+
+    def test_shared_cache(self):
+        settings.CACHES['sagepay-test'] = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+        try:
+            CountryResolver('sagepay-test').country_code('United Kingdom')
+            other_process = CountryResolver('sagepay-test')
+            with self.assertNumQueries(0):
+                self.assertEqual(self.gb.pk, other_process.country_code('United Kingdom').pk)
+            other_process.invalidate()
+            with self.assertNumQueries(2):
+                other_process.country_code('United Kingdom')
+        finally:
+            del settings.CACHES['sagepay-test']
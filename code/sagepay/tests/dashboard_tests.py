@@ -0,0 +1,69 @@
+from decimal import Decimal
+import urlparse
+
+from django.db.models import get_model
+from django.test import TestCase
+from django.test.client import RequestFactory
+
+from sagepay.models import CountryCode, NotificationPostResponse, SagePayTransaction
+from sagepay.dashboard.views import TransactionListView
+
+Basket = get_model('basket', 'Basket')
+
+
+class DashboardTestCase(TestCase):
+
+    def setUp(self):
+        basket = Basket.objects.create()
+        country = CountryCode.objects.create(name='United Kingdom', code='GB')
+        self.transactions = []
+        for i in range(5):
+            notification = NotificationPostResponse.objects.create(
+                vps_protocol='3.00', tx_type='PAYMENT', vendor_tx_code='', vps_tx_id='{%d}' % i,
+                status=i % 2 and 'NOTAUTHED' or 'OK', status_detail='', address_result='', postcode_result='',
+                cv2_result='', threed_secure_status='', cavv='', card_type=i < 3 and 'VISA' or 'MC',
+                last_4_digits='0006', decline_code='', expiry_date='1220', bank_auth_ode='')
+            transaction = SagePayTransaction(
+                oscar_basket=basket, oscar_order=i, amount=Decimal(10 * (i + 1)), description='Test',
+                delivery_firstnames='John', delivery_surname='Smith', delivery_address1='88 The Road',
+                delivery_city='London', delivery_postcode='W1A 1AA', delivery_country=country,
+                notification_post_response=notification)
+            transaction.save()
+            self.transactions.append(transaction)
+        self.transactions.reverse()
+
+
+class TransactionListViewTest(DashboardTestCase):
+
+    def get(self, query=''):
+        view = TransactionListView.as_view(page_size=2)
+        return view(RequestFactory().get('/dashboard/sagepay/transactions/?' + query)).context_data
+
+    def test_keyset_pages(self):
+        pages = []
+        query = ''
+        while query is not None:
+            with self.assertNumQueries(2 if query else 1):
+                ctx = self.get(query)
+                for transaction in ctx['transactions']:
+                    transaction.notification_post_response.status
+                    transaction.token
+            pages.append([t.pk for t in ctx['transactions']])
+            query = ctx['next_page']
+        self.assertEqual([t.pk for t in self.transactions], sum(pages, []))
+        self.assertEqual([2, 2, 1], [len(page) for page in pages])
+
+    def test_filters(self):
+        ctx = self.get('status=OK&card_type=visa')
+        self.assertEqual([self.transactions[2].pk, self.transactions[4].pk], [t.pk for t in ctx['transactions']])
+        ctx = self.get('amount_min=20&amount_max=40&after=%d' % self.transactions[1].pk)
+        self.assertEqual([self.transactions[2].pk, self.transactions[3].pk], [t.pk for t in ctx['transactions']])
+        self.assertEqual(None, ctx['next_page'])
+
+    def test_next_page_keeps_filters(self):
+        ctx = self.get('status=NOTAUTHED&amount_min=0')
+        self.assertEqual(None, ctx['next_page'])
+        ctx = self.get('amount_min=0')
+        query = urlparse.parse_qs(ctx['next_page'])
+        self.assertEqual(['0'], query['amount_min'])
+        self.assertEqual([str(self.transactions[1].pk)], query['after'])
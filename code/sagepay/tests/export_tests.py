@@ -0,0 +1,48 @@
+from StringIO import StringIO
+from decimal import Decimal
+import csv
+import json
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.test.client import RequestFactory
+
+from sagepay.dashboard.views import TransactionExportView
+from sagepay.export import export_rows, EXPORT_FIELDS
+
+from dashboard_tests import DashboardTestCase
+
+
+class ExportTest(DashboardTestCase):
+
+    def test_chunks(self):
+        with self.assertNumQueries(3):
+            rows = list(export_rows(chunk_size=2))
+        self.assertEqual([t.vendor_tx_code for t in reversed(self.transactions)], [row[1] for row in rows])
+        self.assertEqual(len(EXPORT_FIELDS), len(rows[0]))
+
+    def test_csv_view(self):
+        response = TransactionExportView.as_view(chunk_size=2)(RequestFactory().get('/?status=OK'))
+        self.assertEqual('text/csv', response['Content-Type'])
+        lines = list(csv.reader(StringIO(''.join(response))))
+        self.assertEqual([column for column, lookup in EXPORT_FIELDS], lines[0])
+        self.assertEqual(['OK'] * 3, [line[6] for line in lines[1:]])
+
+    def test_invalid_view_parameters(self):
+        view = TransactionExportView.as_view()
+        self.assertEqual(400, view(RequestFactory().get('/?format=xml')).status_code)
+        self.assertEqual(400, view(RequestFactory().get('/?date_from=yesterday')).status_code)
+
+    def test_ndjson_command(self):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            call_command('export_transactions', format='ndjson', status='NOTAUTHED', output=path, chunk_size=1,
+                         stderr=StringIO())
+            with open(path) as export:
+                rows = [json.loads(line) for line in export]
+        finally:
+            os.remove(path)
+        self.assertEqual(['NOTAUTHED', 'NOTAUTHED'], [row['status'] for row in rows])
+        self.assertEqual(Decimal('20'), Decimal(rows[0]['amount']))
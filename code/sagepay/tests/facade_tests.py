@@ -0,0 +1,255 @@
+import time
+import threading
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db.models import get_model
+from django.test import TestCase
+from multiprocessing.pool import ThreadPool
+import mock
+
+from sagepay.models import Token, CountryCode, TransactionRegistrationServerResponse, SagePayTransaction, \
+    TransactionRollup, NotificationPostResponse
+from sagepay.core import Response, TransactionNotificationPostResponse
+from sagepay.exceptions import GatewayException
+from sagepay import facade as facade_module
+from sagepay.facade import Facade, get_facade, override_facade
+from sagepay.signature import SignatureVerifier
+from sagepay.cache import transaction_ids
+from sagepay.settings import THANK_YOU_URL, ERROR_URL
+
+Basket = get_model('basket', 'Basket')
+
+
+class FacadeDeleteTokensTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('customer', 'customer@example.com', 'password')
+        self.tokens = [Token.objects.create(token='{%d}' % i, user=self.user, last_4_digits='0006', card_type='VISA',
+                                            expiry_date='1220') for i in range(3)]
+        self.facade = Facade()
+
+    def test_only_removed_tokens_are_deleted(self):
+        answers = {
+            '{0}': Response('Status=OK'),
+            '{1}': Response('Status=INVALID\nStatusDetail=4041 : The Token is invalid.'),
+        }
+
+        def remove_token(data):
+            if data['Token'] in answers:
+                return answers[data['Token']]
+            raise GatewayException('timeout')
+
+        with mock.patch.object(self.facade.gateway, 'remove_token', side_effect=remove_token):
+            results = self.facade.delete_tokens(Token.objects.filter(user=self.user), workers=2)
+
+        self.assertEqual((True, ''), results[self.tokens[0].pk])
+        self.assertEqual((False, '4041 : The Token is invalid.'), results[self.tokens[1].pk])
+        self.assertEqual((False, 'timeout'), results[self.tokens[2].pk])
+        self.assertEqual([self.tokens[1].pk, self.tokens[2].pk],
+                         list(Token.objects.order_by('pk').values_list('pk', flat=True)))
+
+    @mock.patch('sagepay.facade.DELETE_CHUNK_SIZE', 2)
+    def test_bounded_and_deleted_in_chunks(self):
+        running = []
+        lock = threading.Lock()
+
+        def remove_token(data):
+            with lock:
+                running.append(data['Token'])
+                concurrent.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.remove(data['Token'])
+            return Response('Status=OK')
+
+        concurrent = []
+        with mock.patch.object(self.facade.gateway, 'remove_token', side_effect=remove_token):
+            # look for the tokens, then per chunk of two: update the transactions, collect the tokens and their
+            # transactions, delete the tokens
+            with self.assertNumQueries(9):
+                results = self.facade.delete_tokens(Token.objects.filter(user=self.user), workers=2)
+        self.assertEqual(3, len(results))
+        self.assertTrue(max(concurrent) <= 2)
+        self.assertEqual(0, Token.objects.count())
+
+
+class FacadeRegistryTest(TestCase):
+
+    def setUp(self):
+        facade_module._facades.clear()
+
+    def test_shared_per_site(self):
+        site = mock.Mock(domain='shop.example.org')
+        self.assertIs(get_facade(), get_facade())
+        self.assertIs(get_facade(site), get_facade(site))
+        self.assertIsNot(get_facade(), get_facade(site))
+        self.assertIs(get_facade().gateway, Facade().gateway)
+
+    def test_created_once_by_concurrent_threads(self):
+        site = mock.Mock(domain='shop.example.org')
+        pool = ThreadPool(8)
+        facades = pool.map(lambda i: get_facade(site), range(32))
+        pool.close()
+        self.assertEqual(1, len(set(id(facade) for facade in facades)))
+
+    def test_override(self):
+        fake = mock.Mock(spec=Facade)
+        with override_facade(fake):
+            self.assertIs(fake, get_facade())
+        self.assertIsNot(fake, get_facade())
+
+
+class FacadeTransactionTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('customer', 'customer@example.com', 'password')
+        country = CountryCode.objects.create(name='United Kingdom', code='GB')
+        self.registration = TransactionRegistrationServerResponse.objects.create(
+            vps_protocol='3.00', vendor='testvendor', vps_tx_id='{1A960910-5F36-3421-24DE-65EF52C13380}',
+            security_key='U5NX3V0WG9', status='OK', status_detail='', next_url='https://test.sagepay.com/')
+        self.transaction = SagePayTransaction(
+            oscar_basket=Basket.objects.create(owner=self.user), oscar_order=1, amount='10.00',
+            description='Test', delivery_firstnames='John', delivery_surname='Smith', delivery_address1='88 The Road',
+            delivery_city='London', delivery_postcode='W1A 1AA', delivery_country=country,
+            transaction_registration_server_response=self.registration, vps_tx_id=self.registration.vps_tx_id)
+        self.transaction.save()
+        self.facade = Facade()
+        transaction_ids.clear()
+
+    def notification(self, signed=True, **fields):
+        data = {
+            'VPSProtocol': '3.00', 'TxType': 'PAYMENT', 'VPSTxId': self.registration.vps_tx_id,
+            'VendorTxCode': self.transaction.vendor_tx_code, 'Status': 'OK',
+            'StatusDetail': '0000 : The Authorisation was Successful.', 'TxAuthNo': '7349', 'AVSCV2': 'ALL MATCH',
+            'AddressResult': 'MATCHED', 'PostCodeResult': 'MATCHED', 'CV2Result': 'MATCHED', 'GiftAid': '0',
+            '3DSecureStatus': 'OK', 'CardType': 'VISA', 'Last4Digits': '0006', 'DeclineCode': '00',
+            'ExpiryDate': '1220', 'BankAuthCode': '999777',
+        }
+        data.update(fields)
+        verifier = SignatureVerifier('testvendor', signed and 'U5NX3V0WG9' or 'WRONGKEY00')
+        data['VPSSignature'] = verifier.signature(TransactionNotificationPostResponse(data))
+        return data
+
+
+class FacadeNotificationTest(FacadeTransactionTestCase):
+
+    def test_ok(self):
+        # select the transaction, insert the notification, update the transaction
+        with self.assertNumQueries(3):
+            reply = self.facade.check_transaction_notification(self.notification())
+        self.assertEqual('Status=OK\r\nRedirectURL=%s%s\r\n' % (THANK_YOU_URL, self.registration.vps_tx_id), reply)
+        transaction = SagePayTransaction.objects.select_related('notification_post_response').get(
+            pk=self.transaction.pk)
+        self.assertTrue(transaction.notification_post_response.hash_match)
+        self.assertTrue(transaction.notification_post_response.replied)
+        self.assertEqual(reply, transaction.notification_post_response.reply_text)
+        self.assertEqual(None, transaction.token_id)
+
+    def test_ok_with_token(self):
+        with self.assertNumQueries(4):
+            self.facade.check_transaction_notification(self.notification(Token='{CDA1F5D2-1F3A-4C68-8D5B-3E1B7F4E1A3B}'))
+        token = SagePayTransaction.objects.get(pk=self.transaction.pk).token
+        self.assertEqual('{CDA1F5D2-1F3A-4C68-8D5B-3E1B7F4E1A3B}', token.token)
+        self.assertEqual(self.user.pk, token.user_id)
+
+    def test_paid_with_a_saved_card(self):
+        saved = Token.objects.create(token='{CDA1F5D2-1F3A-4C68-8D5B-3E1B7F4E1A3B}', user=self.user,
+                                     last_4_digits='0006', card_type='VISA', expiry_date='1220')
+        SagePayTransaction.objects.filter(pk=self.transaction.pk).update(token=saved)
+        self.facade.check_transaction_notification(self.notification(Token='{CDA1F5D2-1F3A-4C68-8D5B-3E1B7F4E1A3B}'))
+        self.assertEqual(saved.pk, SagePayTransaction.objects.get(pk=self.transaction.pk).token_id)
+        self.assertEqual(1, Token.objects.count())
+
+    @mock.patch('sagepay.facade.ROLLUP_ON_NOTIFICATION', True)
+    def test_rollup_on_notification(self):
+        self.facade.check_transaction_notification(self.notification())
+        rollup = TransactionRollup.objects.get()
+        self.assertEqual(('OK', 1, Decimal('10')), (rollup.status, rollup.count, rollup.amount))
+
+    def test_not_authorised(self):
+        reply = self.facade.check_transaction_notification(self.notification(Status='NOTAUTHED'))
+        self.assertEqual('Status=OK\r\nRedirectURL=%s1\r\n' % ERROR_URL, reply)
+
+    def test_invalid_signature(self):
+        with self.assertNumQueries(3):
+            reply = self.facade.check_transaction_notification(
+                self.notification(signed=False, Token='{CDA1F5D2-1F3A-4C68-8D5B-3E1B7F4E1A3B}'))
+        self.assertTrue(reply.startswith('Status=INVALID'))
+        transaction = SagePayTransaction.objects.get(pk=self.transaction.pk)
+        self.assertFalse(transaction.notification_post_response.hash_match)
+        self.assertEqual(None, transaction.token_id)
+        self.assertEqual(0, Token.objects.count())
+
+    def test_unknown_transaction(self):
+        # select the transaction, then through its registration, insert the notification
+        with self.assertNumQueries(3):
+            reply = self.facade.check_transaction_notification(self.notification(VPSTxId='{UNKNOWN}'))
+        self.assertTrue(reply.startswith('Status=ERROR'))
+
+    def test_retry(self):
+        notification = self.notification(Token='{CDA1F5D2-1F3A-4C68-8D5B-3E1B7F4E1A3B}')
+        reply = self.facade.check_transaction_notification(notification)
+        # the transaction is fetched with its notification, nothing is validated or saved again
+        with self.assertNumQueries(1):
+            self.assertEqual(reply, self.facade.check_transaction_notification(notification))
+        self.assertEqual(1, NotificationPostResponse.objects.count())
+        self.assertEqual(1, Token.objects.count())
+
+    def test_retry_of_previous_status(self):
+        authenticated = self.notification(Status='AUTHENTICATED')
+        self.facade.check_transaction_notification(authenticated)
+        ok = self.facade.check_transaction_notification(self.notification())
+        self.assertEqual('', self.facade.check_transaction_notification(authenticated))
+        self.assertEqual(2, NotificationPostResponse.objects.count())
+        transaction = SagePayTransaction.objects.select_related('notification_post_response').get(
+            pk=self.transaction.pk)
+        self.assertEqual(ok, transaction.notification_post_response.reply_text)
+
+    def test_unsigned_notifications_dont_block_retries(self):
+        self.facade.check_transaction_notification(self.notification(signed=False))
+        self.facade.check_transaction_notification(self.notification(signed=False))
+        reply = self.facade.check_transaction_notification(self.notification())
+        self.assertTrue(reply.startswith('Status=OK'))
+        self.assertEqual(3, NotificationPostResponse.objects.count())
+        self.assertEqual(1, NotificationPostResponse.objects.filter(notification_key__isnull=False).count())
+
+
+class FacadeTransactionFromTxIdTest(FacadeTransactionTestCase):
+
+    def test_cached(self):
+        self.facade.order_basket_amount_from_tx_id(self.registration.vps_tx_id)
+        self.assertEqual(self.transaction.pk, transaction_ids.get(self.registration.vps_tx_id))
+        with self.assertNumQueries(1):
+            transaction = self.facade._sage_transaction_from_tx_id(self.registration.vps_tx_id)
+        self.assertEqual(self.transaction.pk, transaction.pk)
+
+    def test_saving_invalidates(self):
+        self.facade._sage_transaction_from_tx_id(self.registration.vps_tx_id)
+        self.transaction.save()
+        self.assertEqual(None, transaction_ids.get(self.registration.vps_tx_id))
+
+    def test_stale_entry(self):
+        transaction_ids.set(self.registration.vps_tx_id, self.transaction.pk + 1)
+        transaction = self.facade._sage_transaction_from_tx_id(self.registration.vps_tx_id)
+        self.assertEqual(self.transaction.pk, transaction.pk)
+        self.assertEqual(self.transaction.pk, transaction_ids.get(self.registration.vps_tx_id))
+
+    def test_transaction_without_vps_tx_id(self):
+        SagePayTransaction.objects.filter(pk=self.transaction.pk).update(vps_tx_id=None)
+        transaction = self.facade._sage_transaction_from_tx_id(self.registration.vps_tx_id)
+        self.assertEqual(self.transaction.pk, transaction.pk)
+        self.assertEqual(self.registration.vps_tx_id, SagePayTransaction.objects.get(pk=self.transaction.pk).vps_tx_id)
+
+    def test_registration_saved(self):
+        transaction = SagePayTransaction.objects.create(
+            oscar_basket=self.transaction.oscar_basket, oscar_order=2, amount='10.00', description='Test',
+            delivery_firstnames='John', delivery_surname='Smith', delivery_address1='88 The Road',
+            delivery_city='London', delivery_postcode='W1A 1AA', delivery_country=self.transaction.delivery_country)
+        response = Response('VPSProtocol=3.00\nStatus=OK\nStatusDetail=\nVPSTxId={2B960910-5F36-3421-24DE-65EF52C13380}'
+                            '\nSecurityKey=U5NX3V0WG9\nNextURL=https://test.sagepay.com/')
+        # insert the registration, update the transaction
+        with self.assertNumQueries(2):
+            self.facade._save_server_registration_response(transaction, response)
+        saved = self.facade._sage_transaction_from_tx_id('{2B960910-5F36-3421-24DE-65EF52C13380}')
+        self.assertEqual((transaction.pk, transaction.vendor_tx_code), (saved.pk, saved.vendor_tx_code))
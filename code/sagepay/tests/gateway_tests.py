@@ -1,11 +1,21 @@
+from decimal import Decimal
 from types import TupleType, BooleanType
+from multiprocessing.pool import ThreadPool
 
+from django.db.models import get_model
 from django.test import TestCase
 import mock
+import requests
 
 from sagepay.models import SagePayTransaction, CountryCode
-from sagepay.gateway import Gateway, Response
-from sagepay.exceptions import GatewayException
+from sagepay import gateway as gateway_module
+from sagepay.gateway import Gateway, AsyncGateway, CircuitBreaker, Response, get_gateway
+from sagepay.facade import Facade
+from sagepay.exceptions import GatewayException, CircuitOpenException
+from sagepay.settings import CONNECT_TIMEOUT, READ_TIMEOUT, CIRCUIT_RESET_TIMEOUT
+from sagepay.testserver import SagePayServer
+
+Basket = get_model('basket', 'Basket')
 
 
 class GatewayResponseTest(TestCase):
@@ -30,20 +40,23 @@ StatusDetail=3011 : The NotificationURL format is invalid."""
 
 
 class GatewayTest(TestCase):
-    SAGEPAY_SERVER = 'https://test.sagepay.com/gateway/service/vspserver-register.vsp'
-    WRONG_URL = 'http://fdsfdsfdsf.com'
+    # nothing listens on port 1
+    WRONG_URL = 'http://127.0.0.1:1/gateway/service/vspserver-register.vsp'
     PROFILE = 'LOW'
     NOTIFICATION_URL = 'http://test.com'
     WRONG_NOTIFICATION_URL = 'test.com'
 
     def setUp(self):
+        gateway_module._breakers.clear()
+        self.server = SagePayServer().start()
+        self.addCleanup(self.server.stop)
+        self.SAGEPAY_SERVER = self.server.register_url
         uk = CountryCode(name='United Kingdom', code='GB')
         uk.save()
         self.transaction = SagePayTransaction(
-                amount=10,
-                oscar_basket = 1,
-                oscar_order = 1,
-                oscar_user=1,
+                amount=Decimal('10.00'),
+                oscar_basket=Basket.objects.create(),
+                oscar_order=1,
                 description='test',
                 billing_firstnames='Alex',
                 billing_surname='udox',
@@ -62,7 +75,7 @@ class GatewayTest(TestCase):
 
     def test_register_payment_method_return_type(self):
         gateway = Gateway(self.PROFILE, self.NOTIFICATION_URL, self.SAGEPAY_SERVER)
-        register = gateway.register_payment(self.transaction)
+        register = gateway.register_payment(self.transaction, False)
         tuple_type = type(register)
         boolean_type = type(register[1])
         self.assertIs(TupleType, tuple_type, 'Gateway.register_payment must return a tuple')
@@ -71,14 +84,199 @@ class GatewayTest(TestCase):
 
     def test_register_payment_method_sage_response_status_successful(self):
         gateway = Gateway(self.PROFILE, self.NOTIFICATION_URL, self.SAGEPAY_SERVER)
-        register = gateway.register_payment(self.transaction)
+        register = gateway.register_payment(self.transaction, False)
         self.assertEqual(register[0].is_successful, True, 'Status response should have returned True, something went wrong with the payment registration')
 
     def test_register_payment_method_sage_response_status_not_successful(self):
         gateway = Gateway(self.PROFILE, self.WRONG_NOTIFICATION_URL, self.SAGEPAY_SERVER)
-        register = gateway.register_payment(self.transaction)
+        register = gateway.register_payment(self.transaction, False)
         self.assertEqual(register[0].is_successful, False, 'Status response should have returned False, something went wrong with the payment registration')
 
     def test_register_payment_method_exception(self):
         gateway = Gateway(self.PROFILE, self.NOTIFICATION_URL, self.WRONG_URL)
-        self.assertRaises(GatewayException, gateway.register_payment, self.transaction)
+        with mock.patch('sagepay.gateway.time.sleep'):
+            self.assertRaises(GatewayException, gateway.register_payment, self.transaction, False)
+
+    @mock.patch('sagepay.gateway.time.sleep')
+    def test_retry_uses_new_vendor_tx_code(self, sleep):
+        sent = []
+
+        def post(url, data, timeout):
+            sent.append(data['VendorTxCode'])
+            if len(sent) == 1:
+                # the registration may have reached SagePay, only its reply is lost
+                raise requests.Timeout
+            return mock.Mock(status_code=200, text='VPSProtocol=3.00\nStatus=OK\nStatusDetail=\nSecurityKey=U5NX3V0WG9'
+                                                   '\nVPSTxId={1A960910-5F36-3421-24DE-65EF52C13380}\nNextURL=https://')
+
+        gateway = Gateway(self.PROFILE, self.NOTIFICATION_URL, self.SAGEPAY_SERVER, session=mock.Mock(post=post))
+        first = self.transaction.vendor_tx_code
+        with mock.patch('sagepay.gateway.RETRIES', 2):
+            with self.assertNumQueries(0):
+                response, ok = gateway.register_payment(self.transaction, False)
+        self.assertTrue(ok)
+        self.assertEqual(2, len(sent))
+        self.assertEqual(first, sent[0])
+        self.assertNotEqual(first, sent[1])
+        # the gateway leaves the transaction alone, the facade saves the code with the response
+        self.assertEqual((sent[1], first), (response.vendor_tx_code, self.transaction.vendor_tx_code))
+        Facade()._save_server_registration_response(self.transaction, response)
+        self.assertEqual(sent[1], SagePayTransaction.objects.get(pk=self.transaction.pk).vendor_tx_code)
+
+
+class GatewaySessionTest(TestCase):
+    SAGEPAY_SERVER = 'https://test.sagepay.com/gateway/service/vspserver-register.vsp'
+    PROFILE = 'LOW'
+    NOTIFICATION_URL = 'http://test.com'
+
+    def setUp(self):
+        gateway_module._breakers.clear()
+
+    def test_gateways_share_the_process_session(self):
+        first = Gateway(self.PROFILE, self.NOTIFICATION_URL, self.SAGEPAY_SERVER)
+        second = Gateway(self.PROFILE, self.NOTIFICATION_URL, self.SAGEPAY_SERVER)
+        self.assertIs(first.session, second.session)
+
+    def test_shared_gateways(self):
+        gateway = get_gateway(self.PROFILE, self.NOTIFICATION_URL, self.SAGEPAY_SERVER)
+        self.assertIs(gateway, get_gateway(self.PROFILE, self.NOTIFICATION_URL, self.SAGEPAY_SERVER))
+        self.assertIsInstance(get_gateway(self.PROFILE, self.NOTIFICATION_URL, self.SAGEPAY_SERVER, AsyncGateway),
+                              AsyncGateway)
+        self.assertIsNot(gateway, get_gateway(self.PROFILE, 'http://other.com', self.SAGEPAY_SERVER))
+
+    def test_shared_gateway_follows_forks(self):
+        gateway = get_gateway(self.PROFILE, self.NOTIFICATION_URL, self.SAGEPAY_SERVER)
+        session = gateway.session
+        with mock.patch('os.getpid', return_value=-1):
+            self.assertIsNot(session, gateway.session)
+
+    def test_post_uses_session_and_timeouts(self):
+        session = mock.Mock()
+        session.post.return_value.status_code = 200
+        session.post.return_value.text = 'Status=OK'
+        gateway = Gateway(self.PROFILE, self.NOTIFICATION_URL, self.SAGEPAY_SERVER, session=session)
+        response = gateway.post(self.SAGEPAY_SERVER, {'TxType': 'PAYMENT'})
+        session.post.assert_called_once_with(self.SAGEPAY_SERVER, data={'TxType': 'PAYMENT'},
+                                             timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+        self.assertTrue(response.is_successful)
+
+    def test_post_timeout_raises_gateway_exception(self):
+        session = mock.Mock()
+        session.post.side_effect = requests.Timeout
+        gateway = Gateway(self.PROFILE, self.NOTIFICATION_URL, self.SAGEPAY_SERVER, session=session)
+        self.assertRaises(GatewayException, gateway.post, self.SAGEPAY_SERVER, {})
+
+
+class AsyncGatewayTest(TestCase):
+    SAGEPAY_SERVER = 'https://test.sagepay.com/gateway/service/vspserver-register.vsp'
+    PROFILE = 'LOW'
+    NOTIFICATION_URL = 'http://test.com'
+
+    def setUp(self):
+        gateway_module._breakers.clear()
+        self.session = mock.Mock()
+        self.session.post.return_value.status_code = 200
+        self.gateway = AsyncGateway(self.PROFILE, self.NOTIFICATION_URL, self.SAGEPAY_SERVER,
+                                    session=self.session, workers=ThreadPool(1))
+        self.token = mock.Mock(token='{1A960910-5F36-3421-24DE-65EF52C13380}')
+
+    def test_delete_token_result(self):
+        self.session.post.return_value.text = 'Status=OK'
+        result = self.gateway.delete_token(self.token)
+        self.assertEqual(True, result.get(5))
+
+    def test_gateway_exception_raised_by_get(self):
+        self.session.post.side_effect = requests.ConnectionError
+        result = self.gateway.delete_token(self.token)
+        self.assertRaises(GatewayException, result.get, 5)
+
+
+class GatewayRetryTest(TestCase):
+    SAGEPAY_SERVER = 'https://test.sagepay.com/gateway/service/vspserver-register.vsp'
+    PROFILE = 'LOW'
+    NOTIFICATION_URL = 'http://test.com'
+
+    def setUp(self):
+        gateway_module._breakers.clear()
+        self.session = mock.Mock()
+        self.gateway = Gateway(self.PROFILE, self.NOTIFICATION_URL, self.SAGEPAY_SERVER, session=self.session)
+        self.ok = mock.Mock(status_code=200, text='Status=OK')
+
+    @mock.patch('sagepay.gateway.time.sleep')
+    def test_post_retries_until_success(self, sleep):
+        self.session.post.side_effect = [requests.ConnectionError, requests.Timeout, self.ok]
+        response = self.gateway.post(self.SAGEPAY_SERVER, {}, retries=2)
+        self.assertTrue(response.is_successful)
+        self.assertEqual(3, self.session.post.call_count)
+        self.assertEqual(2, sleep.call_count)
+
+    @mock.patch('sagepay.gateway.time.sleep')
+    def test_post_gives_up_after_retries(self, sleep):
+        self.session.post.side_effect = requests.ConnectionError
+        self.assertRaises(GatewayException, self.gateway.post, self.SAGEPAY_SERVER, {}, 1)
+        self.assertEqual(2, self.session.post.call_count)
+
+    def test_server_error_is_a_failure(self):
+        self.session.post.return_value = mock.Mock(status_code=503, text='')
+        self.assertRaises(GatewayException, self.gateway.post, self.SAGEPAY_SERVER, {})
+
+    def test_bug_is_not_a_failure(self):
+        breaker = gateway_module.get_circuit_breaker(self.SAGEPAY_SERVER)
+        breaker._open()
+        breaker.opened_at -= CIRCUIT_RESET_TIMEOUT
+        self.session.post.side_effect = ValueError
+        self.assertRaises(ValueError, self.gateway.post, self.SAGEPAY_SERVER, {})
+        # still half open, the next request is the trial
+        self.assertEqual('half-open', self.gateway.circuit_stats()['state'])
+        self.session.post.side_effect = None
+        self.session.post.return_value = self.ok
+        self.assertTrue(self.gateway.post(self.SAGEPAY_SERVER, {}).is_successful)
+        self.assertEqual((0, 'closed'), (breaker.stats()['failures'], breaker.stats()['state']))
+
+    def test_open_circuit_fails_fast(self):
+        breaker = gateway_module.get_circuit_breaker(self.SAGEPAY_SERVER)
+        breaker._open()
+        self.assertRaises(CircuitOpenException, self.gateway.post, self.SAGEPAY_SERVER, {})
+        self.assertFalse(self.session.post.called)
+        self.assertEqual('open', self.gateway.circuit_stats()['state'])
+
+
+class CircuitBreakerTest(TestCase):
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(error_rate=0.5, min_requests=4, window=4, reset_timeout=30)
+
+    def test_opens_on_error_rate(self):
+        self.breaker.record_success()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+        self.breaker.record_failure()
+        self.assertEqual(CircuitBreaker.OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.allow())
+
+    def test_half_open_lets_one_trial_through(self):
+        self.breaker._open()
+        self.breaker.opened_at -= 31
+        self.assertEqual(CircuitBreaker.HALF_OPEN, self.breaker.allow())
+        self.assertEqual(CircuitBreaker.HALF_OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_success(trial=True)
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+
+    def test_only_the_trial_closes(self):
+        self.breaker._open()
+        self.breaker.opened_at -= 31
+        self.breaker.allow()
+        # answers to the requests sent before the breaker opened
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(CircuitBreaker.HALF_OPEN, self.breaker.state)
+        self.assertEqual(0, self.breaker.stats()['requests'])
+
+    def test_failed_trial_opens_again(self):
+        self.breaker._open()
+        self.breaker.opened_at -= 31
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure(trial=True)
+        self.assertEqual(CircuitBreaker.OPEN, self.breaker.state)
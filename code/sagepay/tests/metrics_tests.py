@@ -0,0 +1,112 @@
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models import get_model
+from django.test import TestCase
+import mock
+
+from sagepay import gateway as gateway_module
+from sagepay import metrics as metrics_module
+from sagepay.facade import Facade
+from sagepay.metrics import Metrics, PrometheusMetrics, StatsdMetrics, query_counter, get_metrics
+from sagepay.models import CountryCode
+from sagepay.testserver import SagePayServer
+
+Basket = get_model('basket', 'Basket')
+Line = get_model('basket', 'Line')
+Product = get_model('catalogue', 'Product')
+ProductClass = get_model('catalogue', 'ProductClass')
+
+
+class MetricsTest(TestCase):
+
+    def test_noop(self):
+        metrics = Metrics()
+        with metrics.stage('facade.authorize') as stage:
+            CountryCode.objects.count()
+        self.assertFalse(hasattr(stage, 'counter'))
+        self.assertEqual(Metrics, get_metrics().__class__)
+
+    def test_query_counter(self):
+        db = connections[DEFAULT_DB_ALIAS]
+        recorded = len(db.queries)
+        with query_counter() as outer:
+            CountryCode.objects.create(name='United Kingdom', code='GB')
+            with query_counter() as inner:
+                CountryCode.objects.count()
+            CountryCode.objects.count()
+        self.assertEqual((3, 1), (outer.count, inner.count))
+        # the debug cursor is left as it was found
+        self.assertFalse('make_debug_cursor' in db.__dict__)
+        self.assertEqual(recorded, len(db.queries))
+
+    def test_query_counter_recording(self):
+        with self.assertNumQueries(2):
+            with query_counter() as counter:
+                CountryCode.objects.count()
+                CountryCode.objects.count()
+        self.assertEqual(2, counter.count)
+
+    def test_prometheus(self):
+        metrics = PrometheusMetrics()
+        for i in range(2):
+            with metrics.stage('facade.authorize'):
+                CountryCode.objects.count()
+        try:
+            with metrics.stage('facade.authorize'):
+                raise ValueError
+        except ValueError:
+            pass
+        metrics.status('gateway.post', 'OK')
+        lines = metrics.exposition().splitlines()
+        self.assertTrue('# TYPE sagepay_facade_authorize_time summary' in lines)
+        self.assertTrue('sagepay_facade_authorize_time_count 3' in lines)
+        self.assertTrue('sagepay_facade_authorize_queries_sum 2.0' in lines)
+        self.assertTrue('sagepay_facade_authorize_errors_total 1' in lines)
+        self.assertTrue('# TYPE sagepay_gateway_post_status_OK_total counter' in lines)
+        self.assertTrue('sagepay_gateway_post_status_OK_total 1' in lines)
+
+    def test_statsd(self):
+        with mock.patch('socket.socket') as socket:
+            metrics = StatsdMetrics(host='statsd', prefix='shop', count_queries=False)
+            with metrics.stage('views.finalise'):
+                pass
+            metrics.status('facade.notification', 'NOTAUTHED')
+        packets = [call[0][0] for call in socket.return_value.sendto.call_args_list]
+        self.assertEqual(['shop.views.finalise.time', 'shop.facade.notification.status.NOTAUTHED:1|c'],
+                         [packets[0].split(':')[0], packets[1]])
+        self.assertTrue(packets[0].endswith('|ms'))
+        self.assertEqual(('statsd', 8125), socket.return_value.sendto.call_args[0][1])
+
+
+class CheckoutMetricsTest(TestCase):
+
+    def setUp(self):
+        gateway_module._breakers.clear()
+        self.server = SagePayServer(poster=lambda url, data: self.facade.check_transaction_notification(data)).start()
+        self.addCleanup(self.server.stop)
+        self.metrics = PrometheusMetrics()
+        patcher = mock.patch.object(metrics_module, '_metrics', self.metrics)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with mock.patch('sagepay.facade.SAGE_SERVER_URL', self.server.register_url):
+            self.facade = Facade(mock.Mock(domain='shop.example.org'))
+
+    def test_stages(self):
+        user = User.objects.create_user('customer', 'customer@example.com', 'password')
+        address = mock.Mock(first_name='John', last_name='Smith', line1='88 The Road', line2='', line4='London',
+                            postcode='W1A 1AA', country=CountryCode.objects.create(name='United Kingdom', code='GB'))
+        basket = Basket.objects.create(owner=user)
+        product = Product.objects.create(title='Book', product_class=ProductClass.objects.create(name='Books'))
+        Line.objects.create(basket=basket, line_reference='book', product=product, quantity=1,
+                            price_excl_tax=Decimal('8.00'), price_incl_tax=Decimal('9.60'))
+        tx_id = self.facade.authorize(1, basket, Decimal('10.00'), address)
+        self.server.notify(tx_id, 'NOTAUTHED')
+        self.assertEqual(1, self.metrics.counters['sagepay.gateway.post.status.OK'])
+        self.assertEqual(1, self.metrics.counters['sagepay.facade.notification.status.NOTAUTHED'])
+        for stage in ('gateway.post', 'facade.authorize', 'facade.notification'):
+            self.assertEqual(1, self.metrics.summaries['sagepay.%s.time' % stage][1])
+        # registering saves the transaction and the registration response
+        self.assertTrue(self.metrics.summaries['sagepay.facade.authorize.queries'][0] > 0)
+        self.assertEqual(0, self.metrics.summaries['sagepay.gateway.post.queries'][0])
@@ -0,0 +1,53 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.db.models import get_model
+from django.test import TestCase
+import mock
+
+from sagepay.models import Token, CountryCode, SagePayTransaction, expiry_month, new_vendor_tx_code
+
+Basket = get_model('basket', 'Basket')
+
+
+class TokenExpiryTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('customer', 'customer@example.com', 'password')
+        self.expired = Token.objects.create(token='{1}', user=user, last_4_digits='0006', card_type='VISA',
+                                            expiry_date='0514')
+        self.valid = Token.objects.create(token='{2}', user=user, last_4_digits='0006', card_type='VISA',
+                                          expiry_date='0614')
+
+    def test_expiry_month(self):
+        self.assertEqual(datetime.date(2014, 5, 1), expiry_month('0514'))
+        self.assertEqual(None, expiry_month('1314'))
+        self.assertEqual(None, expiry_month(''))
+
+    def test_expired_tokens(self):
+        today = datetime.date(2014, 6, 30)
+        self.assertEqual([self.expired], list(Token.objects.expired(today)))
+        self.assertEqual([self.valid], list(Token.objects.unexpired(today)))
+
+
+class VendorTxCodeTest(TestCase):
+
+    def test_unique_and_time_ordered(self):
+        codes = [new_vendor_tx_code() for i in range(1000)]
+        self.assertEqual(1000, len(set(codes)))
+        self.assertTrue(all(len(code) == 32 for code in codes))
+        with mock.patch('time.time', return_value=1400000000):
+            earlier = new_vendor_tx_code()
+        self.assertTrue(earlier < codes[0])
+
+    def test_generated_once(self):
+        country = CountryCode.objects.create(name='United Kingdom', code='GB')
+        transaction = SagePayTransaction(
+            oscar_basket=Basket.objects.create(), oscar_order=1, amount='10.00', description='Test',
+            delivery_firstnames='John', delivery_surname='Smith', delivery_address1='88 The Road',
+            delivery_city='London', delivery_postcode='W1A 1AA', delivery_country=country)
+        transaction.save()
+        code = transaction.vendor_tx_code
+        transaction.vps_tx_id = '{1A960910-5F36-3421-24DE-65EF52C13380}'
+        transaction.save()
+        self.assertEqual(code, SagePayTransaction.objects.get(pk=transaction.pk).vendor_tx_code)
@@ -0,0 +1,42 @@
+from django.contrib.sites.models import Site
+from django.test import TestCase
+import mock
+
+from sagepay.settings import SiteURLs, NOTIFICATION_URL
+from sagepay.facade import Facade
+
+
+class FakeSite(object):
+
+    def __init__(self, domain):
+        self.domain = domain
+
+
+class SiteURLsTest(TestCase):
+
+    def setUp(self):
+        self.urls = SiteURLs()
+        Site.objects.clear_cache()
+
+    def test_built_once_per_site(self):
+        with self.assertNumQueries(1):
+            self.assertEqual('http://%s/sagepay/notification/' % Site.objects.get_current().domain,
+                             self.urls.get('notification'))
+        with self.assertNumQueries(0):
+            self.urls.get('thank_you')
+            self.assertEqual('http://shop.example.org/sagepay/error/',
+                             self.urls.get('error', FakeSite('shop.example.org')))
+
+    def test_site_overrides(self):
+        overrides = {'shop.example.org': {'thank_you': 'https://shop.example.org/checkout/thankyou/'}}
+        with mock.patch('sagepay.settings.SITE_URLS', overrides):
+            urls = self.urls.for_site(FakeSite('shop.example.org'))
+        self.assertEqual('https://shop.example.org/checkout/thankyou/', urls['thank_you'])
+        self.assertEqual('http://shop.example.org/sagepay/notification/', urls['notification'])
+
+    def test_lazy_module_urls(self):
+        self.assertEqual('http://%s/sagepay/notification/' % Site.objects.get_current().domain, str(NOTIFICATION_URL))
+
+    def test_facade_site(self):
+        facade = Facade(site=FakeSite('shop.example.org'))
+        self.assertEqual('http://shop.example.org/sagepay/notification/', facade.gateway.notification_url)
@@ -0,0 +1,128 @@
+import hashlib
+
+from django.test import TestCase
+
+from sagepay.core import TransactionNotificationPostResponse
+from sagepay.facade import Facade
+from sagepay.models import TransactionRegistrationServerResponse, NotificationPostResponse
+from sagepay.signature import SignatureVerifier, audit_notifications
+
+
+# (vendor, security key, notification, signing payload, VPSSignature). The manual publishes no signed example: each
+# payload is written out by hand in the field order of the SagePay Server protocol 3.00 manual (VPSTxId, VendorTxCode,
+# Status, TxAuthNo, vendor name in lowercase, AVSCV2, SecurityKey, AddressResult, PostCodeResult, CV2Result, GiftAid,
+# 3DSecureStatus, CAVV, AddressStatus, PayerStatus, CardType, Last4Digits, DeclineCode, ExpiryDate, FraudResponse,
+# BankAuthCode), the missing fields left empty, and each signature is the uppercase output of md5sum over it
+SIGNATURE_VECTORS = (
+    ('TestVendor', 'U5NX3V0WG9', {
+        'VPSProtocol': '3.00', 'TxType': 'PAYMENT', 'VPSTxId': '{1A960910-5F36-3421-24DE-65EF52C13380}',
+        'VendorTxCode': 'c4ca4238a0b923820dcc509a6f75849b', 'Status': 'OK',
+        'StatusDetail': '0000 : The Authorisation was Successful.', 'TxAuthNo': '7349', 'AVSCV2': 'ALL MATCH',
+        'AddressResult': 'MATCHED', 'PostCodeResult': 'MATCHED', 'CV2Result': 'MATCHED', 'GiftAid': '0',
+        '3DSecureStatus': 'OK', 'CAVV': 'AAABARR5kUAAAAAAAAAAAAAAAAA=', 'CardType': 'VISA', 'Last4Digits': '0006',
+        'DeclineCode': '00', 'ExpiryDate': '1220', 'BankAuthCode': '999777',
+     },
+     ''.join(('{1A960910-5F36-3421-24DE-65EF52C13380}', 'c4ca4238a0b923820dcc509a6f75849b', 'OK', '7349',
+              'testvendor', 'ALL MATCH', 'U5NX3V0WG9', 'MATCHED', 'MATCHED', 'MATCHED', '0', 'OK',
+              'AAABARR5kUAAAAAAAAAAAAAAAAA=', '', '', 'VISA', '0006', '00', '1220', '', '999777')),
+     '08664C1FF2C3F3CB089109C6DA9EC451'),
+    ('testvendor', 'A1B2C3D4E5', {
+        'VPSProtocol': '3.00', 'TxType': 'PAYMENT', 'VPSTxId': '{2B871021-6A47-4532-35EF-76F063D24491}',
+        'VendorTxCode': 'c81e728d9d4c2f636f067f89cc14862c', 'Status': 'NOTAUTHED',
+        'StatusDetail': '2000 : The Authorisation was Declined by the bank.', 'AVSCV2': 'SECURITY CODE MATCH ONLY',
+        'AddressResult': 'NOTMATCHED', 'PostCodeResult': 'NOTMATCHED', 'CV2Result': 'MATCHED', 'GiftAid': '0',
+        '3DSecureStatus': 'NOTCHECKED', 'CardType': 'MC', 'Last4Digits': '0004', 'DeclineCode': '05',
+        'ExpiryDate': '0121',
+     },
+     ''.join(('{2B871021-6A47-4532-35EF-76F063D24491}', 'c81e728d9d4c2f636f067f89cc14862c', 'NOTAUTHED', '',
+              'testvendor', 'SECURITY CODE MATCH ONLY', 'A1B2C3D4E5', 'NOTMATCHED', 'NOTMATCHED', 'MATCHED', '0',
+              'NOTCHECKED', '', '', '', 'MC', '0004', '05', '0121', '', '')),
+     '9D8B700223FD44C95FC02B4358A81A4C'),
+    ('testvendor', 'F6G7H8J9K0', {
+        'VPSProtocol': '3.00', 'TxType': 'PAYMENT', 'VPSTxId': '{3C982132-7B58-5643-46F0-87A174E35502}',
+        'VendorTxCode': 'eccbc87e4b5ce2fe28308d2f4bb1a4d7', 'Status': 'ABORT',
+        'StatusDetail': '2013 : The Transaction was cancelled by the customer.',
+     },
+     ''.join(('{3C982132-7B58-5643-46F0-87A174E35502}', 'eccbc87e4b5ce2fe28308d2f4bb1a4d7', 'ABORT', '',
+              'testvendor', '', 'F6G7H8J9K0', '', '', '', '', '', '', '', '', '', '', '', '', '', '')),
+     'A4DF2A42063AC6C94B314618B58258CB'),
+    ('testvendor', 'Z9Y8X7W6V5', {
+        'VPSProtocol': '3.00', 'TxType': 'PAYMENT', 'VPSTxId': '{4DA93243-8C69-6754-5701-98B285F46613}',
+        'VendorTxCode': 'a87ff679a2f3e71d9181a67b7542122c', 'Status': 'OK',
+        'StatusDetail': '0000 : The Authorisation was Successful.', 'TxAuthNo': '8811', 'AVSCV2': 'ALL MATCH',
+        'AddressResult': 'MATCHED', 'PostCodeResult': 'MATCHED', 'CV2Result': 'MATCHED', 'GiftAid': '1',
+        '3DSecureStatus': 'ATTEMPTONLY', 'CAVV': 'AAABBBCCC0000000000000000000=', 'AddressStatus': 'CONFIRMED',
+        'PayerStatus': 'VERIFIED', 'CardType': 'PAYPAL', 'Last4Digits': '1234', 'DeclineCode': '00',
+        'ExpiryDate': '0127', 'FraudResponse': 'ACCEPT', 'BankAuthCode': '123456',
+     },
+     ''.join(('{4DA93243-8C69-6754-5701-98B285F46613}', 'a87ff679a2f3e71d9181a67b7542122c', 'OK', '8811',
+              'testvendor', 'ALL MATCH', 'Z9Y8X7W6V5', 'MATCHED', 'MATCHED', 'MATCHED', '1', 'ATTEMPTONLY',
+              'AAABBBCCC0000000000000000000=', 'CONFIRMED', 'VERIFIED', 'PAYPAL', '1234', '00', '0127', 'ACCEPT',
+              '123456')),
+     '381B7814E7B9F17F928381ACAD690709'),
+)
+
+
+class SignatureVerifierTest(TestCase):
+
+    def test_vectors_signed_independently(self):
+        for vendor, key, fields, payload, signature in SIGNATURE_VECTORS:
+            self.assertEqual(signature, hashlib.md5(payload).hexdigest().upper())
+
+    def test_signing_payload(self):
+        for vendor, key, fields, payload, signature in SIGNATURE_VECTORS:
+            verifier = SignatureVerifier(vendor, key)
+            self.assertEqual(payload, verifier.signing_payload(TransactionNotificationPostResponse(fields)))
+
+    def test_vectors(self):
+        for vendor, key, fields, payload, signature in SIGNATURE_VECTORS:
+            fields = dict(fields, VPSSignature=signature)
+            self.assertTrue(SignatureVerifier(vendor, key).verify(TransactionNotificationPostResponse(fields)))
+
+    def test_tampered_notification(self):
+        vendor, key, fields, payload, signature = SIGNATURE_VECTORS[1]
+        fields = dict(fields, Status='OK', VPSSignature=signature)
+        self.assertFalse(SignatureVerifier(vendor, key).verify(TransactionNotificationPostResponse(fields)))
+
+    def test_missing_or_malformed_signature(self):
+        vendor, key, fields, payload, signature = SIGNATURE_VECTORS[2]
+        verifier = SignatureVerifier(vendor, key)
+        self.assertFalse(verifier.verify(TransactionNotificationPostResponse(fields)))
+        fields = dict(fields, VPSSignature=u'\xe9' * 32)
+        self.assertFalse(verifier.verify(TransactionNotificationPostResponse(fields)))
+
+    def test_audit_notifications(self):
+        vendor, key, fields, payload, signature = SIGNATURE_VECTORS[0]
+        TransactionRegistrationServerResponse.objects.create(vps_protocol='3.00', vendor=vendor, security_key=key,
+                                                             vps_tx_id=fields['VPSTxId'], status='OK')
+        valid = NotificationPostResponse.objects.create(
+            vps_protocol='3.00', tx_type='PAYMENT', vendor_tx_code=fields['VendorTxCode'],
+            vps_tx_id=fields['VPSTxId'], status='OK', status_detail=fields['StatusDetail'], tx_auth_no='7349',
+            avscv2='ALL MATCH', address_result='MATCHED', postcode_result='MATCHED', cv2_result='MATCHED',
+            gift_aid=False, threed_secure_status='OK', cavv=fields['CAVV'], card_type='VISA', last_4_digits='0006',
+            decline_code='00', expiry_date='1220', bank_auth_ode='999777', vps_signature=signature)
+        tampered = NotificationPostResponse.objects.get(pk=valid.pk)
+        tampered.pk = None
+        tampered.tx_auth_no = '0000'
+        tampered.save()
+        unknown = NotificationPostResponse.objects.get(pk=valid.pk)
+        unknown.pk = None
+        unknown.vps_tx_id = '{00000000-0000-0000-0000-000000000000}'
+        unknown.save()
+        # the notifications, then the registrations of each chunk
+        with self.assertNumQueries(3):
+            results = dict((n.pk, result) for n, result in
+                           audit_notifications(NotificationPostResponse.objects.order_by('pk'), chunk_size=2))
+        self.assertEqual({valid.pk: True, tampered.pk: False, unknown.pk: None}, results)
+
+    def test_audit_paypal_and_fraud_screened_notifications(self):
+        vendor, key, fields, payload, signature = SIGNATURE_VECTORS[3]
+        TransactionRegistrationServerResponse.objects.create(vps_protocol='3.00', vendor=vendor, security_key=key,
+                                                             vps_tx_id=fields['VPSTxId'], status='OK')
+        # saved as the notification view does
+        notification = Facade()._save_transaction_notification_post_response(
+            TransactionNotificationPostResponse(dict(fields, VPSSignature=signature)), None, False, None)
+        notification = NotificationPostResponse.objects.get(pk=notification.pk)
+        self.assertEqual(('CONFIRMED', 'VERIFIED', 'ACCEPT'),
+                         (notification.address_status, notification.payer_status, notification.fraud_response))
+        self.assertEqual([(notification, True)], list(audit_notifications([notification])))
@@ -0,0 +1,138 @@
+import datetime
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.utils.timezone import now
+import mock
+
+from sagepay import tasks
+from sagepay.models import SagePayTransaction, NotificationTask, Token, TransactionRollup
+from sagepay.signals import notification_processed
+
+from facade_tests import FacadeTransactionTestCase
+
+TOKEN = '{CDA1F5D2-1F3A-4C68-8D5B-3E1B7F4E1A3B}'
+
+
+@mock.patch('sagepay.facade.NOTIFICATION_QUEUE', True)
+class NotificationQueueTest(FacadeTransactionTestCase):
+
+    def test_token_queued(self):
+        # select the transaction, insert the notification, update the transaction, insert the task
+        with self.assertNumQueries(4):
+            reply = self.facade.check_transaction_notification(self.notification(Token=TOKEN))
+        self.assertTrue(reply.startswith('Status=OK'))
+        self.assertEqual(0, Token.objects.count())
+        task = NotificationTask.objects.get()
+        self.assertEqual((self.transaction.pk, TOKEN), (task.sage_transaction_id, task.token))
+
+        self.assertEqual((1, 0), tasks.process_batch(self.facade))
+        token = SagePayTransaction.objects.get(pk=self.transaction.pk).token
+        self.assertEqual((TOKEN, self.user.pk, '0006'), (token.token, token.user_id, token.last_4_digits))
+        self.assertEqual(0, NotificationTask.objects.count())
+
+    def test_nothing_to_do(self):
+        with self.assertNumQueries(3):
+            self.facade.check_transaction_notification(self.notification())
+        self.facade.check_transaction_notification(self.notification(signed=False, Token=TOKEN))
+        self.assertEqual(0, NotificationTask.objects.count())
+
+    @mock.patch('sagepay.facade.ROLLUP_ON_NOTIFICATION', True)
+    def test_rollup_and_receivers(self):
+        received = []
+
+        def receiver(sender, sage_transaction, notification, **kwargs):
+            received.append((sage_transaction.pk, notification.status))
+
+        notification_processed.connect(receiver)
+        self.addCleanup(notification_processed.disconnect, receiver)
+        self.facade.check_transaction_notification(self.notification())
+        self.assertEqual((0, []), (TransactionRollup.objects.count(), received))
+        tasks.process_batch(self.facade)
+        self.assertEqual(1, TransactionRollup.objects.get().count)
+        self.assertEqual([(self.transaction.pk, 'OK')], received)
+
+    def test_claim(self):
+        self.facade.check_transaction_notification(self.notification(Token=TOKEN))
+        with self.assertNumQueries(3):
+            claimed = tasks.claim(10, lease=60)
+        self.assertEqual(1, len(claimed))
+        # held by the first worker until its lease runs out
+        self.assertEqual([], tasks.claim(10))
+        NotificationTask.objects.update(run_after=now() - datetime.timedelta(seconds=1))
+        self.assertEqual(1, len(tasks.claim(10)))
+
+    def test_failure(self):
+        self.facade.check_transaction_notification(self.notification(Token=TOKEN))
+        with mock.patch.object(self.facade, '_save_credit_card_token', side_effect=ValueError('boom')):
+            with mock.patch('sagepay.tasks.logger') as logger:
+                self.assertEqual((0, 1), tasks.process_batch(self.facade))
+        self.assertTrue(logger.exception.called)
+        task = NotificationTask.objects.get()
+        self.assertEqual(1, task.attempts)
+        self.assertTrue('boom' in task.last_error)
+        self.assertTrue(task.run_after > now() + datetime.timedelta(seconds=20))
+        self.assertEqual((0, 0), tasks.process_batch(self.facade))
+        self.assertEqual(None, SagePayTransaction.objects.get(pk=self.transaction.pk).token_id)
+
+    def test_done_again(self):
+        self.facade.check_transaction_notification(self.notification(Token=TOKEN))
+        task = tasks.claim(1)[0]
+        self.facade.process_notification(task.sage_transaction, task.notification, task.token)
+        NotificationTask.objects.update(run_after=now())
+        tasks.process_batch(self.facade)
+        self.assertEqual(1, Token.objects.count())
+
+    def test_lease_ran_out(self):
+        self.facade.check_transaction_notification(self.notification(Token=TOKEN))
+        slow = tasks.claim(1)[0]
+        NotificationTask.objects.update(run_after=now())
+        again = tasks.claim(1)[0]
+        # the first worker gets to the task after another one claimed it again
+        self.assertFalse(tasks._process(self.facade, slow))
+        self.assertEqual(0, Token.objects.count())
+        self.assertTrue(tasks._process(self.facade, again))
+        self.assertEqual(1, Token.objects.count())
+        self.assertEqual(0, NotificationTask.objects.count())
+        # nor does a worker holding the task after it was done
+        self.assertFalse(tasks._process(self.facade, slow))
+
+    def test_one_database_transaction(self):
+        self.facade.check_transaction_notification(self.notification(Token=TOKEN))
+        task = tasks.claim(1)[0]
+        # a commit before the task is deleted would release its lock to the other workers
+        task_left = []
+
+        def commit(using=None):
+            task_left.append(NotificationTask.objects.filter(pk=task.pk).exists())
+
+        with mock.patch('django.db.transaction.commit', side_effect=commit):
+            self.assertTrue(tasks._process(self.facade, task))
+        self.assertEqual([False], task_left)
+        self.assertEqual(1, Token.objects.count())
+
+    def test_token_read_again(self):
+        self.facade.check_transaction_notification(self.notification(Token=TOKEN))
+        task = tasks.claim(1)[0]
+        self.facade.process_notification(SagePayTransaction.objects.get(pk=self.transaction.pk), task.notification,
+                                         task.token)
+        self.assertEqual(None, task.sage_transaction.token_id)
+        self.facade.process_notification(task.sage_transaction, task.notification, task.token)
+        self.assertEqual(1, Token.objects.count())
+
+    def test_paid_with_a_saved_card(self):
+        saved = Token.objects.create(token=TOKEN, user=self.user, last_4_digits='0006', card_type='VISA',
+                                     expiry_date='1220')
+        SagePayTransaction.objects.filter(pk=self.transaction.pk).update(token=saved)
+        self.facade.check_transaction_notification(self.notification(Token=TOKEN))
+        tasks.process_batch(self.facade)
+        self.assertEqual(saved.pk, SagePayTransaction.objects.get(pk=self.transaction.pk).token_id)
+        self.assertEqual(1, Token.objects.count())
+
+    def test_command(self):
+        self.facade.check_transaction_notification(self.notification(Token=TOKEN))
+        out = StringIO()
+        with mock.patch('sagepay.management.commands.process_notifications.get_facade', return_value=self.facade):
+            call_command('process_notifications', once=True, batch_size=10, stdout=out)
+        self.assertTrue('Done: 1 tasks done, 0 failed' in out.getvalue())
+        self.assertEqual(1, Token.objects.count())
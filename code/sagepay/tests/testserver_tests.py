@@ -0,0 +1,121 @@
+from decimal import Decimal
+import time
+
+from django.contrib.auth.models import User
+from django.db.models import get_model
+from django.test import TestCase
+import mock
+
+from sagepay import gateway as gateway_module
+from sagepay.core import TransactionNotificationPostResponse
+from sagepay.exceptions import GatewayException
+from sagepay.facade import Facade
+from sagepay.gateway import Gateway
+from sagepay.models import CountryCode, SagePayTransaction, Token
+from sagepay.signature import SignatureVerifier
+from sagepay.testserver import SagePayServer, Profile, DROP
+
+Basket = get_model('basket', 'Basket')
+Line = get_model('basket', 'Line')
+Product = get_model('catalogue', 'Product')
+ProductClass = get_model('catalogue', 'ProductClass')
+
+
+class SagePayServerTest(TestCase):
+
+    def setUp(self):
+        gateway_module._breakers.clear()
+        self.server = SagePayServer(poster=self.post).start()
+        self.addCleanup(self.server.stop)
+        self.user = User.objects.create_user('customer', 'customer@example.com', 'password')
+        self.product_class = ProductClass.objects.create(name='Books')
+        self.address = mock.Mock(first_name='John', last_name='Smith', line1='88 The Road', line2='', line4='London',
+                                 postcode='W1A 1AA', country=CountryCode.objects.create(name='United Kingdom', code='GB'))
+        with mock.patch('sagepay.facade.SAGE_SERVER_URL', self.server.register_url):
+            self.facade = Facade(mock.Mock(domain='shop.example.org'))
+
+    def post(self, url, data):
+        return self.facade.check_transaction_notification(data)
+
+    def authorize(self, order_number=1, save_card=False):
+        basket = Basket.objects.create(owner=self.user)
+        product = Product.objects.create(title='Book', product_class=self.product_class)
+        Line.objects.create(basket=basket, line_reference='book', product=product, quantity=1,
+                            price_excl_tax=Decimal('8.00'), price_incl_tax=Decimal('9.60'))
+        return self.facade.authorize(order_number, basket, Decimal('10.00'), self.address, save_card=save_card)
+
+    def test_registration(self):
+        tx_id = self.authorize()
+        registration = self.server.registrations[tx_id]
+        self.assertEqual('http://shop.example.org/sagepay/notification/', registration['NotificationURL'])
+        self.assertEqual('10.00', registration['Amount'])
+        transaction = SagePayTransaction.objects.select_related('transaction_registration_server_response').get(
+            vps_tx_id=tx_id)
+        self.assertEqual(registration['SecurityKey'], transaction.transaction_registration_server_response.security_key)
+
+    def test_signed_notification(self):
+        tx_id = self.authorize()
+        reply = self.server.notify(tx_id)
+        self.assertEqual('OK', reply['Status'])
+        self.assertEqual('http://shop.example.org/sagepay/thankyou/%s' % tx_id, reply['RedirectURL'])
+        notification = SagePayTransaction.objects.get(vps_tx_id=tx_id).notification_post_response
+        self.assertTrue(notification.hash_match)
+        registration = self.server.registrations[tx_id]
+        verifier = SignatureVerifier(registration['Vendor'], registration['SecurityKey'])
+        self.assertTrue(verifier.verify(TransactionNotificationPostResponse(self.server.notification(tx_id))))
+
+    def test_all_signed_fields(self):
+        tx_id = self.authorize()
+        data = self.server.notification(tx_id, AddressStatus='CONFIRMED', PayerStatus='VERIFIED',
+                                        FraudResponse='ACCEPT')
+        registration = self.server.registrations[tx_id]
+        verifier = SignatureVerifier(registration['Vendor'], registration['SecurityKey'])
+        self.assertTrue(verifier.verify(TransactionNotificationPostResponse(data)))
+        data['FraudResponse'] = 'DENY'
+        self.assertFalse(verifier.verify(TransactionNotificationPostResponse(data)))
+
+    def test_tampered_notification(self):
+        tx_id = self.authorize()
+        data = self.server.notification(tx_id, 'NOTAUTHED')
+        data['Status'] = 'OK'
+        self.assertTrue(self.post(None, data).startswith('Status=INVALID'))
+
+    def test_token(self):
+        tx_id = self.authorize(save_card=True)
+        self.server.notify(tx_id)
+        token = Token.objects.get()
+        self.assertEqual(set([token.token.strip('{}')]), self.server.tokens)
+        with mock.patch('sagepay.gateway.DELETE_TOKEN_URL', self.server.remove_token_url):
+            self.assertTrue(self.facade.gateway.delete_token(token))
+            self.assertFalse(self.facade.gateway.delete_token(token))
+        self.assertEqual(set(), self.server.tokens)
+
+    def test_duplicate_vendor_tx_code(self):
+        tx_id = self.authorize()
+        data = dict(self.server.registrations[tx_id])
+        response = Gateway('LOW', data['NotificationURL'], self.server.register_url).post(self.server.register_url,
+                                                                                           data)
+        self.assertEqual('INVALID', response['Status'])
+
+    def test_status_mix(self):
+        self.server.profile = Profile(statuses={'OK': 3, 'NOTAUTHED': 1}, seed=1)
+        tx_id = self.authorize()
+        statuses = [self.server.notification(tx_id)['Status'] for _ in range(400)]
+        self.assertTrue(250 < statuses.count('OK') < 350)
+        self.assertEqual(set(['OK', 'NOTAUTHED']), set(statuses))
+
+    def test_latency(self):
+        self.server.profile = Profile(latency=0.05)
+        start = time.time()
+        self.authorize()
+        self.assertTrue(time.time() - start >= 0.05)
+
+    def test_errors(self):
+        gateway = Gateway('LOW', 'http://shop.example.org/', self.server.register_url)
+        self.server.profile = Profile(error_rate=1, errors=(503,))
+        self.assertRaises(GatewayException, gateway.post, self.server.register_url, {})
+        self.server.profile = Profile(error_rate=1, errors=(DROP,))
+        self.assertRaises(GatewayException, gateway.post, self.server.register_url, {})
+        self.server.profile = Profile(error_rate=1, errors=('ERROR',))
+        self.assertEqual('ERROR', gateway.post(self.server.register_url, {})['Status'])
+        self.assertEqual(3, self.server.counts['errors'])
@@ -0,0 +1,93 @@
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.db.models import get_model
+from django.test import TestCase
+
+from sagepay.iso3166 import COUNTRIES
+from sagepay.models import CountryCode
+from sagepay.utils import BasketBuilder, CountryHelper
+
+Basket = get_model('basket', 'Basket')
+Line = get_model('basket', 'Line')
+Product = get_model('catalogue', 'Product')
+ProductClass = get_model('catalogue', 'ProductClass')
+Country = get_model('address', 'Country')
+
+
+class BasketBuilderTest(TestCase):
+
+    def setUp(self):
+        self.basket = Basket.objects.create()
+        self.product_class = ProductClass.objects.create(name='Products')
+        self.lines = 0
+
+    def add_line(self, title, quantity=1, price_excl_tax=Decimal('10.00'), price_incl_tax=Decimal('12.00')):
+        # a basket has one line per line_reference
+        self.lines += 1
+        Line.objects.create(basket=self.basket, line_reference='line-%d' % self.lines, quantity=quantity,
+                            product=Product.objects.create(title=title, product_class=self.product_class),
+                            price_excl_tax=price_excl_tax, price_incl_tax=price_incl_tax)
+
+    def test_single_query(self):
+        for i in range(50):
+            self.add_line('Product %d' % i)
+        with self.assertNumQueries(1):
+            description, basket = BasketBuilder().build(self.basket, Decimal('600.00'))
+        self.assertTrue(description.startswith('Product 0, Product 1, '))
+        self.assertTrue(basket.startswith('50:Product 0:1:10.00:2.00:12.00:12.00:Product 1:'))
+
+    def test_description_budget(self):
+        self.add_line(u'Caf\xe9 ' * 30)
+        self.add_line('Second product')
+        description, basket = BasketBuilder(send_basket=False).build(self.basket, Decimal('24.00'))
+        self.assertEqual(None, basket)
+        self.assertTrue(len(description.encode('utf-8')) <= 100)
+        self.assertFalse('Second' in description)
+
+    def test_delivery_line(self):
+        self.add_line('Mug: large', quantity=2)
+        description, basket = BasketBuilder().build(self.basket, Decimal('29.50'))
+        self.assertEqual('Mug: large', description)
+        self.assertEqual('2:Mug  large:2:10.00:2.00:12.00:24.00:Delivery:1:5.50:0.00:5.50:5.50', basket)
+
+    def test_no_basket_when_lines_exceed_amount(self):
+        self.add_line('Discounted', quantity=2)
+        self.assertEqual(None, BasketBuilder().build(self.basket, Decimal('20.00'))[1])
+
+    def test_no_basket_without_prices(self):
+        self.add_line('Unpriced', price_excl_tax=None, price_incl_tax=None)
+        self.assertEqual(None, BasketBuilder().build(self.basket, Decimal('20.00'))[1])
+
+
+class CountryHelperTest(TestCase):
+
+    def test_import(self):
+        call_command('countrysync', **{'import': True})
+        self.assertEqual(len(COUNTRIES), CountryCode.objects.count())
+        self.assertEqual(len(COUNTRIES), Country.objects.count())
+        country = Country.objects.get(pk='GB')
+        self.assertEqual(('GBR', 826, 'UNITED KINGDOM', 'United Kingdom', True),
+                         (country.iso_3166_1_a3, country.iso_3166_1_numeric, country.name, country.printable_name,
+                          country.is_shipping_country))
+
+    def test_import_again(self):
+        helper = CountryHelper()
+        helper.lazy_import()
+        CountryCode.objects.filter(code='GB').update(name='United kingdom')
+        Country.objects.filter(pk='FR').update(is_shipping_country=True)
+        # read the codes, rename GB, read the codes and oscar countries, rename GB, set the shipping countries
+        with self.assertNumQueries(5):
+            helper.lazy_import()
+        self.assertEqual(len(COUNTRIES), CountryCode.objects.count())
+        self.assertEqual(len(COUNTRIES), Country.objects.count())
+        self.assertEqual('United Kingdom', CountryCode.objects.get(code='GB').name)
+        self.assertTrue(Country.objects.get(pk='FR').is_shipping_country)
+
+    def test_fixture_codes(self):
+        # codes loaded from fixtures, possibly not ISO ones
+        CountryCode.objects.create(code='GB', name='United Kingdom')
+        CountryCode.objects.create(code='XK', name='Kosovo')
+        CountryHelper().sync_country_models()
+        self.assertEqual([('GB', 'GBR', 826), ('XK', None, None)],
+                         list(Country.objects.order_by('pk').values_list('pk', 'iso_3166_1_a3', 'iso_3166_1_numeric')))
@@ -0,0 +1,387 @@
+"""
+In-process stand-in for the SagePay Server protocol, to test and load test the checkout without network access
+
+:class:`SagePayServer` answers vspserver-register and removetoken requests on a local port and sends back signed
+notifications like SagePay does once the customer has paid. A :class:`Profile` sets how it behaves: latency, error
+injection and the mix of notified statuses.
+
+    with SagePayServer(Profile(latency=(0.05, 0.2), error_rate=0.01, statuses={'OK': 95, 'NOTAUTHED': 5})) as server:
+        gateway = Gateway('LOW', notification_url, server.register_url)
+        response, ok = gateway.register_payment(transaction, False)
+        reply = server.notify(response['VPSTxId'])
+"""
+import time
+import uuid
+import random
+import hashlib
+import string
+import socket
+import threading
+import urlparse
+import BaseHTTPServer
+import SocketServer
+
+import requests
+
+from .core import parse_response
+
+REGISTER_PATH = '/gateway/service/vspserver-register.vsp'
+REMOVE_TOKEN_PATH = '/gateway/service/removetoken.vsp'
+CARD_SELECTION_PATH = '/gateway/service/cardselection'
+
+# fields a registration must have, missing ones get a MALFORMED answer
+REQUIRED_FIELDS = (
+    'VPSProtocol', 'TxType', 'Vendor', 'VendorTxCode', 'Amount', 'Currency', 'Description', 'NotificationURL',
+    'BillingSurname', 'BillingFirstnames', 'BillingAddress1', 'BillingCity', 'BillingPostCode', 'BillingCountry',
+    'DeliverySurname', 'DeliveryFirstnames', 'DeliveryAddress1', 'DeliveryCity', 'DeliveryPostCode',
+    'DeliveryCountry',
+)
+STATUS_DETAILS = {
+    'OK': '0000 : The Authorisation was Successful.',
+    'NOTAUTHED': '2000 : The Authorisation was Declined by the bank.',
+    'ABORT': '2013 : The Transaction was cancelled by the customer.',
+    'REJECTED': '2001 : The Transaction was rejected by the vendor rule-base.',
+    'ERROR': '5003 : Internal server error.',
+    'INVALID': '3000 : The request was invalid.',
+    'MALFORMED': '3000 : The request was malformed.',
+}
+DROP = 'drop'
+# notification fields signed by VPSSignature in protocol 3.00, in order. Kept apart from sagepay.signature so that the
+# notifications check the plugin's verification instead of agreeing with it
+SIGNED_FIELDS = (
+    'VPSTxId', 'VendorTxCode', 'Status', 'TxAuthNo', 'VendorName', 'AVSCV2', 'SecurityKey', 'AddressResult',
+    'PostCodeResult', 'CV2Result', 'GiftAid', '3DSecureStatus', 'CAVV', 'AddressStatus', 'PayerStatus', 'CardType',
+    'Last4Digits', 'DeclineCode', 'ExpiryDate', 'FraudResponse', 'BankAuthCode',
+)
+
+
+def sign(data, vendor, security_key):
+    """
+    Return the VPSSignature of a notification: the uppercase MD5 of its signed fields, the vendor name in lower case
+    and the security key in their place
+
+    :param data: notification fields
+    :type data: dict
+    :returns: str
+    """
+    values = dict(data, VendorName=vendor.lower(), SecurityKey=security_key)
+    return hashlib.md5(''.join(values.get(field) or '' for field in SIGNED_FIELDS)).hexdigest().upper()
+
+
+class Profile(object):
+    """
+    Behaviour of the stand-in server
+
+    :param latency: seconds waited before answering, a (min, max) tuple picks a random wait in the range
+    :type latency: float or tuple
+    :param error_rate: share (0-1) of the requests answered with one of `errors`
+    :type error_rate: float
+    :param errors: injected errors, picked at random: an HTTP status code (e.g. 500), a SagePay status answered with
+        HTTP 200 (e.g. 'ERROR') or :data:`DROP` to close the connection without answering
+    :type errors: tuple
+    :param statuses: weight of each status notified when :meth:`SagePayServer.notify` isn't given one
+    :type statuses: dict
+    :param seed: seed of the random choices, set it for reproducible runs
+    :type seed: int
+    """
+    def __init__(self, latency=0, error_rate=0, errors=(500,), statuses=None, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.errors = errors
+        self.statuses = statuses or {'OK': 1}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        """
+        :returns: float -- seconds to wait before the next answer
+        """
+        if isinstance(self.latency, tuple):
+            with self._lock:
+                return self._random.uniform(*self.latency)
+        return self.latency
+
+    def error(self):
+        """
+        :returns: the error injected in the next answer or None
+        """
+        with self._lock:
+            if self.error_rate and self._random.random() < self.error_rate:
+                return self._random.choice(self.errors)
+        return None
+
+    def status(self):
+        """
+        :returns: str -- status of the next notification, drawn from the status mix
+        """
+        statuses = sorted(self.statuses.items())
+        with self._lock:
+            point = self._random.uniform(0, sum(weight for status, weight in statuses))
+        for status, weight in statuses:
+            point -= weight
+            if point <= 0:
+                return status
+        return statuses[-1][0]
+
+    def random_string(self, chars, length):
+        with self._lock:
+            return ''.join(self._random.choice(chars) for _ in xrange(length))
+
+
+def http_post(url, data):
+    """
+    Default notification poster: POST the notification to the NotificationURL over HTTP
+
+    :returns: str -- reply body
+    """
+    return requests.post(url, data=data, timeout=30).text
+
+
+def client_post(client):
+    """
+    Notification poster going through a Django test client instead of the network
+
+    :param client: client of the site taking the payments
+    :type client: :class:`django.test.client.Client` instance
+    :returns: callable
+    """
+    def post(url, data):
+        return client.post(urlparse.urlsplit(url).path, data).content
+    return post
+
+
+class _ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, *args):
+        BaseHTTPServer.HTTPServer.__init__(self, *args)
+        self.connections = set()
+        self.connections_lock = threading.Lock()
+
+    def process_request_thread(self, request, client_address):
+        with self.connections_lock:
+            self.connections.add(request)
+        try:
+            SocketServer.ThreadingMixIn.process_request_thread(self, request, client_address)
+        finally:
+            with self.connections_lock:
+                self.connections.discard(request)
+
+    def close_connections(self):
+        # the kept alive connections would hold their thread until the client closes them
+        with self.connections_lock:
+            connections = list(self.connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # keep-alive, like SagePay, so the gateway connection pool is exercised
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        stand_in = self.server.stand_in
+        body = self.rfile.read(int(self.headers.getheader('content-length') or 0))
+        data = dict((key, values[-1]) for key, values in urlparse.parse_qs(body, keep_blank_values=True).items())
+        time.sleep(stand_in.profile.delay())
+        error = stand_in.profile.error()
+        stand_in._count('requests')
+        if error == DROP:
+            stand_in._count('errors')
+            self.close_connection = 1
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        if isinstance(error, int):
+            stand_in._count('errors')
+            return self._answer(error, 'Server error')
+        if error is not None:
+            stand_in._count('errors')
+            return self._answer(200, stand_in._status_response(error))
+        path = urlparse.urlsplit(self.path).path
+        if path == REGISTER_PATH:
+            return self._answer(200, stand_in.register(data))
+        if path == REMOVE_TOKEN_PATH:
+            return self._answer(200, stand_in.remove_token(data))
+        return self._answer(404, 'Not found')
+
+    def _answer(self, code, content):
+        self.send_response(code)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SagePayServer(object):
+    """
+    SagePay Server stand-in listening on a local port in a background thread
+
+    Registrations are kept in memory by VPSTxId with their security key, :meth:`notify` signs the notification with
+    it the way SagePay does, so the site checks it like a real one. Tokens created by the notifications can be
+    removed with removetoken. Use it as a context manager or call :meth:`start` and :meth:`stop`.
+
+    :param profile: latency, errors and status mix, no latency nor errors and OK notifications by default
+    :type profile: :class:`Profile` instance
+    :param poster: callable(url, data) sending a notification and returning the reply body, :func:`http_post` by
+        default
+    :type poster: callable
+    :param host: interface listened on
+    :type host: str
+    :param port: port listened on, a free one is picked by default
+    :type port: int
+    """
+    def __init__(self, profile=None, poster=http_post, host='127.0.0.1', port=0):
+        self.profile = profile or Profile()
+        self.poster = poster
+        self.registrations = {}
+        self.tokens = set()
+        self.counts = {'requests': 0, 'errors': 0, 'registrations': 0, 'notifications': 0, 'removed_tokens': 0}
+        self._lock = threading.Lock()
+        self._httpd = _ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.stand_in = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address
+        return 'http://%s:%d' % (host, port)
+
+    @property
+    def register_url(self):
+        return self.url + REGISTER_PATH
+
+    @property
+    def remove_token_url(self):
+        return self.url + REMOVE_TOKEN_PATH
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, kwargs={'poll_interval': 0.05})
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.close_connections()
+        self._httpd.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def _status_response(self, status, **fields):
+        lines = ['VPSProtocol=3.00', 'Status=%s' % status,
+                 'StatusDetail=%s' % fields.pop('StatusDetail', STATUS_DETAILS.get(status, ''))]
+        lines.extend('%s=%s' % item for item in sorted(fields.items()))
+        return '\r\n'.join(lines) + '\r\n'
+
+    def register(self, data):
+        """
+        Answer a vspserver-register request
+
+        :param data: POST content
+        :type data: dict
+        :returns: str -- response body
+        """
+        for field in REQUIRED_FIELDS:
+            if not data.get(field):
+                return self._status_response('MALFORMED', StatusDetail='3000 : The %s field is required.' % field)
+        scheme, netloc = urlparse.urlsplit(data['NotificationURL'])[:2]
+        if scheme not in ('http', 'https') or not netloc:
+            return self._status_response('INVALID', StatusDetail='3011 : The NotificationURL format is invalid.')
+        if data.get('Token') and data['Token'].strip('{}') not in self.tokens:
+            return self._status_response('INVALID', StatusDetail='4057 : The Token provided does not exist.')
+        tx_id = '{%s}' % str(uuid.uuid4()).upper()
+        security_key = self.profile.random_string(string.ascii_uppercase + string.digits, 10)
+        with self._lock:
+            if any(r['VendorTxCode'] == data['VendorTxCode'] for r in self.registrations.values()):
+                return self._status_response('INVALID', StatusDetail='4042 : The VendorTxCode has been used before.')
+            self.registrations[tx_id] = dict(data, VPSTxId=tx_id, SecurityKey=security_key)
+            self.counts['registrations'] += 1
+        return self._status_response('OK', StatusDetail='2014 : The Transaction was Registered Successfully.',
+                                     VPSTxId=tx_id, SecurityKey=security_key,
+                                     NextURL='%s%s?vpstxid=%s' % (self.url, CARD_SELECTION_PATH, tx_id))
+
+    def remove_token(self, data):
+        """
+        Answer a removetoken request
+
+        :returns: str -- response body
+        """
+        token = data.get('Token', '').strip('{}')
+        with self._lock:
+            if token not in self.tokens:
+                return self._status_response('INVALID', StatusDetail='4057 : The Token provided does not exist.')
+            self.tokens.discard(token)
+            self.counts['removed_tokens'] += 1
+        return self._status_response('OK', StatusDetail='2017 : Token removed successfully.')
+
+    def notification(self, tx_id, status=None, **fields):
+        """
+        Build the signed notification of a registered transaction
+
+        :param tx_id: VPSTxId returned by the registration
+        :type tx_id: str
+        :param status: notified status, drawn from the profile status mix if None
+        :type status: str
+        :param fields: notification fields to override, the signature is computed after them
+        :returns: dict -- POST content
+        :raises: KeyError if the transaction wasn't registered
+        """
+        registration = self.registrations[tx_id]
+        status = status or self.profile.status()
+        authorised = status == 'OK'
+        data = {
+            'VPSProtocol': registration['VPSProtocol'],
+            'TxType': registration['TxType'],
+            'VendorTxCode': registration['VendorTxCode'],
+            'VPSTxId': tx_id,
+            'Status': status,
+            'StatusDetail': STATUS_DETAILS.get(status, ''),
+            'TxAuthNo': authorised and self.profile.random_string(string.digits, 8) or '',
+            'AVSCV2': 'ALL MATCH',
+            'AddressResult': 'MATCHED',
+            'PostCodeResult': 'MATCHED',
+            'CV2Result': 'MATCHED',
+            'GiftAid': '0',
+            '3DSecureStatus': 'OK',
+            'CAVV': self.profile.random_string(string.ascii_uppercase + string.digits, 28),
+            'CardType': 'VISA',
+            'Last4Digits': '0006',
+            'DeclineCode': authorised and '00' or '05',
+            'ExpiryDate': '1220',
+            'BankAuthCode': authorised and '999777' or '',
+        }
+        if authorised and registration.get('CreateToken') == '1':
+            token = str(uuid.uuid4()).upper()
+            with self._lock:
+                self.tokens.add(token)
+            data['Token'] = '{%s}' % token
+        data.update(fields)
+        data['VPSSignature'] = sign(data, registration['Vendor'], registration['SecurityKey'])
+        return data
+
+    def notify(self, tx_id, status=None, **fields):
+        """
+        Send the notification of a registered transaction to its NotificationURL with the poster
+
+        :returns: dict -- the parsed reply of the site (Status, RedirectURL, StatusDetail)
+        """
+        data = self.notification(tx_id, status, **fields)
+        reply = self.poster(self.registrations[tx_id]['NotificationURL'], data)
+        self._count('notifications')
+        return parse_response(reply)
@@ -1,10 +1,15 @@
+from decimal import Decimal
+
+from django.db import transaction
 from django.db.models import get_model
 from django.conf import settings
-
-import requests
+from django.utils.importlib import import_module
 
 from .models import SagePayTransaction, CountryCode
 from .gateway import Gateway
+from .countries import country_resolver
+from .settings import BASKET_BUILDER, SEND_BASKET
+from .iso3166 import COUNTRIES as ISO_3166
 from .models import CountryCode
 
 Basket = get_model('basket', 'Basket')
@@ -18,46 +23,33 @@ class CountryHelper(object):
 
     def populate_sagepay_country_code(self):
         """
-        Import the country codes from
-        http://www.iso.org/iso/home/standards/country_codes/country_names_and_code_elements_txt.htm
+        Import the ISO 3166-1 country codes bundled in :mod:`sagepay.iso3166`, no network access needed. It can run
+        again, the codes already imported are only renamed if their name changed.
 
         :returns: boolean - state of import
         """
-        try:
-            r = requests.get('http://www.iso.org/iso/home/standards/country_codes/country_names_and_code_elements_txt.htm')
-        except requests.RequestException:
-            return False
-        countries = r.text.split('\r\n')
-        for country in countries[1:-2]:
-            country = country.split(';')
-            try:
-                c = CountryCode(name=country[0].capitalize(), code=country[1])
-                c.save()
-            except: #todo don't catch all the exceptions, this is just temporary
-                return False
+        upsert(CountryCode, 'code', dict((code, {'name': name}) for code, alpha3, numeric, name in ISO_3166))
+        # neither bulk_create nor update send the signals invalidating the resolver
+        country_resolver.invalidate()
         return True
 
     def sync_country_models(self):
         """
         Sync :class:`sagepay.models.CountryCode` and :class:`oscar.apps.address.models.Country`
-        this function has to run after :func:`populate_country_code` has been executed
+        this function has to run after :func:`populate_country_code` has been executed. It can run again, the shipping
+        flag of the countries already there is kept.
 
         :returns: boolean - state of import
         """
-        country_list = []
-        for country in CountryCode.objects.all():
-            c = Country(iso_3166_1_a2=country.code,
-                        iso_3166_1_a3=country.code,
-                        iso_3166_1_numeric=1,
-                        name=country.name.upper(),
-                        printable_name=country.name.title(),
-                        is_shipping_country=False)
-            country_list.append(c)
-        try:
-            Country.objects.bulk_create(country_list)
-            return True
-        except:
-            return False
+        iso_codes = dict((code, (alpha3, numeric)) for code, alpha3, numeric, name in ISO_3166)
+        rows = {}
+        for code, name in CountryCode.objects.values_list('code', 'name'):
+            alpha3, numeric = iso_codes.get(code, (None, None))
+            rows[code] = {'iso_3166_1_a3': alpha3, 'iso_3166_1_numeric': numeric, 'name': name.upper(),
+                          'printable_name': name}
+        upsert(Country, 'iso_3166_1_a2', rows)
+        country_resolver.invalidate()
+        return True
 
     def set_shipping_countries(self):
         """
@@ -71,7 +63,7 @@ class CountryHelper(object):
         """
         This method is a lazy helper to run the three steps:
 
-        1. fetch and populate :class:`sagepay.models.CountryCode`
+        1. populate :class:`sagepay.models.CountryCode` from the bundled ISO 3166-1 codes
         2. Sync the :class:`oscar.apps.address.models.Country`
         3. Set the shipping countries
 
@@ -86,6 +78,32 @@ class CountryHelper(object):
         self.set_shipping_countries()
 
 
+@transaction.commit_on_success
+def upsert(model, key, rows):
+    """
+    Insert the missing rows with one bulk insert and update the rows which differ, in a transaction. The table is read
+    with a single query so it suits small reference tables.
+
+    :param model: model of the table
+    :type model: :class:`django.db.models.Model` subclass
+    :param key: unique field the rows are matched on
+    :type key: str
+    :param rows: field values by key
+    :type rows: dict
+    :returns: tuple -- numbers of rows (created, updated)
+    """
+    fields = sorted(set(field for values in rows.values() for field in values))
+    existing = dict((row[0], row[1:]) for row in model.objects.values_list(key, *fields))
+    created = [model(**dict(values, **{key: value})) for value, values in rows.items() if value not in existing]
+    model.objects.bulk_create(created)
+    updated = 0
+    for value, values in rows.items():
+        if value in existing and existing[value] != tuple(values.get(field) for field in fields):
+            model.objects.filter(**{key: value}).update(**values)
+            updated += 1
+    return len(created), updated
+
+
 
 def utf8_truncate(s, max_length):
     """
@@ -104,6 +122,97 @@ def utf8_truncate(s, max_length):
     # will just be dropped
     return encoded[:max_length].decode('utf-8', 'ignore')
 
+
+class BasketBuilder(object):
+    """
+    Build the transaction Description and the SagePay Basket field from a single query on the basket lines
+
+    Subclass it and point SAGEPAY_BASKET_BUILDER to the subclass to change either of them.
+
+    :param send_basket: build the Basket field as well as the description
+    :type send_basket: bool
+    """
+    description_length = 100
+    basket_length = 7500
+
+    def __init__(self, send_basket=True):
+        self.send_basket = send_basket
+
+    def build(self, basket, amount):
+        """
+        :param basket: Oscar basket being paid
+        :type basket: :class:`oscar.apps.basket.models.Basket` instance
+        :param amount: total to be paid, shipping included
+        :type amount: decimal
+        :returns: tuple -- (description, Basket field or None)
+        """
+        if not self.send_basket:
+            titles = basket.lines.order_by('pk').values_list('product__title', flat=True)
+            return self.description(titles.iterator()), None
+        lines = list(basket.lines.order_by('pk').values_list(
+            'product__title', 'quantity', 'price_excl_tax', 'price_incl_tax'))
+        return self.description(line[0] for line in lines), self.basket(lines, amount)
+
+    def description(self, titles):
+        """
+        Join the product titles until the description is full
+
+        :param titles: product titles
+        :type titles: iterable of unicode
+        :returns: unicode
+        """
+        parts = []
+        length = -2
+        for title in titles:
+            parts.append(title)
+            length += len(title.encode('utf-8')) + 2
+            if length >= self.description_length:
+                break
+        return utf8_truncate(u', '.join(parts), self.description_length)
+
+    def basket(self, lines, amount):
+        """
+        Format the lines as the colon separated SagePay Basket, the difference with the amount is the delivery line
+
+        :param lines: (title, quantity, unit price excl. tax, unit price incl. tax) of each line
+        :type lines: list of tuples
+        :param amount: total to be paid
+        :type amount: decimal
+        :returns: str -- None if the lines cost more than the amount or the field is too long
+        """
+        rows = []
+        total = Decimal('0.00')
+        for title, quantity, price_excl_tax, price_incl_tax in lines:
+            if price_incl_tax is None:
+                return None
+            if price_excl_tax is None:
+                price_excl_tax = price_incl_tax
+            line_total = price_incl_tax * quantity
+            total += line_total
+            rows.append((title, quantity, price_excl_tax, price_incl_tax - price_excl_tax, price_incl_tax, line_total))
+        delivery = amount - total
+        if delivery < 0:
+            return None
+        if delivery > 0:
+            rows.append(('Delivery', 1, delivery, Decimal('0.00'), delivery, delivery))
+        fields = [unicode(len(rows))]
+        for title, quantity, net, tax, gross, line_total in rows:
+            fields.append(title.replace(':', ' '))
+            fields.append(unicode(quantity))
+            fields.extend('%.2f' % value for value in (net, tax, gross, line_total))
+        field = u':'.join(fields)
+        if len(field) > self.basket_length:
+            return None
+        return field
+
+
+def get_basket_builder():
+    """
+    :returns: instance of the class SAGEPAY_BASKET_BUILDER points to
+    """
+    module_name, class_name = BASKET_BUILDER.rsplit('.', 1)
+    return getattr(import_module(module_name), class_name)(send_basket=SEND_BASKET)
+
 # functions util for testing purpose
 def add_fake_transaction():
     """
@@ -5,6 +5,7 @@
 import logging
 
 from django.contrib import messages
+from django.contrib.sites.models import get_current_site
 from django.core.urlresolvers import reverse
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
@@ -23,7 +24,8 @@ from oscar.apps.payment import models
 Basket = get_model('basket', 'Basket')
 
 
-from .facade import Facade
+from .facade import get_facade
+from .metrics import get_metrics
 from .forms import BillingAddressForm, ShippingAddressForm
 import settings as localsettings
 
@@ -46,9 +48,9 @@ class PayDetailsView(OscarPaymentDetailsView):
     """
     https://django-oscar.readthedocs.org/en/latest/ref/apps/checkout.html?highlight=checkout#oscar.apps.checkout.views
     """
-    def __init__(self, *args, **kwargs):
-        self.facade = Facade()
-        return  super(PayDetailsView, self).__init__(*args, **kwargs)
+    def dispatch(self, request, *args, **kwargs):
+        self.facade = get_facade(get_current_site(request))
+        return super(PayDetailsView, self).dispatch(request, *args, **kwargs)
 
     def get_context_data(self, **kwargs):
         # Override method so the billing address form can be added to the context.
@@ -245,7 +247,7 @@ class SagePayNotificationHandlerView(CheckoutSessionMixin, View):
     It doesn't act as a view (i.e. it's not displayed to the user in the frontend) but it can be attached to a URL!
     """
     def post(self, request, *args, **kwargs):
-        facade = Facade()
+        facade = get_facade(get_current_site(request))
         response = facade.check_transaction_notification(request.POST.dict())
         return HttpResponse(response, content_type='text/plain')
 
@@ -266,38 +268,39 @@ class SageThankYouView(OrderPlacementMixin, View):
         self.request = request
         self.checkout_session = CheckoutSessionData(self.request)
         tx_id = kwargs['tx_id']
-        facade = Facade()
+        facade = get_facade(get_current_site(request))
         order_id, basket, amount = facade.order_basket_amount_from_tx_id(tx_id)
         super(SageThankYouView, self).dispatch(request, *args, **kwargs)
         return self.finalise(order_id, basket, amount)
 
     def finalise(self, order_id, basket_id, amount):
-        order_number = order_id
-        basket = basket_id
-        total_incl_tax = amount
-        total_excl_tax = total_incl_tax
-        order_kwargs = {}
-        # Record payment source and event
-        source_type, is_created = models.SourceType.objects.get_or_create(name='SagePay')
-        source = models.Source(source_type=source_type,
-                               currency='GBP',
-                               amount_allocated=total_incl_tax)
-        self.add_payment_source(source)
-        self.add_payment_event('Authorised', total_incl_tax)
-        # finalising the order into oscar
-        logger.info("Order #%s: payment successful, placing order", order_number)
-        try:
-            return self.handle_order_placement(order_number, basket,
-                                               total_incl_tax, total_excl_tax,
-                                               **order_kwargs)
-        except UnableToPlaceOrder, e:
-            # It's possible that something will go wrong while trying to
-            # actually place an order.  Not a good situation to be in, but needs
-            # to be handled gracefully.
-            logger.error("Order #%s: unable to place order - %s", order_number, e)
-            msg = unicode(e)
-            self.restore_frozen_basket()
-            return self.render_to_response(self.get_context_data(error=msg))
+        with get_metrics().stage('views.finalise'):
+            order_number = order_id
+            basket = basket_id
+            total_incl_tax = amount
+            total_excl_tax = total_incl_tax
+            order_kwargs = {}
+            # Record payment source and event
+            source_type, is_created = models.SourceType.objects.get_or_create(name='SagePay')
+            source = models.Source(source_type=source_type,
+                                   currency='GBP',
+                                   amount_allocated=total_incl_tax)
+            self.add_payment_source(source)
+            self.add_payment_event('Authorised', total_incl_tax)
+            # finalising the order into oscar
+            logger.info("Order #%s: payment successful, placing order", order_number)
+            try:
+                return self.handle_order_placement(order_number, basket,
+                                                   total_incl_tax, total_excl_tax,
+                                                   **order_kwargs)
+            except UnableToPlaceOrder, e:
+                # It's possible that something will go wrong while trying to
+                # actually place an order.  Not a good situation to be in, but needs
+                # to be handled gracefully.
+                logger.error("Order #%s: unable to place order - %s", order_number, e)
+                msg = unicode(e)
+                self.restore_frozen_basket()
+                return self.render_to_response(self.get_context_data(error=msg))
 
 class SageErrorView(CheckoutSessionMixin, View):
     """
@@ -335,5 +338,5 @@ class ThankYouView(OscarThankYouView):
         return obj
 
     def save_billing_address(self, order):
-        facade = Facade()
+        facade = get_facade(get_current_site(self.request))
         facade.save_billing_address_from_order(order)
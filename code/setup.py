@@ -41,6 +41,6 @@ setup(name='oscar-sagepay',
           'Programming Language :: Python',
           'Topic :: Other/Nonlisted Topic'],
       install_requires=[
-          'requests>=2.0',
+          'requests>=2.4',
           'django-oscar==0.5.1'],
       )